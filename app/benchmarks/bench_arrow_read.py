@@ -0,0 +1,131 @@
+"""
+Benchmark: pico de memória e tempo de leitura de um arquivo Parquet por caminho de leitura.
+
+Roda o raw sobre as PUFs sintéticas (`--scale`, reaproveitando `--data-dir`)
+em um armazenamento local temporário e lê o maior parquet sob `--prefix` por
+cada caminho, cada leitura em um interpretador novo:
+- bytes_pandas: `pd.read_parquet(BytesIO(store.get(...)))` (o caminho anterior)
+- arrow_table: `arrow_io.read_table` (buffer do objeto, sem pandas)
+- arrow_pandas: `arrow_io.read_pandas` (split_blocks + self_destruct)
+
+Por caminho (mediana de `--repeat`):
+- seconds: tempo da leitura
+- peak_extra_mb: pico de memória residente durante a leitura menos a memória
+  antes dela (o resultado continua vivo até a medida)
+- decoded_ratio: peak_extra_mb / tamanho da tabela decodificada em Arrow (o
+  mínimo inevitável; o objeto comprimido costuma ser bem menor que ela)
+
+No armazenamento local o `get_buffer` mapeia o arquivo (as páginas lidas contam
+na memória residente); no S3 ele lê o corpo para um buffer pré-alocado.
+
+Uso:
+    python app/benchmarks/bench_arrow_read.py --scale 10
+    python app/benchmarks/bench_arrow_read.py --scale 10 --prefix Plan_Attributes/ --save leitura.json
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import statistics
+import subprocess
+import tempfile
+from typing import Dict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "trusted"))
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import object_store
+from bench_pipeline import gerar_dados, rodar_escala
+
+# Configurações
+BUCKET = "raw-test-edb"
+MARKER = "BENCH_RESULT "
+CAMINHOS = {
+    "bytes_pandas": "pd.read_parquet(io.BytesIO(store.get(bucket, key)))",
+    "arrow_table": "arrow_io.read_table(bucket, key, store=store)",
+    "arrow_pandas": "arrow_io.read_pandas(bucket, key, store=store)",
+}
+
+# VmHWM zerado (clear_refs) logo antes da leitura; o resultado fica vivo até a medida
+CHILD = """
+import io, sys, json, time
+sys.path.insert(0, {trusted!r})
+import pandas as pd
+import object_store, arrow_io
+
+def status(campo):
+    with open("/proc/self/status") as f:
+        return next(int(linha.split()[1]) for linha in f if linha.startswith(campo + ":")) / 1024
+
+store, bucket, key = object_store.LocalStore({raiz!r}), {bucket!r}, {key!r}
+antes = status("VmRSS")
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+inicio = time.perf_counter()
+resultado = {expressao}
+segundos = time.perf_counter() - inicio
+print({marker!r} + json.dumps({{"seconds": segundos, "peak_extra_mb": status("VmHWM") - antes}}))
+"""
+
+
+def medir(raiz: str, key: str, expressao: str) -> Dict:
+    code = CHILD.format(trusted=os.path.join(APP_DIR, "trusted"), raiz=raiz, bucket=BUCKET, key=key,
+                        expressao=expressao, marker=MARKER)
+    processo = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    for linha in reversed(processo.stdout.splitlines()):
+        if linha.startswith(MARKER):
+            return json.loads(linha[len(MARKER):])
+    raise RuntimeError((processo.stderr.strip().splitlines() or ["sem saída"])[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--prefix", default="Rate/", help="prefixo no bucket raw do arquivo lido")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "puf_synthetic"),
+                        help="cache das PUFs geradas, por escala e seed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="grava o relatório em JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    raiz = tempfile.mkdtemp(prefix="bench_arrow_read_")
+    try:
+        dados = gerar_dados(args.data_dir, args.scale, args.seed)
+        env = {**os.environ, "OBJECT_STORE": "local", "OBJECT_STORE_ROOT": raiz}
+        store = object_store.LocalStore(raiz)
+        if rodar_escala(dados, ["raw"], env, store)["raw"]["status"] != "ok":
+            raise RuntimeError("O raw falhou")
+        arquivo = max((info for info in store.list(BUCKET, args.prefix) if info.key.endswith(".parquet")),
+                      key=lambda info: info.size)
+        payload_mb = arquivo.size / 2**20
+        decodificado_mb = pq.read_table(pa.BufferReader(store.get_buffer(BUCKET, arquivo.key))).nbytes / 2**20
+
+        caminhos = {}
+        for nome, expressao in CAMINHOS.items():
+            medidas = [medir(raiz, arquivo.key, expressao) for _ in range(args.repeat)]
+            pico = statistics.median(medida["peak_extra_mb"] for medida in medidas)
+            caminhos[nome] = {"seconds": round(statistics.median(medida["seconds"] for medida in medidas), 3),
+                              "peak_extra_mb": round(pico, 1), "decoded_ratio": round(pico / decodificado_mb, 2)}
+            logging.info(f"{nome}: {caminhos[nome]}")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+    relatorio = {"key": arquivo.key, "payload_mb": round(payload_mb, 2), "decoded_mb": round(decodificado_mb, 2),
+                 "paths": caminhos}
+    print(json.dumps(relatorio, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(relatorio, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: poda de row groups nas tabelas silver com e sem clusterização.
+
+Roda o raw e as etapas trusted sobre as PUFs sintéticas (`--scale`, reaproveitando
+`--data-dir`) com a clusterização desligada (PARQUET_LAYOUT com `cluster_by`
+vazio), para as silver saírem na ordem de chegada da raw. Cada tabela é então
+regravada em memória com o perfil de `parquet_layout` e três ordens:
+- chegada: a ordem de chegada (sem clusterização)
+- sort: ordenada pelas chaves `cluster_by` do perfil
+- zorder: curva Z sobre as mesmas chaves
+
+Predicados representativos, com os valores da linha do meio da tabela: igualdade
+em cada chave do perfil e StateCode + BusinessYear juntos. Por tabela e ordem:
+- size_kb e write_ms (mediana de `--repeat`)
+- pruning: por predicado, row groups totais, descartados pelas estatísticas e a
+  fração descartada (`clustering.pruning_report`)
+
+Com poucas linhas (escala 1) as tabelas cabem num row group; `--row-group-size`
+força row groups menores para a poda aparecer.
+
+Uso:
+    python app/benchmarks/bench_clustering.py --scale 1 --row-group-size 4096
+    python app/benchmarks/bench_clustering.py --scale 10 --tables tb_silver_rate --save clustering.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import statistics
+import tempfile
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "trusted"))
+
+import pyarrow as pa
+import object_store
+import parquet_layout
+import clustering
+from bench_pipeline import gerar_dados, rodar_escala
+from bench_parquet_layout import TABELAS, ler_tabela
+
+# Configurações
+ETAPAS = ["raw", "trusted_zipcodes", "trusted_service_area", "trusted_rate", "trusted_benefits",
+          "trusted_business_rules", "trusted_plan_attributes"]
+SILVER = [tabela for tabela in TABELAS if parquet_layout.profile(tabela).cluster_by]
+
+
+def predicados(dados: pa.Table, chaves) -> List[clustering.Predicate]:
+    linha = {chave: dados.column(chave)[dados.num_rows // 2].as_py() for chave in chaves if chave in dados.column_names}
+    resultado = [[(chave, "==", valor)] for chave, valor in linha.items()]
+    if "StateCode" in linha and "BusinessYear" in linha:
+        resultado.append([("StateCode", "==", linha["StateCode"]), ("BusinessYear", "==", linha["BusinessYear"])])
+    return resultado
+
+
+def medir(tabela: str, dados: pa.Table, layout: parquet_layout.LayoutProfile,
+          filtros: List[clustering.Predicate], repeat: int) -> Dict:
+    escritas = []
+    for _ in range(repeat):
+        buffer = pa.BufferOutputStream()
+        inicio = time.perf_counter()
+        parquet_layout.write_table(dados, buffer, tabela, layout)
+        escritas.append(time.perf_counter() - inicio)
+        arquivo = buffer.getvalue()
+    return {
+        "size_kb": round(arquivo.size / 1024, 1),
+        "write_ms": round(statistics.median(escritas) * 1000, 1),
+        "pruning": clustering.pruning_report(pa.BufferReader(arquivo), filtros),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tables", nargs="*", default=SILVER, choices=SILVER)
+    parser.add_argument("--row-group-size", type=int, help="linhas por row group (padrão: a do perfil)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "puf_synthetic"),
+                        help="cache das PUFs geradas, por escala e seed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="grava o relatório em JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    raiz = tempfile.mkdtemp(prefix="bench_clustering_")
+    resultados = {}
+    try:
+        dados = gerar_dados(args.data_dir, args.scale, args.seed)
+        env = {**os.environ, "OBJECT_STORE": "local", "OBJECT_STORE_ROOT": raiz,
+               "PARQUET_LAYOUT": json.dumps({"*": {"cluster_by": []}})}
+        store = object_store.LocalStore(raiz)
+        etapas = rodar_escala(dados, ETAPAS, env, store)
+        falhas = [nome for nome, etapa in etapas.items() if etapa["status"] != "ok"]
+        if falhas:
+            logging.warning(f"Etapas com falha (as tabelas delas ficam de fora): {falhas}")
+
+        for tabela in args.tables:
+            bucket, prefixo = TABELAS[tabela]
+            try:
+                conteudo = ler_tabela(store, bucket, prefixo)
+            except (ValueError, pa.ArrowInvalid) as e:
+                logging.warning(f"{tabela} indisponível: {e}")
+                continue
+            perfil = parquet_layout.profile(tabela)
+            if args.row_group_size:
+                perfil = perfil._replace(row_group_size=args.row_group_size)
+            filtros = predicados(conteudo, perfil.cluster_by)
+            ordens = {
+                "chegada": perfil._replace(cluster_by=()),
+                "sort": perfil._replace(cluster_method="sort"),
+                "zorder": perfil._replace(cluster_method="zorder"),
+            }
+            resultados[tabela] = {"rows": conteudo.num_rows, "cluster_by": list(perfil.cluster_by), "orders": {}}
+            for nome, layout in ordens.items():
+                resultados[tabela]["orders"][nome] = medir(tabela, conteudo, layout, filtros, args.repeat)
+                descartes = [p["skipped"] for p in resultados[tabela]["orders"][nome]["pruning"]]
+                logging.info(f"{tabela} / {nome}: row groups descartados por predicado {descartes}")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+    print(json.dumps(resultados, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
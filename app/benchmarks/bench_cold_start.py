@@ -0,0 +1,152 @@
+"""
+Benchmark: custo de cold start (importação) dos handlers das Lambdas.
+
+Para cada handler de `local_pipeline.STAGES`, em um interpretador novo:
+- import_ms: tempo para importar o módulo do handler (o init da Lambda)
+- client_ms: tempo para criar o primeiro cliente S3 depois da importação
+  (pago na primeira invocação quando o cliente é criado sob demanda)
+- cold_start_ms: a soma dos dois
+- top_imports: as importações diretas mais caras do módulo, por `python -X importtime`
+
+Cada medida é a mediana de `--repeat` execuções, depois de uma execução de
+aquecimento (para os .pyc já existirem). Com `--baseline`, compara com um
+relatório salvo por `--save` e termina com erro se algum handler ficar mais
+lento que a tolerância, para pegar regressões de cold start.
+
+O relatório de referência fica versionado em `app/benchmarks/baselines/cold_start.json`,
+e é o padrão de `--baseline` sem arquivo. Ele vale para a máquina em que foi
+gerado: em outra, gere um com `--save` antes de comparar.
+
+Uso:
+    python app/benchmarks/bench_cold_start.py --baseline
+    python app/benchmarks/bench_cold_start.py --save app/benchmarks/baselines/cold_start.json
+    python app/benchmarks/bench_cold_start.py --baseline cold_start.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BASE_DIR, "..")
+sys.path.insert(0, APP_DIR)
+
+from local_pipeline import STAGES
+
+# Configurações
+BASELINE = os.path.join(BASE_DIR, "baselines", "cold_start.json")  # relatório de referência versionado
+# Tolerância absoluta, para o ruído não acusar regressão em módulos rápidos
+MIN_REGRESSION_MS = 25.0
+
+CHILD = """
+import sys, time, json
+sys.path[:0] = [{path!r}, {shared!r}]
+start = time.perf_counter()
+module = __import__({module!r})
+imported = time.perf_counter()
+if "aws_clients" in sys.modules:
+    sys.modules["aws_clients"].get_client("s3")
+elif not (hasattr(module, "s3") or hasattr(module, "s3_client")):
+    import boto3
+    boto3.client("s3")
+done = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - start) * 1000, "client_ms": (done - imported) * 1000}}))
+"""
+
+
+def _run(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    env = {**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(command, capture_output=True, text=True, env=env)
+
+
+def top_imports(stderr: str, module: str, limit: int) -> list:
+    """Importações diretas do módulo (nível 1 na árvore do -X importtime), da mais cara para a mais barata."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((level, name.strip(), int(cumulative) / 1000))
+
+    position = max((i for i, entry in enumerate(entries) if entry[0] == 0 and entry[1] == module), default=None)
+    if position is None:
+        return []
+    children = []
+    for level, name, cumulative in reversed(entries[:position]):
+        if level == 0:
+            break
+        if level == 1:
+            children.append({"module": name, "ms": round(cumulative, 1)})
+    return sorted(children, key=lambda child: -child["ms"])[:limit]
+
+
+def measure(stage: dict, repeat: int, limit: int) -> dict:
+    path = os.path.abspath(os.path.join(APP_DIR, stage["dir"]))
+    code = CHILD.format(path=path, shared=os.path.abspath(os.path.join(APP_DIR, "trusted")), module=stage["module"])
+    _run(code)  # aquecimento
+
+    samples = []
+    for _ in range(repeat):
+        result = _run(code)
+        if result.returncode != 0:
+            return {"module": stage["module"], "error": result.stderr.strip().splitlines()[-1]}
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(sample["import_ms"] for sample in samples)
+    client_ms = statistics.median(sample["client_ms"] for sample in samples)
+    profile = _run(code, importtime=True)
+    return {
+        "module": stage["module"],
+        "import_ms": round(import_ms, 1),
+        "client_ms": round(client_ms, 1),
+        "cold_start_ms": round(import_ms + client_ms, 1),
+        "top_imports": top_imports(profile.stderr, stage["module"], limit),
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name, {})
+        for metric in ("import_ms", "cold_start_ms"):
+            if metric not in result or metric not in before:
+                continue
+            limit = max(before[metric] * (1 + tolerance), before[metric] + MIN_REGRESSION_MS)
+            if result[metric] > limit:
+                found.append(f"{name}: {metric} {result[metric]:.1f} ms > {limit:.1f} ms (antes {before[metric]:.1f} ms)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="*", default=list(STAGES), help="handlers a medir")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="importações diretas listadas por handler")
+    parser.add_argument("--save", help="grava o relatório em JSON (base para --baseline)")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE,
+                        help=f"relatório anterior para detectar regressões (sem arquivo: {os.path.relpath(BASELINE)})")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="aumento relativo aceito")
+    args = parser.parse_args()
+
+    results = {name: measure(STAGES[name], args.repeat, args.top) for name in args.stages}
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for message in found:
+            print(f"REGRESSÃO: {message}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: escalabilidade do processamento em shards de um CSV grande.
+
+Gera (ou reaproveita) as PUFs sintéticas da escala pedida (padrão 10x) e
+processa o Rate_PUF pelo caminho de shards do `raw_processing_aws` (leitura,
+colunas de controle e gravação dos parquets), variando o número de workers.
+O plano de shards é o mesmo em todas as medidas (`--shards`, padrão duas vezes
+o maior número de workers), para só o paralelismo mudar.
+
+Por número de workers:
+- seconds: tempo de parede do arquivo inteiro (mediana de `--repeat`)
+- rows_per_second / mb_per_second: throughput sobre o CSV
+- speedup: seconds com 1 worker / seconds com N
+- efficiency: speedup / N (1.0 é escala linear)
+
+A escala só pode ser linear até o número de núcleos da máquina (`cpu_count`
+no relatório). O armazenamento é local, sem rede.
+
+Uso:
+    python app/benchmarks/bench_csv_shards.py --workers 1 2 4 8
+    python app/benchmarks/bench_csv_shards.py --scale 10 --file Rate --shards 32 --save shards.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import statistics
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+WORK_DIR = tempfile.mkdtemp(prefix="bench_csv_shards_")
+# Antes de importar o raw_processing_aws, que cria o armazenamento na importação
+os.environ["OBJECT_STORE"] = "local"
+os.environ["OBJECT_STORE_ROOT"] = WORK_DIR
+sys.path[:0] = [APP_DIR, os.path.join(APP_DIR, "raw"), os.path.join(APP_DIR, "trusted")]
+
+import generate_puf
+import raw_processing_aws as raw
+from bench_pipeline import gerar_dados
+
+
+def medir(dados: str, arquivo: str, workers: int, work_units: list) -> tuple:
+    """Processa o arquivo em shards com `workers` workers; devolve os segundos e as linhas."""
+    _, caminho = generate_puf.ARQUIVOS[arquivo]
+    raw.extract_dir = os.path.join(dados, "raw")
+    file_key = os.path.relpath(os.path.join(dados, caminho), raw.extract_dir)
+    checkpoint = raw.new_checkpoint(None)
+    checkpoint["files"][file_key] = {"status": "pending", "chunks": 0, "rows": 0, "objects": [],
+                                     "work_units": work_units, "shards_done": {}}
+
+    inicio = time.monotonic()
+    concluido = raw.process_sharded_file(os.path.join(dados, caminho), arquivo, file_key, checkpoint,
+                                         raw.TimeBudget(), max_workers=workers)
+    segundos = time.monotonic() - inicio
+    if not concluido:
+        raise RuntimeError(f"{arquivo} não foi concluído com {workers} workers")
+    return segundos, checkpoint["files"][file_key]["rows"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--file", default="Rate", choices=list(generate_puf.ARQUIVOS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--shards", type=int, help="shards do plano (padrão: 2 x o maior número de workers)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "puf_synthetic"),
+                        help="cache das PUFs geradas, por escala e seed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="grava o relatório em JSON")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # o raw_processing_aws loga cada chunk em INFO
+
+    try:
+        dados = gerar_dados(args.data_dir, args.scale, args.seed)
+        _, caminho = generate_puf.ARQUIVOS[args.file]
+        csv_path = os.path.join(dados, caminho)
+        megabytes = os.path.getsize(csv_path) / 2**20
+
+        shards = args.shards or 2 * max(args.workers)
+        _, data_start = raw.csv_shards.read_header(csv_path)
+        target = (os.path.getsize(csv_path) - data_start) // shards + 1
+        work_units = raw.plan_work_units(csv_path, os.path.relpath(csv_path, os.path.join(dados, "raw")),
+                                         args.file, "19700101", target_bytes=target)
+
+        resultados = {}
+        for workers in args.workers:
+            medidas = [medir(dados, args.file, workers, work_units) for _ in range(args.repeat)]
+            segundos = statistics.median(segundos for segundos, _ in medidas)
+            linhas = medidas[0][1]
+            resultados[workers] = {"seconds": round(segundos, 3), "rows": linhas,
+                                   "rows_per_second": round(linhas / segundos),
+                                   "mb_per_second": round(megabytes / segundos, 2)}
+            print(f"{workers} workers: {resultados[workers]}", file=sys.stderr)
+
+        base = resultados[min(resultados)]["seconds"] * min(resultados)
+        for workers, resultado in resultados.items():
+            resultado["speedup"] = round(base / resultado["seconds"], 2)
+            resultado["efficiency"] = round(resultado["speedup"] / workers, 2)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    relatorio = {"file": args.file, "scale": args.scale, "input_mb": round(megabytes, 2), "shards": len(work_units),
+                 "cpu_count": os.cpu_count(), "workers": resultados}
+    print(json.dumps(relatorio, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(relatorio, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
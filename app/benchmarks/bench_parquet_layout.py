@@ -0,0 +1,160 @@
+"""
+Benchmark: tamanho, tempo de escrita e tempo de leitura de cada tabela por layout Parquet.
+
+Roda o raw e as etapas trusted sobre as PUFs sintéticas (`--scale`, reaproveitando
+`--data-dir`) em um armazenamento local temporário, lê cada tabela gerada e a
+regrava em memória com o perfil configurado em `parquet_layout` e com variações:
+- perfil: o perfil da tabela
+- pyarrow_padrao: snappy, sem page index nem Bloom filters (o layout anterior)
+- zstd_1 / zstd_9: o perfil com outro nível de compressão
+- sem_dicionario: o perfil sem dictionary encoding
+- row_groups_16k: o perfil com row groups de 16k linhas
+
+Por tabela e layout (mediana de `--repeat`):
+- size_kb: tamanho do arquivo
+- write_ms: tempo de escrita
+- scan_ms: leitura completa
+- lookup_ms: leitura filtrada por igualdade em um identificador (PlanId,
+  StandardComponentId ou IssuerId), com poda por estatísticas de row group
+
+Uso:
+    python app/benchmarks/bench_parquet_layout.py --scale 1
+    python app/benchmarks/bench_parquet_layout.py --scale 10 --tables tb_silver_rate Rate --save layout.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import statistics
+import tempfile
+from typing import Dict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "trusted"))
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import object_store
+import parquet_layout
+import parquet_index
+from bench_pipeline import gerar_dados, rodar_escala
+
+# Configurações
+ETAPAS = ["raw", "trusted_zipcodes", "trusted_service_area", "trusted_rate", "trusted_benefits",
+          "trusted_business_rules", "trusted_plan_attributes"]
+# Tabela -> (bucket, prefixo) das saídas do pipeline
+TABELAS = {
+    "Rate": ("raw-test-edb", "Rate/"),
+    "Benefits_Cost_Sharing": ("raw-test-edb", "Benefits_Cost_Sharing/"),
+    "Plan_Attributes": ("raw-test-edb", "Plan_Attributes/"),
+    "tb_silver_rate": ("cleaned-test-edb", "tb_silver_rate/"),
+    "tb_silver_benefits_cost_sharing": ("cleaned-test-edb", "tb_silver_benefits_cost_sharing/"),
+    "tb_silver_plan_attributes": ("cleaned-test-edb", "tb_silver_plan_attributes/"),
+    "tb_silver_business_rules": ("cleaned-test-edb", "tb_silver_business_rules/"),
+    "tb_silver_service_area": ("cleaned-test-edb", "tb_silver_service_area/"),
+    "tb_bronze_zipcodes": ("cleaned-test-edb", "tb_bronze_zipcodes/"),
+}
+
+
+def variantes(tabela: str) -> Dict[str, parquet_layout.LayoutProfile]:
+    perfil = parquet_layout.profile(tabela)
+    return {
+        "perfil": perfil,
+        "pyarrow_padrao": parquet_layout.LayoutProfile(compression="snappy", compression_level=None, row_group_size=None,
+                                                       no_dictionary=(), page_index=False, bloom_filters=False),
+        "zstd_1": perfil._replace(compression="zstd", compression_level=1),
+        "zstd_9": perfil._replace(compression="zstd", compression_level=9),
+        "sem_dicionario": perfil._replace(dictionary=False),
+        "row_groups_16k": perfil._replace(row_group_size=16 * 1024),
+    }
+
+
+def ler_tabela(store, bucket: str, prefixo: str) -> pa.Table:
+    """Junta os arquivos da tabela (os chunks da raw podem ter tipos diferentes entre si)."""
+    partes = [pq.read_table(pa.BufferReader(store.get(bucket, info.key)))
+              for info in store.list(bucket, prefixo) if info.key.endswith(".parquet")]
+    return pa.concat_tables(partes, promote_options="permissive")
+
+
+def medir(tabela: str, dados: pa.Table, layout: parquet_layout.LayoutProfile, repeat: int) -> Dict:
+    coluna = next((c for c in parquet_index.INDEX_COLUMNS if c in dados.column_names), None)
+    valor = dados.column(coluna)[dados.num_rows // 2].as_py() if coluna and dados.num_rows else None
+    opcoes = parquet_layout.write_options(tabela, dados, layout)
+
+    escritas, leituras, buscas = [], [], []
+    for _ in range(repeat):
+        buffer = pa.BufferOutputStream()
+        inicio = time.perf_counter()
+        pq.write_table(dados, buffer, **opcoes)
+        escritas.append(time.perf_counter() - inicio)
+        arquivo = buffer.getvalue()
+
+        inicio = time.perf_counter()
+        pq.read_table(pa.BufferReader(arquivo))
+        leituras.append(time.perf_counter() - inicio)
+
+        if valor is not None:
+            inicio = time.perf_counter()
+            pq.read_table(pa.BufferReader(arquivo), filters=[(coluna, "==", valor)])
+            buscas.append(time.perf_counter() - inicio)
+
+    return {
+        "size_kb": round(arquivo.size / 1024, 1),
+        "write_ms": round(statistics.median(escritas) * 1000, 1),
+        "scan_ms": round(statistics.median(leituras) * 1000, 1),
+        "lookup_ms": round(statistics.median(buscas) * 1000, 1) if buscas else None,
+        "row_groups": pq.ParquetFile(pa.BufferReader(arquivo)).num_row_groups,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tables", nargs="*", default=list(TABELAS), choices=list(TABELAS))
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "puf_synthetic"),
+                        help="cache das PUFs geradas, por escala e seed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="grava o relatório em JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    raiz = tempfile.mkdtemp(prefix="bench_parquet_layout_")
+    resultados = {}
+    try:
+        dados = gerar_dados(args.data_dir, args.scale, args.seed)
+        env = {**os.environ, "OBJECT_STORE": "local", "OBJECT_STORE_ROOT": raiz}
+        store = object_store.LocalStore(raiz)
+        etapas = rodar_escala(dados, ETAPAS, env, store)
+        falhas = [nome for nome, etapa in etapas.items() if etapa["status"] != "ok"]
+        if falhas:
+            logging.warning(f"Etapas com falha (as tabelas delas ficam de fora): {falhas}")
+
+        for tabela in args.tables:
+            bucket, prefixo = TABELAS[tabela]
+            try:
+                conteudo = ler_tabela(store, bucket, prefixo)
+            except (ValueError, pa.ArrowInvalid) as e:
+                logging.warning(f"{tabela} indisponível: {e}")
+                continue
+            resultados[tabela] = {"rows": conteudo.num_rows, "columns": conteudo.num_columns, "layouts": {}}
+            for nome, layout in variantes(tabela).items():
+                resultados[tabela]["layouts"][nome] = medir(tabela, conteudo, layout, args.repeat)
+                logging.info(f"{tabela} / {nome}: {resultados[tabela]['layouts'][nome]}")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+    print(json.dumps(resultados, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark: tempo, throughput e pico de memória de cada etapa do pipeline.
+
+Para cada escala (`--scale 1 10 100`), gera as PUFs sintéticas com
+`generate_puf` (reaproveitando a geração anterior em `--data-dir`), grava o zip
+na landing de um armazenamento vazio e roda as etapas de `local_pipeline.STAGES`
+em ordem de dependência, uma por vez, cada uma em um interpretador novo (como
+um container Lambda). O `landing` é substituído pelo gerador.
+
+Por etapa:
+- seconds: tempo de parede do handler, incluindo a importação do módulo
+- input_rows / input_mb: linhas e bytes dos CSVs que alimentam a etapa
+- rows_per_second / mb_per_second: throughput sobre essa entrada
+- peak_rss_mb: pico de memória residente do processo da etapa
+
+Armazenamento (`--storage`):
+- local (padrão): sem rede; uma pasta nova sob `--work-dir` por escala e repetição
+- endpoint: um S3 compatível (ex.: o `s3-local` do docker-compose); os buckets
+  precisam estar vazios, então só uma escala e uma repetição por execução
+
+Com `--repeat`, cada escala roda de novo do zero e fica a mediana de cada
+métrica. Com `--baseline`, compara com um relatório salvo por `--save` e
+termina com erro se alguma etapa ficar mais lenta ou usar mais memória que a
+tolerância.
+
+O relatório de referência fica versionado em `app/benchmarks/baselines/pipeline.json`
+(escalas 1 e 10, seed 42), e é o padrão de `--baseline` sem arquivo. Ele vale
+para a máquina em que foi gerado: em outra, gere um com `--save` antes de
+comparar, e atualize o versionado quando uma mudança alterar os números de
+propósito.
+
+Uso:
+    python app/benchmarks/bench_pipeline.py --scale 1 10 --baseline
+    python app/benchmarks/bench_pipeline.py --scale 1 10 --save app/benchmarks/baselines/pipeline.json
+    python app/benchmarks/bench_pipeline.py --scale 1 10 --baseline pipeline.json --tolerance 0.25
+    python app/benchmarks/bench_pipeline.py --scale 1 --stages raw trusted_rate
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import statistics
+import subprocess
+import tempfile
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "trusted"))
+
+import object_store
+import generate_puf
+from local_pipeline import STAGES, BUCKETS, DEFAULT_ENDPOINT, configure_storage
+
+# Configurações
+BASELINE = os.path.join(BASE_DIR, "baselines", "pipeline.json")  # relatório de referência versionado
+EXTRACTED_DIR = "/tmp/extracted_data"  # onde o raw_processing_aws extrai o zip da landing
+MARKER = "BENCH_RESULT "
+# Tolerâncias absolutas, para o ruído não acusar regressão em etapas rápidas
+MIN_REGRESSION_SECONDS = 0.5
+MIN_REGRESSION_MB = 32.0
+
+SERVICE_AREA = ["Service_Area", "ServiceArea"]
+TRUSTED_INPUTS = ["Rate", "Benefits_Cost_Sharing", "Business_Rules", "Plan_Attributes"] + SERVICE_AREA
+
+# Etapa -> arquivos gerados que ela processa (base do throughput)
+STAGE_INPUTS = {
+    "raw": list(generate_puf.ARQUIVOS),
+    "trusted_zipcodes": SERVICE_AREA,
+    "trusted_service_area": SERVICE_AREA,
+    "trusted_rate": ["Rate"],
+    "trusted_benefits": ["Benefits_Cost_Sharing"],
+    "trusted_business_rules": ["Business_Rules"],
+    "trusted_plan_attributes": ["Plan_Attributes"],
+    "trusted_validate": TRUSTED_INPUTS,
+}
+
+# O pico vem do VmHWM, que zera no exec; no Linux o ru_maxrss herda o pico do processo pai
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {app!r})
+from local_pipeline import run_stage
+result = run_stage({stage!r}, time.time())
+try:
+    with open("/proc/self/status") as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+result["peak_rss_mb"] = peak_kb / 1024
+print({marker!r} + json.dumps(result, default=str))
+"""
+
+
+def gerar_dados(data_dir: str, escala: float, seed: int) -> str:
+    """Gera (ou reaproveita) as PUFs sintéticas da escala; devolve a pasta."""
+    saida = os.path.join(data_dir, f"puf_{escala:g}x_seed{seed}")
+    if not os.path.exists(os.path.join(saida, "manifest.json")):
+        shutil.rmtree(saida, ignore_errors=True)
+        generate_puf.gerar_puf(saida, escala, seed)
+    return saida
+
+
+def rodar_etapa(nome: str, env: Dict[str, str]) -> Dict:
+    """Roda uma etapa em um interpretador novo e devolve o resultado de `run_stage` com o pico de memória."""
+    code = CHILD.format(app=APP_DIR, stage=nome, marker=MARKER)
+    processo = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    for linha in reversed(processo.stdout.splitlines()):
+        if linha.startswith(MARKER):
+            return json.loads(linha[len(MARKER):])
+    erro = (processo.stderr.strip().splitlines() or ["sem saída"])[-1]
+    return {"stage": nome, "status": "error", "response": {"error": erro}}
+
+
+def rodar_escala(dados: str, etapas: List[str], env: Dict[str, str], store) -> Dict[str, Dict]:
+    """Publica os dados na landing e roda as etapas em ordem; as dependentes de uma falha não rodam."""
+    for bucket in BUCKETS:
+        store.create_bucket(bucket)
+    generate_puf.publicar(dados, store)
+    shutil.rmtree(EXTRACTED_DIR, ignore_errors=True)
+
+    with open(os.path.join(dados, "manifest.json")) as f:
+        arquivos = json.load(f)["files"]
+
+    resultados = {}
+    for nome in etapas:
+        falhas = [dep for dep in STAGES[nome]["deps"] if dep in resultados and resultados[dep]["status"] != "ok"]
+        if falhas:
+            resultados[nome] = {"status": "skipped", "reason": f"dependências falharam: {falhas}"}
+            continue
+        logging.info(f"Rodando {nome}")
+        resultado = rodar_etapa(nome, env)
+        segundos = resultado.get("end", 0) - resultado.get("start", 0)
+        linhas = sum(arquivos[arquivo]["rows"] for arquivo in STAGE_INPUTS.get(nome, []))
+        megabytes = sum(arquivos[arquivo]["bytes"] for arquivo in STAGE_INPUTS.get(nome, [])) / 2**20
+        resultados[nome] = {
+            "status": resultado["status"],
+            "seconds": round(segundos, 3),
+            "input_rows": linhas,
+            "input_mb": round(megabytes, 2),
+            "rows_per_second": round(linhas / segundos) if segundos else None,
+            "mb_per_second": round(megabytes / segundos, 2) if segundos else None,
+            "peak_rss_mb": round(resultado.get("peak_rss_mb", 0), 1),
+        }
+        if resultado["status"] != "ok":
+            resultados[nome]["response"] = resultado.get("response")
+        logging.info(f"{nome}: {resultados[nome]}")
+    return resultados
+
+
+def mediana(execucoes: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """Mediana de cada métrica numérica entre as repetições de uma escala."""
+    resumo = {}
+    for nome, primeiro in execucoes[0].items():
+        resumo[nome] = dict(primeiro)
+        for metrica, valor in primeiro.items():
+            valores = [execucao[nome].get(metrica) for execucao in execucoes]
+            if isinstance(valor, (int, float)) and all(isinstance(v, (int, float)) for v in valores):
+                resumo[nome][metrica] = round(statistics.median(valores), 3)
+    return resumo
+
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    found = []
+    for escala, etapas in results.items():
+        for nome, result in etapas.items():
+            before = baseline.get(escala, {}).get(nome, {})
+            if result.get("status") != "ok" and before.get("status") == "ok":
+                found.append(f"{escala}/{nome}: status {result.get('status')} (antes ok)")
+                continue
+            for metric, minimum, unit in (("seconds", MIN_REGRESSION_SECONDS, "s"), ("peak_rss_mb", MIN_REGRESSION_MB, "MB")):
+                if metric not in result or metric not in before:
+                    continue
+                limit = max(before[metric] * (1 + tolerance), before[metric] + minimum)
+                if result[metric] > limit:
+                    found.append(f"{escala}/{nome}: {metric} {result[metric]:.2f} {unit} > {limit:.2f} {unit} "
+                                 f"(antes {before[metric]:.2f} {unit})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, nargs="+", default=[1], help="fatores de escala (ex.: 1 10 100)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stages", nargs="*", default=[name for name in STAGES if name != "landing"],
+                        help="etapas a medir (as dependências fora da lista precisam já ter rodado)")
+    parser.add_argument("--storage", choices=("local", "endpoint"), default="local")
+    parser.add_argument("--endpoint-url", default=os.environ.get("AWS_ENDPOINT_URL", DEFAULT_ENDPOINT))
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "puf_synthetic"),
+                        help="cache das PUFs geradas, por escala e seed")
+    parser.add_argument("--work-dir", help="pasta dos buckets locais (padrão: temporária, removida ao final)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--save", help="grava o relatório em JSON (base para --baseline)")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE,
+                        help=f"relatório anterior para detectar regressões (sem arquivo: {os.path.relpath(BASELINE)})")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="aumento relativo aceito")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    etapas = [name for name in STAGES if name in args.stages]
+    if args.storage == "endpoint" and (len(args.scale) > 1 or args.repeat > 1):
+        parser.error("--storage endpoint usa os mesmos buckets: rode uma escala e uma repetição por vez")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_pipeline_")
+    results = {}
+    try:
+        for escala in args.scale:
+            dados = gerar_dados(args.data_dir, escala, args.seed)
+            execucoes = []
+            for repeticao in range(args.repeat):
+                if args.storage == "local":
+                    raiz = os.path.join(work_dir, f"{escala:g}x_{repeticao}")
+                    env = {**os.environ, "OBJECT_STORE": "local", "OBJECT_STORE_ROOT": raiz}
+                    store = object_store.LocalStore(raiz)
+                else:
+                    configure_storage("endpoint", args.endpoint_url, work_dir)
+                    env, store = dict(os.environ), object_store.get_store()
+                execucoes.append(rodar_escala(dados, etapas, env, store))
+            results[f"{escala:g}x"] = mediana(execucoes)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for message in found:
+            print(f"REGRESSÃO: {message}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
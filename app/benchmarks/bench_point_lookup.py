@@ -0,0 +1,151 @@
+"""
+Benchmark: busca pontual por PlanId com e sem os índices dos arquivos Parquet.
+
+Gera tabelas sintéticas com o formato da tb_silver_rate em tamanhos crescentes
+(número de arquivos), em duas versões:
+- sem índice: gravadas como o `save_as_parquet` antigo (sem Bloom filters)
+- com índice: gravadas com `parquet_index.bloom_filter_options`
+
+Layouts (`--layout`):
+- misturado: cada arquivo tem planos sorteados de todo o universo, então o
+  min/max do PlanId não poda nada e só o Bloom filter descarta arquivos
+- agrupado: cada arquivo tem os planos de um emissor, então o min/max já poda
+
+Para cada tamanho, mede a latência de:
+- varredura: `SELECT * FROM read_parquet(<tabela>) WHERE PlanId = ?` nos arquivos sem índice
+- varredura_indexada: a mesma query nos arquivos com índice (o DuckDB usa os Bloom filters)
+- point_lookup: poda explícita por estatísticas + Bloom filters, com métricas, e leitura
+  dos arquivos restantes
+
+Em disco local a leitura é barata e as três ficam próximas; a diferença que
+importa no S3 é o número de arquivos e row groups lidos, também reportado.
+
+Uso:
+    python app/benchmarks/bench_point_lookup.py --files 8 32 128 --rows-per-file 100000 --layout misturado
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "trusted"))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "delivery"))
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import parquet_index
+import point_lookup
+
+ROW_GROUP_SIZE = 25_000
+
+
+def gerar_planos(emissores: int, planos_por_emissor: int, rng: np.random.Generator) -> np.ndarray:
+    """PlanIds no formato da PUF (5 dígitos do emissor + UF + 7 dígitos), ordenados por emissor."""
+    estados = ["AK", "AL", "AZ", "FL", "GA", "IL", "TX", "WI"]
+    return np.array([f"{10000 + emissor}{estados[emissor % len(estados)]}{numero:07d}"
+                     for emissor in range(emissores)
+                     for numero in np.sort(rng.choice(10_000_000, planos_por_emissor, replace=False))])
+
+
+def gerar_arquivo(planos: np.ndarray, linhas: int, rng: np.random.Generator) -> pa.Table:
+    plano = np.sort(rng.choice(planos, size=linhas))
+    return pa.table({
+        "BusinessYear": np.full(linhas, "2016"),
+        "StateCode": np.array([valor[5:7] for valor in plano]),
+        "IssuerId": np.array([valor[:5] for valor in plano]),
+        "PlanId": plano,
+        "Age": rng.choice(["0-20", "21", "45", "64 and over"], size=linhas),
+        "IndividualRate": np.round(rng.uniform(50, 1500, size=linhas), 2).astype(str),
+    })
+
+
+def gerar_tabelas(raiz: str, arquivos: int, linhas: int, planos_por_arquivo: int, layout: str) -> str:
+    """Grava a tb_silver_rate sintética sem e com índice; devolve um PlanId presente em um único arquivo."""
+    rng = np.random.default_rng(arquivos)
+    universo = gerar_planos(arquivos, planos_por_arquivo, rng)
+    if layout == "agrupado":
+        grupos = np.split(universo, arquivos)
+    else:
+        grupos = np.split(rng.permutation(universo), arquivos)
+
+    for versao in ("sem_indice", "com_indice"):
+        os.makedirs(os.path.join(raiz, versao, "tb_silver_rate"))
+    for indice, planos in enumerate(grupos):
+        tabela = gerar_arquivo(planos, linhas, rng)
+        nome = f"data_{indice:05d}.parquet"
+        pq.write_table(tabela, os.path.join(raiz, "sem_indice", "tb_silver_rate", nome), row_group_size=ROW_GROUP_SIZE)
+        pq.write_table(tabela, os.path.join(raiz, "com_indice", "tb_silver_rate", nome), row_group_size=ROW_GROUP_SIZE,
+                       bloom_filter_options=parquet_index.bloom_filter_options(tabela))
+        if indice == len(grupos) // 2:
+            alvo = tabela.column("PlanId")[tabela.num_rows // 2].as_py()
+    return alvo
+
+
+def tamanho(pasta: str) -> int:
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(pasta) for nome in nomes)
+
+
+def medir(funcao, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return round(min(tempos), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[8, 32, 128], help="tamanhos da tabela, em arquivos")
+    parser.add_argument("--rows-per-file", type=int, default=100_000)
+    parser.add_argument("--plans-per-file", type=int, default=500)
+    parser.add_argument("--layout", choices=("misturado", "agrupado"), default="misturado")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    resultados = []
+    for arquivos in args.files:
+        raiz = tempfile.mkdtemp(prefix="bench_lookup_")
+        try:
+            alvo = gerar_tabelas(raiz, arquivos, args.rows_per_file, args.plans_per_file, args.layout)
+            sem_indice = os.path.join(raiz, "sem_indice")
+            com_indice = os.path.join(raiz, "com_indice")
+
+            con = duckdb.connect()
+            varredura = "SELECT * FROM read_parquet('{}/tb_silver_rate/*.parquet') WHERE PlanId = ?"
+            linhas = len(con.execute(varredura.format(sem_indice), [alvo]).fetchall())
+            busca = point_lookup.lookup(com_indice, alvo, "PlanId", ["tb_silver_rate"])["tb_silver_rate"]
+
+            resultados.append({
+                "layout": args.layout,
+                "arquivos": arquivos,
+                "linhas_tabela": arquivos * args.rows_per_file,
+                "bytes_sem_indice": tamanho(sem_indice),
+                "bytes_com_indice": tamanho(com_indice),
+                "linhas_encontradas": linhas,
+                "varredura_s": medir(lambda: con.execute(varredura.format(sem_indice), [alvo]).fetchall(), args.repeat),
+                "varredura_indexada_s": medir(lambda: con.execute(varredura.format(com_indice), [alvo]).fetchall(), args.repeat),
+                "point_lookup_s": medir(lambda: point_lookup.lookup(com_indice, alvo, "PlanId", ["tb_silver_rate"]), args.repeat),
+                "point_lookup_linhas": busca["metrics"]["rows"],
+                "arquivos_lidos": busca["metrics"]["files_read"],
+                "row_groups_lidos": f"{busca['metrics']['row_groups_read']}/{busca['metrics']['row_groups']}",
+            })
+            con.close()
+        finally:
+            shutil.rmtree(raiz, ignore_errors=True)
+
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: motor de regras `quality_rules` x validação antiga com Pandera.
+
+Gera uma tabela sintética com o formato da tb_silver_rate (todas as colunas
+como texto, como `save_as_parquet` grava) e mede:
+- tempo de importação de cada validador (custo de cold start)
+- tempo de validação sobre a tabela inteira
+
+O caminho Pandera reproduz o antigo `validar_com_pandera` (conversão para
+pandas, `pd.to_numeric` e `schema.validate(lazy=True)`). Ele só é executado se
+o pandera estiver instalado.
+
+Uso:
+    python app/benchmarks/bench_quality_rules.py --rows 2000000 --repeat 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trusted"))
+
+import numpy as np
+import pyarrow as pa
+
+# Tamanho aproximado da Rate_PUF de 2016
+LINHAS_RATE = 12_694_445
+
+
+def gerar_tabela_rate(linhas: int, seed: int = 42) -> pa.Table:
+    rng = np.random.default_rng(seed)
+    estados = np.array(["AK", "AL", "AZ", "FL", "GA", "IL", "TX", "WI"])
+    issuers = rng.integers(10000, 99999, size=linhas)
+    return pa.table({
+        "BusinessYear": rng.choice(["2014", "2015", "2016"], size=linhas),
+        "StateCode": rng.choice(estados, size=linhas),
+        "IssuerId": issuers.astype(str),
+        "SourceName": rng.choice(["HIOS", "SERFF", "OPM"], size=linhas),
+        "PlanId": np.char.add(np.char.add(issuers.astype(str), rng.choice(estados, size=linhas)),
+                              rng.integers(1000000, 9999999, size=linhas).astype(str)),
+        "Age": rng.choice(["0-20", "21", "45", "64 and over", "Family Option"], size=linhas),
+        "IndividualRate": np.round(rng.uniform(50, 1500, size=linhas), 2).astype(str),
+    })
+
+
+def medir_importacao(modulo: str) -> float:
+    """Tempo de importação em um interpretador novo (segundos)."""
+    codigo = f"import time; t = time.perf_counter(); import {modulo}; print(time.perf_counter() - t)"
+    env = {**os.environ, "PYTHONPATH": sys.path[0]}
+    saida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, env=env)
+    return float(saida.stdout.strip()) if saida.returncode == 0 else float("nan")
+
+
+def validar_pandera(tabela: pa.Table) -> bool:
+    import pandas as pd
+    import pandera as pdr
+    from pandera import Column
+
+    schema = pdr.DataFrameSchema({
+        "BusinessYear": Column(pdr.Int, nullable=False, coerce=True),
+        "PlanId": Column(pdr.String, nullable=True, required=False),
+        "IssuerId": Column(pdr.Int, nullable=False, coerce=True),
+        "StateCode": Column(pdr.String, nullable=False, required=False),
+        "SourceName": Column(pdr.String, nullable=False, required=False),
+    })
+    df = tabela.to_pandas()
+    df['BusinessYear'] = pd.to_numeric(df['BusinessYear'], errors='coerce')
+    df['IssuerId'] = pd.to_numeric(df['IssuerId'], errors='coerce')
+    try:
+        schema.validate(df, lazy=True)
+        return True
+    except pdr.errors.SchemaErrors:
+        return False
+
+
+def validar_regras(tabela: pa.Table) -> bool:
+    import quality_rules
+    return quality_rules.avaliar(tabela, quality_rules.regras_compiladas_da_tabela("tb_silver_rate/"))["valido"]
+
+
+def cronometrar(funcao, tabela: pa.Table, repeticoes: int) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        valido = funcao(tabela)
+        tempos.append(time.perf_counter() - inicio)
+    return {"valido": valido, "melhor_s": round(min(tempos), 4), "media_s": round(sum(tempos) / len(tempos), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help=f"linhas da tabela sintética (Rate 2016: {LINHAS_RATE})")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tabela = gerar_tabela_rate(args.rows)
+    resultado = {
+        "linhas": args.rows,
+        "importacao_s": {"quality_rules": round(medir_importacao("quality_rules"), 4)},
+        "validacao": {"quality_rules": cronometrar(validar_regras, tabela, args.repeat)},
+    }
+
+    try:
+        import pandera  # noqa: F401
+    except ImportError:
+        resultado["validacao"]["pandera"] = "pandera não instalado"
+    else:
+        resultado["importacao_s"]["pandera"] = round(medir_importacao("pandera"), 4)
+        resultado["validacao"]["pandera"] = cronometrar(validar_pandera, tabela, args.repeat)
+        resultado["speedup"] = round(resultado["validacao"]["pandera"]["melhor_s"] / resultado["validacao"]["quality_rules"]["melhor_s"], 1)
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
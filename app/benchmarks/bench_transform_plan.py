@@ -0,0 +1,152 @@
+"""
+Benchmark: planos das tabelas silver com e sem a otimização do `transform_plan`.
+
+Roda o raw e o trusted_zipcodes sobre as PUFs sintéticas (`--scale`,
+reaproveitando `--data-dir`) em um armazenamento local temporário e executa o
+`PLAN` de cada módulo tb_silver_* duas vezes, cada execução em um interpretador
+novo:
+- otimizado: `execute()`, com predicados e projeção empurrados para o scan
+- sem_otimizar: `execute(optimize=False)`, com o scan lendo todas as colunas
+  de cada arquivo e os passos na ordem declarada
+
+Por tabela e modo (mediana de `--repeat`):
+- seconds: tempo do `execute`, incluindo a escrita
+- peak_extra_mb: pico de memória residente durante o `execute` menos a memória antes dele
+- rows: linhas gravadas
+e o `explain()` do plano otimizado.
+
+Antes das medidas, confere o scan sobre arquivos de origem com tipos mistos
+(uma coluna toda nula em um arquivo e texto no outro, como a raw grava por chunk).
+
+Uso:
+    python app/benchmarks/bench_transform_plan.py --scale 1
+    python app/benchmarks/bench_transform_plan.py --scale 10 --tables tb_silver_rate --save plano.json
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import statistics
+import subprocess
+import tempfile
+from typing import Dict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "trusted"))
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import object_store
+import transform_plan
+from bench_pipeline import gerar_dados, rodar_escala
+
+# Configurações
+MARKER = "BENCH_RESULT "
+TABELAS = ["tb_silver_rate", "tb_silver_benefits_cost_sharing", "tb_silver_business_rules",
+           "tb_silver_plan_attributes", "tb_silver_service_area"]
+MODOS = {"otimizado": True, "sem_otimizar": False}
+
+# VmHWM zerado (clear_refs) logo antes do execute
+CHILD = """
+import sys, json, time, logging
+sys.path.insert(0, {trusted!r})
+logging.disable(logging.CRITICAL)
+import {modulo} as modulo
+
+def status(campo):
+    with open("/proc/self/status") as f:
+        return next(int(linha.split()[1]) for linha in f if linha.startswith(campo + ":")) / 1024
+
+antes = status("VmRSS")
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+inicio = time.perf_counter()
+escrita = modulo.PLAN.execute(optimize={otimizar!r})
+segundos = time.perf_counter() - inicio
+print({marker!r} + json.dumps({{"seconds": segundos, "peak_extra_mb": status("VmHWM") - antes,
+                                "rows": escrita.rows if escrita else 0, "explain": modulo.PLAN.explain()}}))
+"""
+
+
+def medir(env: Dict[str, str], modulo: str, otimizar: bool) -> Dict:
+    code = CHILD.format(trusted=os.path.join(APP_DIR, "trusted"), modulo=modulo, otimizar=otimizar, marker=MARKER)
+    processo = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    for linha in reversed(processo.stdout.splitlines()):
+        if linha.startswith(MARKER):
+            return json.loads(linha[len(MARKER):])
+    raise RuntimeError((processo.stderr.strip().splitlines() or ["sem saída"])[-1])
+
+
+def checar_schemas_mistos(store: object_store.LocalStore) -> None:
+    """Dois arquivos da ServiceArea com ZipCodes `null` em um e texto no outro passam pelo `distinct`."""
+    store.create_bucket("bench-tipos-mistos")
+    arquivos = [
+        pa.table({"ServiceAreaId": ["A", "B", "A"], "ZipCodes": pa.nulls(3), "County": [1, 2, 1]}),
+        pa.table({"ServiceAreaId": ["C", "A"], "ZipCodes": ["10001", None], "County": [3.0, 1.0]}),
+    ]
+    for i, tabela in enumerate(arquivos):
+        buffer = pa.BufferOutputStream()
+        pq.write_table(tabela, buffer)
+        store.put("bench-tipos-mistos", f"ServiceArea/data_{i}.parquet", buffer.getvalue())
+
+    for otimizar in MODOS.values():
+        tabela = (transform_plan.scan("bench-tipos-mistos", "ServiceArea/")
+                  .distinct(["ServiceAreaId"], keep="first").collect(store, optimize=otimizar))
+        esperado = {"ServiceAreaId": ["A", "B", "C"], "ZipCodes": [None, None, "10001"], "County": [1.0, 2.0, 3.0]}
+        if tabela.sort_by("ServiceAreaId").to_pydict() != esperado:
+            raise RuntimeError(f"Scan sobre tipos mistos (optimize={otimizar}): {tabela.to_pydict()}")
+    logging.info("Scan sobre arquivos com tipos mistos: ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tables", nargs="*", default=TABELAS, choices=TABELAS)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "puf_synthetic"),
+                        help="cache das PUFs geradas, por escala e seed")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="grava o relatório em JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    raiz = tempfile.mkdtemp(prefix="bench_transform_plan_")
+    relatorio = {}
+    try:
+        dados = gerar_dados(args.data_dir, args.scale, args.seed)
+        env = {**os.environ, "OBJECT_STORE": "local", "OBJECT_STORE_ROOT": raiz}
+        store = object_store.LocalStore(raiz)
+        checar_schemas_mistos(store)
+        etapas = rodar_escala(dados, ["raw", "trusted_zipcodes"], env, store)
+        falhas = [nome for nome, etapa in etapas.items() if etapa["status"] != "ok"]
+        if falhas:
+            raise RuntimeError(f"Etapas com falha: {falhas}")
+
+        for tabela in args.tables:
+            relatorio[tabela] = {"modes": {}}
+            for modo, otimizar in MODOS.items():
+                medidas = [medir(env, tabela, otimizar) for _ in range(args.repeat)]
+                relatorio[tabela]["explain"] = medidas[0]["explain"].splitlines()
+                relatorio[tabela]["modes"][modo] = {
+                    "seconds": round(statistics.median(medida["seconds"] for medida in medidas), 3),
+                    "peak_extra_mb": round(statistics.median(medida["peak_extra_mb"] for medida in medidas), 1),
+                    "rows": medidas[0]["rows"],
+                }
+                logging.info(f"{tabela} / {modo}: {relatorio[tabela]['modes'][modo]}")
+    finally:
+        shutil.rmtree(raiz, ignore_errors=True)
+
+    print(json.dumps(relatorio, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(relatorio, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
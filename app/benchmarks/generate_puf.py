@@ -0,0 +1,511 @@
+"""
+Gerador de dados sintéticos no formato das PUFs do Health Insurance Marketplace.
+
+Gera os CSVs de Rate, Plan_Attributes, Benefits_Cost_Sharing, Service_Area e
+Business_Rules com as colunas, os formatos de texto e as cardinalidades das
+PUFs reais, nos mesmos caminhos do dataset do Kaggle (`raw/<ano>/<Arquivo>_PUF*.csv`),
+para rodar o pipeline sem acesso à rede. A área de serviço sai nos dois nomes
+lidos pelas etapas trusted: `Service_Area` (2015) e `ServiceArea` (2016).
+
+Modelo: emissores (IssuerId de 5 dígitos) em estados do FFM, cada um com
+produtos (ProductId = IssuerId + UF + 3 dígitos), planos-padrão
+(StandardComponentId = ProductId + 4 dígitos) e variantes de CSR
+(PlanId = StandardComponentId + '-0N'). Daí saem:
+- Rate: um preço por plano-padrão, área de avaliação e idade (0-20, 21 a 63,
+  64 and over), ou uma linha 'Family Option' com os preços por composição familiar
+- Benefits_Cost_Sharing: uma linha por variante e benefício
+- Plan_Attributes: uma linha por variante
+- Business_Rules: uma linha por plano-padrão
+- Service_Area: por área de serviço do emissor, o estado inteiro ou uma linha
+  por condado, com ZipCodes nos condados parciais
+
+A escala 1x tem cerca de 1% das PUFs de 2016 (~80 mil linhas de Rate e ~100 mil
+de Benefits_Cost_Sharing); o número de emissores cresce com a escala e, com
+ele, todas as cardinalidades. Os IDs de área de serviço são únicos por estado
+(na PUF real eles se repetem entre emissores), para o join por ServiceAreaId
+da tb_silver_service_area crescer linearmente com a escala.
+
+A saída inclui `manifest.json` com linhas e bytes de cada arquivo. Com
+`--upload`, o diretório é compactado como o `raw_download` faz e gravado na
+landing (`landing-test-edb/health-insurance-marketplace`) do armazenamento
+configurado em OBJECT_STORE / OBJECT_STORE_ROOT.
+
+Uso:
+    python app/benchmarks/generate_puf.py --scale 10 --output /tmp/puf_10x
+    OBJECT_STORE=local OBJECT_STORE_ROOT=app/.object_store \\
+        python app/benchmarks/generate_puf.py --scale 1 --output /tmp/puf_1x --upload
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+from typing import Dict, Iterator, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, "..", "trusted"))
+
+import numpy as np
+import pandas as pd
+
+import tb_silver_rate
+import tb_silver_plan_attributes
+import tb_silver_business_rules
+import tb_silver_benefits_cost_sharing
+
+# Configurações
+LANDING_BUCKET = "landing-test-edb"
+LANDING_KEY = "health-insurance-marketplace"
+EMISSORES_1X = 30
+COMPONENTES_POR_LOTE = 500  # planos-padrão por lote de escrita das tabelas grandes
+
+# Arquivo -> (ano, caminho no dataset do Kaggle)
+ARQUIVOS = {
+    "Rate": ("2016", "raw/2016/Rate_PUF_2015-12-08.csv"),
+    "Plan_Attributes": ("2016", "raw/2016/Plan_Attributes_PUF_2015-12-08.csv"),
+    "Benefits_Cost_Sharing": ("2016", "raw/2016/Benefits_Cost_Sharing_PUF_2015-12-08.csv"),
+    "Business_Rules": ("2016", "raw/2016/Business_Rules_PUF_2015-12-08.csv"),
+    "ServiceArea": ("2016", "raw/2016/ServiceArea_PUF_2015-12-08.csv"),
+    "Service_Area": ("2015", "raw/2015/Service_Area_PUF.csv"),
+}
+
+# Colunas das PUFs: as selecionadas pelas etapas trusted, mais as que elas descartam
+COLUNAS = {
+    "Rate": tb_silver_rate.COLUMNS,
+    "Plan_Attributes": tb_silver_plan_attributes.COLUMNS,
+    "Benefits_Cost_Sharing": tb_silver_benefits_cost_sharing.COLUMNS + [
+        "IsEHB", "IsStateMandate", "IsCovered", "QuantLimitOnSvc", "LimitQty", "LimitUnit", "MinimumStay",
+        "Exclusions", "Explanation", "EHBVarReason", "IsExclFromInnMOOP", "IsExclFromOonMOOP", "RowNumber",
+    ],
+    "Business_Rules": tb_silver_business_rules.COLUMNS + ["DentalOnlyPlan"],
+    "ServiceArea": [
+        "BusinessYear", "StateCode", "IssuerId", "SourceName", "VersionNum", "ImportDate", "IssuerId2",
+        "StateCode2", "ServiceAreaId", "ServiceAreaName", "CoverEntireState", "County", "PartialCounty",
+        "ZipCodes", "PartialCountyJustification", "RowNumber", "MarketCoverage", "DentalOnlyPlan",
+    ],
+}
+COLUNAS["Service_Area"] = COLUNAS["ServiceArea"]
+
+# Estados do FFM em 2016 e os seus códigos FIPS (base dos códigos de condado)
+FIPS = {
+    "AK": 2, "AL": 1, "AR": 5, "AZ": 4, "DE": 10, "FL": 12, "GA": 13, "HI": 15, "IA": 19, "IL": 17,
+    "IN": 18, "KS": 20, "LA": 22, "ME": 23, "MI": 26, "MO": 29, "MS": 28, "MT": 30, "NC": 37, "ND": 38,
+    "NE": 31, "NH": 33, "NJ": 34, "NM": 35, "NV": 32, "OH": 39, "OK": 40, "OR": 41, "PA": 42, "SC": 45,
+    "SD": 46, "TN": 47, "TX": 48, "UT": 49, "VA": 51, "WI": 55, "WV": 54, "WY": 56,
+}
+ESTADOS = np.array(list(FIPS))
+
+IDADES = np.array(["0-20"] + [str(idade) for idade in range(21, 64)] + ["64 and over"])
+# Curva de idade padrão federal (fator sobre o preço aos 21 anos)
+FATOR_IDADE = np.interp(np.r_[20, np.arange(21, 64), 64], [20, 21, 25, 30, 40, 50, 60, 64],
+                        [0.635, 1.0, 1.004, 1.135, 1.278, 1.786, 2.714, 3.0])
+
+NIVEIS_MEDICOS = ["Bronze", "Silver", "Gold", "Platinum", "Catastrophic"]
+VALOR_ATUARIAL = {"Bronze": 61.0, "Silver": 70.5, "Gold": 80.0, "Platinum": 89.5, "Catastrophic": 57.0,
+                  "High": 85.0, "Low": 70.0}
+VARIANTES_CSR = {
+    "00": "Standard {} Off Exchange Plan",
+    "01": "Standard {} On Exchange Plan",
+    "02": "Zero Cost Sharing Plan Variation",
+    "03": "Limited Cost Sharing Plan Variation",
+    "04": "73% AV Level Silver Plan",
+    "05": "87% AV Level Silver Plan",
+    "06": "94% AV Level Silver Plan",
+}
+
+BENEFICIOS = [
+    "Primary Care Visit to Treat an Injury or Illness", "Specialist Visit",
+    "Other Practitioner Office Visit (Nurse, Physician Assistant)",
+    "Outpatient Facility Fee (e.g.,  Ambulatory Surgery Center)", "Outpatient Surgery Physician/Surgical Services",
+    "Hospice Services", "Routine Dental Services (Adult)", "Infertility Treatment",
+    "Long-Term/Custodial Nursing Home Care", "Private-Duty Nursing", "Routine Eye Exam (Adult)",
+    "Urgent Care Centers or Facilities", "Home Health Care Services", "Emergency Room Services",
+    "Emergency Transportation/Ambulance", "Inpatient Hospital Services (e.g., Hospital Stay)",
+    "Inpatient Physician and Surgical Services", "Bariatric Surgery", "Cosmetic Surgery",
+    "Skilled Nursing Facility", "Prenatal and Postnatal Care",
+    "Delivery and All Inpatient Services for Maternity Care", "Mental/Behavioral Health Outpatient Services",
+    "Mental/Behavioral Health Inpatient Services", "Substance Abuse Disorder Outpatient Services",
+    "Substance Abuse Disorder Inpatient Services", "Generic Drugs", "Preferred Brand Drugs",
+    "Non-Preferred Brand Drugs", "Specialty Drugs", "Outpatient Rehabilitation Services", "Habilitation Services",
+    "Chiropractic Care", "Durable Medical Equipment", "Hearing Aids", "Imaging (CT/PET Scans, MRIs)",
+    "Preventive Care/Screening/Immunization", "Routine Foot Care", "Acupuncture", "Weight Loss Programs",
+    "Routine Eye Exam for Children", "Eye Glasses for Children", "Dental Check-Up for Children",
+    "Rehabilitative Speech Therapy", "Rehabilitative Occupational and Rehabilitative Physical Therapy",
+    "Well Baby Visits and Care", "Laboratory Outpatient and Professional Services",
+    "X-rays and Diagnostic Imaging", "Basic Dental Care - Child", "Orthodontia - Child",
+    "Major Dental Care - Child", "Transplant", "Accidental Dental", "Dialysis", "Allergy Testing",
+    "Chemotherapy", "Radiation", "Diabetes Education", "Prosthetic Devices", "Infusion Therapy",
+    "Treatment for Temporomandibular Joint Disorders", "Nutritional Counseling", "Reconstructive Surgery",
+]
+COPAYS = np.array(["No Charge", "No Charge after deductible", "$25.00", "$40.00", "$50.00 Copay after deductible",
+                   "$250.00 Copay per Day", "$10.00 Copay before deductible", "Not Applicable"])
+COINSURANCES = np.array(["0.00%", "20.00%", "30.00% Coinsurance after deductible", "40.00%",
+                         "No Charge", "No Charge after deductible", "Not Applicable"])
+
+REGRAS_NEGOCIO = {
+    "EnrolleeContractRateDeterminationRule": [
+        "A different rate (specifically a \"family tier rate\") is applied based on the enrollee's relationship "
+        "to the subscriber.",
+        "There are rates specifically for couples and for families (not just addition of individual rates)",
+        "A different rate (specifically a \"per member rate\") is applied based on the enrollee's age and "
+        "tobacco use.",
+    ],
+    "TwoParentFamilyMaxDependentsRule": ["3 or more", "", "1"],
+    "SingleParentFamilyMaxDependentsRule": ["3 or more", "", "2"],
+    "DependentMaximumAgRule": ["26", "25", ""],
+    "ChildrenOnlyContractMaxChildrenRule": ["3 or more", "1", ""],
+    "DomesticPartnerAsSpouseIndicator": ["Yes", "No"],
+    "SameSexPartnerAsSpouseIndicator": ["Yes", "No"],
+    "AgeDeterminationRule": [
+        "Age on effective date", "Age on January 1st of the effective date year",
+        "Age on insurance date (age on birthday nearest the effective date)",
+    ],
+    "MinimumTobaccoFreeMonthsRule": ["6", "12", ""],
+    "CohabitationRule": ["", "Spouse", "Spouse, Domestic Partner"],
+}
+
+
+# ========== CATÁLOGO ==========
+def _sequencia(contagens: np.ndarray) -> np.ndarray:
+    """1, 2, ..., n para cada grupo, com os grupos de tamanho `contagens` em sequência."""
+    return np.arange(contagens.sum()) - np.repeat(np.cumsum(contagens) - contagens, contagens) + 1
+
+
+def _codigo(numeros: np.ndarray) -> pd.Series:
+    return pd.Series(numeros).map("{:03d}".format)
+
+
+def _expandir(pais: pd.DataFrame, contagens: np.ndarray) -> pd.DataFrame:
+    """Repete cada linha de `pais` `contagens` vezes e numera as cópias em 'Seq'."""
+    filhos = pais.iloc[np.repeat(np.arange(len(pais)), contagens)].reset_index(drop=True)
+    filhos["Seq"] = _sequencia(contagens)
+    return filhos
+
+
+def gerar_catalogo(escala: float, seed: int) -> Dict[str, pd.DataFrame]:
+    """
+    Gera as entidades de onde saem todas as tabelas: emissores, áreas de serviço,
+    condados das áreas, planos-padrão e variantes.
+    """
+    rng = np.random.default_rng(seed)
+    n = max(1, round(EMISSORES_1X * escala))
+
+    importacao = pd.Timestamp("2015-06-01") + pd.to_timedelta(rng.integers(0, 120 * 86400, n), unit="s")
+    emissores = pd.DataFrame({
+        "IssuerId": rng.choice(np.arange(10000, 100000), n, replace=False),
+        "StateCode": rng.choice(ESTADOS, n),
+        "SourceName": rng.choice(["HIOS", "SERFF", "OPM"], n, p=[0.6, 0.35, 0.05]),
+        "VersionNum": rng.integers(1, 20, n),
+        "ImportDate": importacao.strftime("%Y-%m-%d %H:%M:%S"),
+        "TIN": [f"{a:02d}-{b:07d}" for a, b in zip(rng.integers(10, 99, n), rng.integers(0, 10**7, n))],
+        "MarketCoverage": rng.choice(["Individual", "SHOP (Small Group)"], n, p=[0.7, 0.3]),
+        "DentalOnlyPlan": rng.choice(["No", "Yes"], n, p=[0.8, 0.2]),
+    })
+
+    # Áreas de serviço: numeradas por estado, o estado inteiro ou uma lista de condados
+    areas = _expandir(emissores, 1 + rng.poisson(1, n))
+    areas["ServiceAreaId"] = areas["StateCode"] + "S" + (areas.groupby("StateCode").cumcount() + 1).map("{:03d}".format)
+    areas["ServiceAreaName"] = "Service Area " + areas["Seq"].astype(str)
+    areas["CoverEntireState"] = rng.choice(["Yes", "No"], len(areas), p=[0.3, 0.7])
+    inteiro = areas["CoverEntireState"].to_numpy() == "Yes"
+
+    condados = _expandir(areas, np.where(inteiro, 1, 1 + rng.poisson(6, len(areas))))
+    parcial = (condados["CoverEntireState"].to_numpy() == "No") & (rng.random(len(condados)) < 0.15)
+    fips = condados["StateCode"].map(FIPS).to_numpy() * 1000 + rng.integers(0, 100, len(condados)) * 2 + 1
+    estado_inteiro = condados["CoverEntireState"].to_numpy() == "Yes"
+    condados["County"] = pd.Series(fips, dtype="Int64").mask(estado_inteiro)
+    condados["PartialCounty"] = np.where(estado_inteiro, "", np.where(parcial, "Yes", "No"))
+    base_cep = condados["StateCode"].map(FIPS).to_numpy() * 1500 + 1000
+    condados["ZipCodes"] = [
+        ",".join(f"{cep:05d}" for cep in base + rng.choice(1500, k, replace=False)) if flag else ""
+        for base, k, flag in zip(base_cep, rng.integers(2, 13, len(condados)), parcial)
+    ]
+    condados["PartialCountyJustification"] = np.where(
+        parcial, "The service area is limited by the provider network in the county.", "")
+
+    # Produtos, planos-padrão e variantes
+    produtos = _expandir(emissores, 1 + rng.poisson(2, n))
+    produtos["ProductId"] = produtos["IssuerId"].astype(str) + produtos["StateCode"] + produtos["Seq"].map("{:03d}".format)
+    componentes = _expandir(produtos, 1 + rng.poisson(4, len(produtos)))
+    c = len(componentes)
+    componentes["StandardComponentId"] = componentes["ProductId"] + componentes["Seq"].map("{:04d}".format)
+    dental = componentes["DentalOnlyPlan"].to_numpy() == "Yes"
+    componentes["MetalLevel"] = np.where(dental, rng.choice(["High", "Low"], c),
+                                         rng.choice(NIVEIS_MEDICOS, c, p=[0.3, 0.35, 0.2, 0.05, 0.1]))
+    componentes["PlanType"] = rng.choice(["HMO", "PPO", "EPO", "POS"], c, p=[0.4, 0.3, 0.2, 0.1])
+    componentes["RatingAreas"] = rng.integers(1, 8, c)
+    componentes["Tobacco"] = np.where(dental | (rng.random(c) < 0.3), "No Preference", "Tobacco User/Non-Tobacco User")
+    componentes["FamilyOption"] = rng.random(c) < 0.02
+    componentes["BasePremium"] = np.where(dental, rng.uniform(15, 45, c), rng.uniform(160, 420, c))
+    componentes["Deductible"] = rng.choice([0, 500, 1000, 2000, 3500, 5000, 6850], c)
+    por_emissor = areas.groupby("IssuerId")["ServiceAreaId"].agg(list)
+    componentes["ServiceAreaId"] = [ids[rng.integers(len(ids))] for ids in por_emissor.loc[componentes["IssuerId"]]]
+    componentes["NetworkId"] = componentes["StateCode"] + "N" + _codigo(rng.integers(1, 30, c))
+    componentes["FormularyId"] = np.where(dental, "", componentes["StateCode"] + "F" + _codigo(rng.integers(1, 30, c)))
+
+    # Variantes: 01 (dental só 01), 02 e 03; 04 a 06 no Silver; às vezes 00, fora do exchange
+    componentes["OnExchange"] = np.where(dental, 1, np.where(componentes["MetalLevel"].to_numpy() == "Silver", 6, 3))
+    planos = _expandir(componentes, componentes["OnExchange"].to_numpy() + (rng.random(c) < 0.4))
+    planos["Variant"] = np.where(planos["Seq"].to_numpy() > planos["OnExchange"].to_numpy(), "00",
+                                 planos["Seq"].map("{:02d}".format))
+    planos["PlanId"] = planos["StandardComponentId"] + "-" + planos["Variant"]
+    planos["CSRVariationType"] = [VARIANTES_CSR[v].format(m) for v, m in zip(planos["Variant"], planos["MetalLevel"])]
+
+    return {"emissores": emissores, "areas": areas, "condados": condados,
+            "componentes": componentes, "planos": planos}
+
+
+# ========== TABELAS ==========
+def _comuns(base: pd.DataFrame, ano: str) -> Dict[str, object]:
+    return {
+        "BusinessYear": ano, "StateCode": base["StateCode"], "IssuerId": base["IssuerId"],
+        "SourceName": base["SourceName"], "VersionNum": base["VersionNum"], "ImportDate": base["ImportDate"],
+        "IssuerId2": base["IssuerId"], "StateCode2": base["StateCode"],
+    }
+
+
+def _lotes(tabela: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    for inicio in range(0, len(tabela), COMPONENTES_POR_LOTE):
+        yield tabela.iloc[inicio:inicio + COMPONENTES_POR_LOTE]
+
+
+def gerar_rate(catalogo: Dict[str, pd.DataFrame], ano: str, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+    """Um preço por plano-padrão, área de avaliação e idade; 'Family Option' com preços por composição familiar."""
+    for lote in _lotes(catalogo["componentes"]):
+        por_area = _expandir(lote, lote["RatingAreas"].to_numpy()).rename(columns={"Seq": "RatingArea"})
+        familia = por_area["FamilyOption"].to_numpy()
+        idades = np.where(familia, 1, len(IDADES))
+        linhas = _expandir(por_area, idades)
+        posicao = linhas["Seq"].to_numpy() - 1
+        familia = linhas["FamilyOption"].to_numpy()
+        n = len(linhas)
+
+        fator = np.where(familia, 1.0, FATOR_IDADE[posicao])
+        preco = np.round(linhas["BasePremium"].to_numpy() * fator * (1 + 0.04 * (linhas["RatingArea"].to_numpy() - 1))
+                         * rng.uniform(0.97, 1.03, n), 2)
+        fumante = linhas["Tobacco"].to_numpy() == "Tobacco User/Non-Tobacco User"
+        em_familia = {coluna: np.where(familia, np.round(preco * multiplo, 2), np.nan) for coluna, multiplo in [
+            ("Couple", 2.0), ("PrimarySubscriberAndOneDependent", 1.8), ("PrimarySubscriberAndTwoDependents", 2.5),
+            ("PrimarySubscriberAndThreeOrMoreDependents", 3.1), ("CoupleAndOneDependent", 2.8),
+            ("CoupleAndTwoDependents", 3.5), ("CoupleAndThreeOrMoreDependents", 4.1)]}
+
+        yield pd.DataFrame({
+            **_comuns(linhas, ano),
+            "FederalTIN": linhas["TIN"],
+            "RateEffectiveDate": f"{ano}-01-01",
+            "RateExpirationDate": f"{ano}-12-31",
+            "PlanId": linhas["StandardComponentId"],
+            "RatingAreaId": "Rating Area " + linhas["RatingArea"].astype(str),
+            "Tobacco": linhas["Tobacco"],
+            "Age": np.where(familia, "Family Option", IDADES[np.where(familia, 0, posicao)]),
+            "IndividualRate": preco,
+            "IndividualTobaccoRate": np.where(fumante & ~familia, np.round(preco * 1.2, 2), np.nan),
+            **em_familia,
+        })
+
+
+def gerar_benefits(catalogo: Dict[str, pd.DataFrame], ano: str, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+    """Uma linha por variante e benefício, com copay/coinsurance no texto da PUF."""
+    beneficios = np.array(BENEFICIOS)
+    for lote in _lotes(catalogo["planos"]):
+        linhas = _expandir(lote, np.full(len(lote), len(beneficios)))
+        n = len(linhas)
+        coberto = rng.random(n) < 0.85
+        limitado = coberto & (rng.random(n) < 0.15)
+        yield pd.DataFrame({
+            **_comuns(linhas, ano),
+            "StandardComponentId": linhas["StandardComponentId"],
+            "PlanId": linhas["PlanId"],
+            "BenefitName": beneficios[linhas["Seq"].to_numpy() - 1],
+            "CopayInnTier1": np.where(coberto, rng.choice(COPAYS, n), ""),
+            "CopayInnTier2": np.where(coberto & (rng.random(n) < 0.1), rng.choice(COPAYS, n), ""),
+            "CopayOutofNet": np.where(coberto, rng.choice(COPAYS, n), ""),
+            "CoinsInnTier1": np.where(coberto, rng.choice(COINSURANCES, n), ""),
+            "CoinsInnTier2": np.where(coberto & (rng.random(n) < 0.1), rng.choice(COINSURANCES, n), ""),
+            "CoinsOutofNet": np.where(coberto, rng.choice(COINSURANCES, n), ""),
+            "IsEHB": np.where(coberto & (rng.random(n) < 0.8), "Yes", ""),
+            "IsStateMandate": np.where(rng.random(n) < 0.05, "Yes", ""),
+            "IsCovered": np.where(coberto, "Covered", "Not Covered"),
+            "QuantLimitOnSvc": np.where(coberto, np.where(limitado, "Yes", "No"), ""),
+            "LimitQty": pd.Series(rng.integers(1, 60, n), dtype="Int64").where(limitado),
+            "LimitUnit": np.where(limitado, rng.choice(["Visit(s) per Year", "Day(s) per Year", "Item(s) per Year"], n), ""),
+            "MinimumStay": "",
+            "Exclusions": np.where(coberto & (rng.random(n) < 0.1), "See policy for exclusions.", ""),
+            "Explanation": np.where(coberto & (rng.random(n) < 0.1), "Prior authorization required.", ""),
+            "EHBVarReason": np.where(coberto & (rng.random(n) < 0.05), "Substantially Equal", ""),
+            "IsExclFromInnMOOP": np.where(coberto, rng.choice(["No", "Yes"], n, p=[0.95, 0.05]), ""),
+            "IsExclFromOonMOOP": np.where(coberto, rng.choice(["No", "Yes"], n, p=[0.7, 0.3]), ""),
+        })
+
+
+def _dinheiro(valores: np.ndarray) -> np.ndarray:
+    return np.array([f"${valor:,}" for valor in valores], dtype=object)
+
+
+def gerar_plan_attributes(catalogo: Dict[str, pd.DataFrame], ano: str, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+    """Uma linha por variante; as colunas de MOOP, dedutível e SBC seguem o formato '$6,850' da PUF."""
+    planos = catalogo["planos"]
+    n = len(planos)
+    dedutivel = planos["Deductible"].to_numpy()
+    moop = np.minimum(6850, dedutivel + rng.choice([1000, 2000, 3000, 4000], n))
+
+    def sim_nao(p: float) -> np.ndarray:
+        return rng.choice(["Yes", "No"], n, p=[p, 1 - p])
+
+    dados = {
+        **_comuns(planos, ano),
+        "BenefitPackageId": 1,
+        "MarketCoverage": planos["MarketCoverage"],
+        "DentalOnlyPlan": planos["DentalOnlyPlan"],
+        "TIN": planos["TIN"],
+        "StandardComponentId": planos["StandardComponentId"],
+        "PlanMarketingName": planos["MetalLevel"] + " " + planos["PlanType"] + " " + planos["Deductible"].astype(str),
+        "HIOSProductId": planos["ProductId"],
+        "HPID": "",
+        "NetworkId": planos["NetworkId"],
+        "ServiceAreaId": planos["ServiceAreaId"],
+        "FormularyId": planos["FormularyId"],
+        "IsNewPlan": rng.choice(["New", "Existing"], n, p=[0.3, 0.7]),
+        "PlanType": planos["PlanType"],
+        "MetalLevel": planos["MetalLevel"],
+        "UniquePlanDesign": sim_nao(0.1),
+        "QHPNonQHPTypeId": rng.choice(["Both", "On Exchange", "Off Exchange"], n, p=[0.6, 0.3, 0.1]),
+        "ChildOnlyOffering": rng.choice(["Allows Adult and Child-Only", "Allows Adult-Only", "Allows Child-Only"], n),
+        "ChildOnlyPlanId": "",
+        "EHBPercentTotalPremium": np.round(rng.uniform(0.98, 1.0, n), 4),
+        "PlanEffictiveDate": f"{ano}-01-01",
+        "PlanExpirationDate": f"{ano}-12-31",
+        "OutOfCountryCoverageDescription": np.where(rng.random(n) < 0.3, "Emergency services only", ""),
+        "OutOfServiceAreaCoverageDescription": np.where(rng.random(n) < 0.3, "Emergency and urgent care only", ""),
+        "PlanId": planos["PlanId"],
+        "CSRVariationType": planos["CSRVariationType"],
+        "IssuerActuarialValue": [f"{VALOR_ATUARIAL[m] + d:.2f}%" for m, d in
+                                 zip(planos["MetalLevel"], rng.uniform(-1.5, 1.5, n))],
+        "FirstTierUtilization": "100%",
+        "SecondTierUtilization": "",
+        "IsHSAEligible": np.where(planos["MetalLevel"] == "Bronze", sim_nao(0.5), "No"),
+    }
+
+    for coluna in COLUNAS["Plan_Attributes"]:
+        if coluna in dados:
+            continue
+        if coluna.startswith(("MEHB", "DEHB", "TEHB", "SBC")):
+            if "Coinsurance" in coluna:
+                dados[coluna] = rng.choice(["20.00%", "30.00%", "0.00%", "Not Applicable"], n)
+            else:
+                valores = moop if "MOOP" in coluna else dedutivel
+                valores = valores * 2 if "PerGroup" in coluna else valores
+                dados[coluna] = np.where(rng.random(n) < 0.3, "Not Applicable", _dinheiro(valores))
+        elif "URL" in coluna or coluna == "PlanBrochure":
+            dados[coluna] = "https://www.issuer" + planos["IssuerId"].astype(str) + ".com/" + coluna.lower()
+        elif coluna.startswith("Is") or coluna.endswith(("Offered", "Integrated", "Tiers", "Coverage", "Network")):
+            dados[coluna] = sim_nao(0.5)
+        else:
+            dados[coluna] = ""
+    yield pd.DataFrame(dados)
+
+
+def gerar_business_rules(catalogo: Dict[str, pd.DataFrame], ano: str, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+    """Uma linha por plano-padrão, com as regras em texto livre da PUF."""
+    componentes = catalogo["componentes"]
+    n = len(componentes)
+    yield pd.DataFrame({
+        **_comuns(componentes, ano),
+        "TIN": componentes["TIN"],
+        "ProductId": componentes["ProductId"],
+        "StandardComponentId": componentes["StandardComponentId"],
+        **{coluna: rng.choice(opcoes, n) for coluna, opcoes in REGRAS_NEGOCIO.items()},
+        "MarketCoverage": componentes["MarketCoverage"],
+        "DentalOnlyPlan": componentes["DentalOnlyPlan"],
+    })
+
+
+def gerar_service_area(catalogo: Dict[str, pd.DataFrame], ano: str, rng: np.random.Generator) -> Iterator[pd.DataFrame]:
+    """O estado inteiro (sem County) ou uma linha por condado, com ZipCodes nos parciais."""
+    condados = catalogo["condados"]
+    yield pd.DataFrame({
+        **_comuns(condados, ano),
+        "ServiceAreaId": condados["ServiceAreaId"],
+        "ServiceAreaName": condados["ServiceAreaName"],
+        "CoverEntireState": condados["CoverEntireState"],
+        "County": condados["County"],
+        "PartialCounty": condados["PartialCounty"],
+        "ZipCodes": condados["ZipCodes"],
+        "PartialCountyJustification": condados["PartialCountyJustification"],
+        "MarketCoverage": condados["MarketCoverage"],
+        "DentalOnlyPlan": condados["DentalOnlyPlan"],
+    })
+
+
+GERADORES = {
+    "Rate": gerar_rate,
+    "Plan_Attributes": gerar_plan_attributes,
+    "Benefits_Cost_Sharing": gerar_benefits,
+    "Business_Rules": gerar_business_rules,
+    "ServiceArea": gerar_service_area,
+    "Service_Area": gerar_service_area,
+}
+
+
+# ========== ESCRITA ==========
+def escrever_csv(lotes: Iterator[pd.DataFrame], colunas: List[str], caminho: str) -> int:
+    """Grava os lotes em um CSV com as colunas da PUF, numerando RowNumber; devolve o número de linhas."""
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    linhas = 0
+    with open(caminho, "w", newline="") as f:
+        for lote in lotes:
+            lote["RowNumber"] = np.arange(linhas + 1, linhas + len(lote) + 1)
+            lote.reindex(columns=colunas).to_csv(f, index=False, header=linhas == 0)
+            linhas += len(lote)
+    return linhas
+
+
+def gerar_puf(saida: str, escala: float = 1, seed: int = 42) -> Dict:
+    """
+    Gera todos os arquivos em `saida` e grava `manifest.json`.
+
+    Returns:
+    Dict: Escala, seed e, por arquivo, caminho, linhas e bytes.
+    """
+    catalogo = gerar_catalogo(escala, seed)
+    manifesto = {"scale": escala, "seed": seed, "files": {}}
+    for indice, (nome, (ano, relativo)) in enumerate(ARQUIVOS.items()):
+        rng = np.random.default_rng([seed, indice])
+        caminho = os.path.join(saida, relativo)
+        linhas = escrever_csv(GERADORES[nome](catalogo, ano, rng), COLUNAS[nome], caminho)
+        manifesto["files"][nome] = {"path": relativo, "rows": linhas, "bytes": os.path.getsize(caminho)}
+        logging.info(f"{relativo}: {linhas} linhas, {os.path.getsize(caminho) / 2**20:.1f} MB")
+
+    with open(os.path.join(saida, "manifest.json"), "w") as f:
+        json.dump(manifesto, f, indent=2)
+    return manifesto
+
+
+def publicar(saida: str, store) -> str:
+    """Compacta `saida` como o `raw_download` e grava o zip na landing; devolve o caminho do zip."""
+    zip_path = shutil.make_archive(saida.rstrip(os.sep), "zip", saida)
+    store.create_bucket(LANDING_BUCKET)
+    store.upload(LANDING_BUCKET, LANDING_KEY, zip_path)
+    logging.info(f"{zip_path} gravado em {LANDING_BUCKET}/{LANDING_KEY}")
+    return zip_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1, help="fator de escala (1x ~ 1%% das PUFs de 2016)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True, help="pasta de saída")
+    parser.add_argument("--upload", action="store_true", help="grava o zip na landing do armazenamento configurado")
+    args = parser.parse_args()
+
+    manifesto = gerar_puf(args.output, args.scale, args.seed)
+    if args.upload:
+        import object_store
+        publicar(args.output, object_store.get_store())
+    print(json.dumps(manifesto, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Tabela fato desnormalizada de plano, preço e benefício (tb_gold_fact_plan_rate_benefit).
+
+Junta uma única vez rate, benefits_cost_sharing e plan_attributes; as tabelas de
+entrega que antes repetiam esse join (tb_gold_benefits_rates_by_state e
+tb_gold_benefits_vs_rates) passam a ser projeções sobre a fato.
+
+Grão: uma linha por par (rate, benefício) com as mesmas chaves
+StandardComponentKey, StateCode, BusinessYear e IssuerKey, enriquecida com os
+atributos do plano (left join em PlanKey, BusinessYear e IssuerKey;
+`HasPlanAttributes` indica se houve correspondência). As colunas que só algumas
+queries usam no join (SourceName, VersionNum, IssuerId2) vêm dos dois lados,
+com prefixo Rate/Benefit, para serem filtradas na projeção.
+
+A definição SQL equivalente, usada pelo Athena, é o primeiro CTAS de
+`athena_queries.txt`. Localmente a tabela é construída com um sort-merge join
+vetorizado (numpy/pyarrow): as chaves compostas viram um código int64 que
+preserva a ordem, cada lado é ordenado (ou reaproveitado, se já estiver
+ordenado) e os grupos de chaves iguais são cruzados sem laços em Python. A
+saída fica ordenada pelas chaves do join.
+
+A fato é gravada no perfil `tb_gold_fact_plan_rate_benefit` de `parquet_layout`
+(camada trusted), clusterizada pelas chaves das consultas da gold, substituindo
+o conteúdo anterior do diretório da tabela.
+
+Requer:
+- Bibliotecas: duckdb, numpy, pyarrow
+- Módulos da camada trusted (parquet_layout e dependências), em ../trusted
+"""
+
+import os
+import sys
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs as pafs
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trusted"))
+import parquet_layout
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+FACT_TABLE = "tb_gold_fact_plan_rate_benefit"
+
+RATE_KEYS = ["StandardComponentKey", "StateCode", "BusinessYear", "IssuerKey"]
+PLAN_KEYS = ["PlanKey", "BusinessYear", "IssuerKey"]
+
+# Colunas lidas de cada tabela base: coluna de origem -> coluna na fato
+RATE_COLUMNS = {
+    "StandardComponentKey": "StandardComponentKey",
+    "StateCode": "StateCode",
+    "BusinessYear": "BusinessYear",
+    "IssuerKey": "IssuerKey",
+    "IssuerId": "RateIssuerId",
+    "PlanId": "RatePlanId",
+    "SourceName": "RateSourceName",
+    "VersionNum": "RateVersionNum",
+    "IssuerId2": "RateIssuerId2",
+    "IndividualRate": "IndividualRate",
+    "IndividualTobaccoRate": "IndividualTobaccoRate",
+}
+BENEFIT_COLUMNS = {
+    "StandardComponentKey": "StandardComponentKey",
+    "StateCode": "StateCode",
+    "BusinessYear": "BusinessYear",
+    "IssuerKey": "IssuerKey",
+    "IssuerId": "BenefitIssuerId",
+    "PlanId": "PlanId",
+    "PlanKey": "PlanKey",
+    "StandardComponentId": "StandardComponentId",
+    "SourceName": "BenefitSourceName",
+    "VersionNum": "BenefitVersionNum",
+    "IssuerId2": "BenefitIssuerId2",
+    "BenefitName": "BenefitName",
+    "CopayInnTier1": "CopayInnTier1",
+    "CoinsInnTier1": "CoinsInnTier1",
+}
+PLAN_COLUMNS = {
+    "PlanKey": "PlanKey",
+    "BusinessYear": "BusinessYear",
+    "IssuerKey": "IssuerKey",
+    "IssuerId": "PlanIssuerId",
+    "PlanMarketingName": "PlanMarketingName",
+    "MetalLevel": "MetalLevel",
+    "PlanType": "PlanType",
+    "NetworkId": "NetworkId",
+}
+
+
+# ========== SORT-MERGE JOIN ==========
+def encode_keys(left: pa.Table, right: pa.Table, keys: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Codifica chaves compostas dos dois lados em int64 que preservam a ordem lexicográfica.
+
+    Cada coluna recebe um rank denso calculado sobre os dois lados juntos; os ranks
+    são combinados em base mista e recompactados sempre que o código cresceria além
+    de 2^31. Linhas com alguma chave nula recebem -1 (não casam, como no SQL).
+
+    Returns:
+    Tuple[np.ndarray, np.ndarray]: Códigos da esquerda e da direita.
+    """
+    n_left = left.num_rows
+    codes = np.zeros(n_left + right.num_rows, dtype=np.int64)
+    nulls = np.zeros(len(codes), dtype=bool)
+    cardinality = 1
+
+    for key in keys:
+        left_column, right_column = left.column(key), right.column(key)
+        if left_column.type != right_column.type:
+            right_column = right_column.cast(left_column.type)
+        column = pa.chunked_array(left_column.chunks + right_column.chunks, type=left_column.type)
+        ranks = pc.rank(column, sort_keys="ascending", tiebreaker="dense").to_numpy().astype(np.int64) - 1
+        nulls |= column.is_null().to_numpy(zero_copy_only=False)
+        size = int(ranks.max()) + 1 if len(ranks) else 1
+
+        if cardinality * size >= 2**31:
+            unique_codes, codes = np.unique(codes, return_inverse=True)
+            cardinality = len(unique_codes)
+        codes = codes * size + ranks
+        cardinality *= size
+
+    codes[nulls] = -1
+    return codes[:n_left], codes[n_left:]
+
+
+def _sorted_order(codes: np.ndarray) -> np.ndarray:
+    """Ordem que classifica os códigos; identidade se a entrada já estiver ordenada."""
+    if len(codes) < 2 or np.all(codes[1:] >= codes[:-1]):
+        return np.arange(len(codes))
+    return np.argsort(codes, kind="stable")
+
+
+def _groups(sorted_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Chaves distintas, posição inicial e tamanho de cada grupo num vetor ordenado."""
+    unique, starts, counts = np.unique(sorted_codes, return_index=True, return_counts=True)
+    valid = unique >= 0
+    return unique[valid], starts[valid], counts[valid]
+
+
+def merge_join(left_codes: np.ndarray, right_codes: np.ndarray, how: str = "inner") -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Sort-merge join sobre códigos de chave.
+
+    Args:
+    left_codes (np.ndarray): Códigos da esquerda (de `encode_keys`).
+    right_codes (np.ndarray): Códigos da direita.
+    how (str): 'inner' ou 'left'.
+
+    Returns:
+    Tuple[np.ndarray, Optional[np.ndarray]]: Índices da esquerda e da direita de cada linha
+    do resultado. No left join, as linhas sem correspondência têm índice -1 à direita.
+    A saída segue a ordem das chaves; no left join, a ordem original da esquerda.
+    """
+    left_order, right_order = _sorted_order(left_codes), _sorted_order(right_codes)
+    left_keys, left_starts, left_counts = _groups(left_codes[left_order])
+    right_keys, right_starts, right_counts = _groups(right_codes[right_order])
+    _, left_groups, right_groups = np.intersect1d(left_keys, right_keys, assume_unique=True, return_indices=True)
+
+    starts_l, counts_l = left_starts[left_groups], left_counts[left_groups]
+    starts_r, counts_r = right_starts[right_groups], right_counts[right_groups]
+
+    # Cada linha da esquerda de um grupo é repetida pelo tamanho do grupo da direita
+    sizes = counts_l * counts_r
+    total = int(sizes.sum())
+    group_of_row = np.repeat(np.arange(len(sizes)), sizes)
+    offset = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    repeats_r = counts_r[group_of_row]
+    left_index = left_order[starts_l[group_of_row] + offset // repeats_r]
+    right_index = right_order[starts_r[group_of_row] + offset % repeats_r]
+
+    if how == "inner":
+        return left_index, right_index
+    if how != "left":
+        raise ValueError(f"Tipo de join não suportado: {how}")
+
+    matched = np.zeros(len(left_codes), dtype=bool)
+    matched[left_index] = True
+    unmatched = np.flatnonzero(~matched)
+    left_index = np.concatenate([left_index, unmatched])
+    right_index = np.concatenate([right_index, np.full(len(unmatched), -1, dtype=np.int64)])
+    order = np.argsort(left_index, kind="stable")
+    return left_index[order], right_index[order]
+
+
+def _take(table: pa.Table, columns: Dict[str, str], indices: np.ndarray, skip: Tuple[str, ...] = ()) -> Dict[str, pa.ChunkedArray]:
+    mask = indices < 0
+    take_indices = pa.array(indices, mask=mask) if mask.any() else pa.array(indices)
+    return {target: table.column(source).take(take_indices)
+            for source, target in columns.items() if source in table.column_names and target not in skip}
+
+
+# ========== CONSTRUÇÃO ==========
+def _read(con: duckdb.DuckDBPyConnection, view: str, columns: Dict[str, str]) -> pa.Table:
+    available = {row[0] for row in con.execute(f"DESCRIBE {view}").fetchall()}
+    missing = [column for column in columns if column not in available and column in RATE_KEYS + PLAN_KEYS]
+    if missing:
+        raise ValueError(f"{view} sem as colunas de chave {missing}; rode os jobs trusted com as chaves substitutas")
+    selected = ", ".join(column for column in columns if column in available)
+    return con.execute(f"SELECT {selected} FROM {view}").fetch_arrow_table()
+
+
+def build_fact_table(rate: pa.Table, benefits: pa.Table, plans: pa.Table) -> pa.Table:
+    """
+    Monta a tabela fato a partir das tabelas base em Arrow.
+
+    Returns:
+    pa.Table: A fato, ordenada por StandardComponentKey, StateCode, BusinessYear e IssuerKey.
+    """
+    rate_codes, benefit_codes = encode_keys(rate, benefits, RATE_KEYS)
+    rate_index, benefit_index = merge_join(rate_codes, benefit_codes)
+    columns = _take(rate, RATE_COLUMNS, rate_index)
+    columns.update(_take(benefits, BENEFIT_COLUMNS, benefit_index, skip=tuple(columns)))
+    fact = pa.table(columns)
+
+    fact_codes, plan_codes = encode_keys(fact, plans, PLAN_KEYS)
+    fact_index, plan_index = merge_join(fact_codes, plan_codes, how="left")
+    columns = _take(fact, {name: name for name in fact.column_names}, fact_index)
+    columns.update(_take(plans, PLAN_COLUMNS, plan_index, skip=tuple(columns)))
+    columns["HasPlanAttributes"] = pa.chunked_array([pa.array(plan_index >= 0)])
+    return pa.table(columns)
+
+
+def build(con: duckdb.DuckDBPyConnection, output: str) -> Dict:
+    """
+    Constrói a tabela fato a partir das views de `gold_builder.connect` e grava em
+    <output>/tb_gold_fact_plan_rate_benefit/.
+
+    Returns:
+    Dict: Métricas da execução (linhas, segundos, status).
+    """
+    target = f"{output.rstrip('/')}/{FACT_TABLE}"
+    start_time = time.perf_counter()
+    try:
+        rate = _read(con, "tb_gold_rate", RATE_COLUMNS)
+        benefits = _read(con, "tb_gold_benefits_cost_sharing", BENEFIT_COLUMNS)
+        plans = _read(con, "tb_gold_plan_attributes", PLAN_COLUMNS)
+        fact = build_fact_table(rate, benefits, plans)
+
+        # Como o OVERWRITE do gold_builder: nenhum arquivo de uma construção anterior fica na tabela
+        filesystem, path = pafs.FileSystem.from_uri(target if "://" in target else os.path.abspath(target))
+        filesystem.delete_dir_contents(path, missing_dir_ok=True)
+        filesystem.create_dir(path)
+        with filesystem.open_output_stream(f"{path}/data_0.parquet") as sink:
+            parquet_layout.write_table(fact, sink, FACT_TABLE)
+    except (duckdb.Error, ValueError, OSError, pa.ArrowException) as e:
+        logger.error(f"Erro ao construir {FACT_TABLE}: {str(e)}")
+        return {"table": FACT_TABLE, "status": "error", "error": str(e), "seconds": round(time.perf_counter() - start_time, 3)}
+
+    seconds = round(time.perf_counter() - start_time, 3)
+    logger.info(f"{FACT_TABLE} construída em {seconds:.2f} segundos ({fact.num_rows} linhas) -> {target}")
+    return {"table": FACT_TABLE, "status": "ok", "rows": fact.num_rows, "seconds": seconds, "location": target}
@@ -0,0 +1,186 @@
+"""
+Construção local das tabelas de entrega (tb_gold_*) com DuckDB.
+
+Executa os mesmos CTAS de `athena_queries.txt` (e do Step Functions em
+`cloud_formation.yaml`) sem Athena, lendo os arquivos Parquet da camada gold
+em disco local ou no S3 e gravando o resultado de cada query em Parquet.
+O DuckDB paraleliza a leitura e a escrita entre as threads configuradas.
+
+A tabela fato `tb_gold_fact_plan_rate_benefit` (ver `fact_table.py`) é montada
+antes das demais com um sort-merge join e exposta como view para as tabelas
+que são projeções sobre ela.
+
+Cada tabela base é exposta como view com os dois nomes usados nas queries:
+`tb_silver_<tabela>` (athena_queries.txt) e `tb_gold_<tabela>` (cloud_formation.yaml),
+ambas apontando para `<source>/tb_gold_<tabela>/**/*.parquet`.
+
+Requer:
+- Bibliotecas: duckdb (extensões httpfs/aws para caminhos s3://), numpy, pyarrow
+
+Uso:
+    python app/delivery/gold_builder.py --source ./data/delivery --output ./data/delivery_local
+    python app/delivery/gold_builder.py --source s3://delivery-test-edb --output ./out --only tb_gold_rates_by_age
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+import duckdb
+
+import fact_table
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configurações
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "athena_queries.txt")
+BASE_TABLES = ["rate", "benefits_cost_sharing", "plan_attributes", "business_rules", "service_area"]
+
+CTAS_PATTERN = re.compile(
+    r"CREATE\s+TABLE\s+(?P<name>\w+)\s+WITH\s*\((?P<props>.*?)\)\s*AS\s+(?P<select>.*)",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def load_ctas_queries(path: str = QUERIES_PATH) -> Dict[str, str]:
+    """
+    Lê os CTAS do arquivo de queries do Athena.
+
+    Args:
+    path (str): Caminho do arquivo com as instruções CREATE TABLE ... AS SELECT.
+
+    Returns:
+    Dict[str, str]: Nome da tabela de entrega -> SELECT que a produz (na ordem do arquivo).
+    """
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+
+    queries = {}
+    for statement in content.split(";"):
+        match = CTAS_PATTERN.search(statement)
+        if match:
+            queries[match.group("name")] = match.group("select").strip()
+    return queries
+
+
+def _table_glob(source: str, table: str) -> str:
+    return f"{source.rstrip('/')}/tb_gold_{table}/**/*.parquet"
+
+
+def connect(source: str, threads: Optional[int] = None, memory_limit: Optional[str] = None) -> duckdb.DuckDBPyConnection:
+    """
+    Abre uma conexão DuckDB em memória com as views das tabelas base.
+
+    Args:
+    source (str): Diretório local ou URI s3:// com as pastas tb_gold_<tabela>.
+    threads (Optional[int]): Threads usadas nas leituras/escritas paralelas.
+    memory_limit (Optional[str]): Limite de memória do DuckDB (ex.: '4GB').
+
+    Returns:
+    duckdb.DuckDBPyConnection: A conexão configurada.
+    """
+    con = duckdb.connect()
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    if memory_limit:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+
+    if source.startswith("s3://"):
+        con.execute("INSTALL httpfs; LOAD httpfs;")
+        con.execute("INSTALL aws; LOAD aws;")
+        con.execute("CREATE OR REPLACE SECRET (TYPE S3, PROVIDER CREDENTIAL_CHAIN)")
+
+    for table in BASE_TABLES:
+        scan = f"read_parquet('{_table_glob(source, table)}', union_by_name = true)"
+        try:
+            con.execute(f"DESCRIBE SELECT * FROM {scan}")
+        except duckdb.Error as e:
+            logger.warning(f"Tabela base tb_gold_{table} indisponível em {source}: {str(e).splitlines()[0]}")
+            continue
+        con.execute(f"CREATE OR REPLACE VIEW tb_gold_{table} AS SELECT * FROM {scan}")
+        con.execute(f"CREATE OR REPLACE VIEW tb_silver_{table} AS SELECT * FROM tb_gold_{table}")
+    return con
+
+
+def build_table(con: duckdb.DuckDBPyConnection, name: str, select: str, output: str) -> Dict:
+    """
+    Materializa uma tabela de entrega em Parquet.
+
+    Args:
+    con (duckdb.DuckDBPyConnection): Conexão criada por `connect`.
+    name (str): Nome da tabela de entrega.
+    select (str): SELECT do CTAS.
+    output (str): Diretório (ou URI s3://) de saída; a tabela é gravada em <output>/<name>/.
+
+    Returns:
+    Dict: Métricas da execução (linhas, segundos, status).
+    """
+    target = f"{output.rstrip('/')}/{name}"
+    start_time = time.perf_counter()
+    try:
+        # OVERWRITE limpa o diretório: uma reconstrução com menos threads não deixa data_N.parquet antigos
+        con.execute(f"COPY ({select}) TO '{target}' (FORMAT PARQUET, PER_THREAD_OUTPUT true, OVERWRITE true)")
+        rows = con.execute(f"SELECT count(*) FROM read_parquet('{target}/*.parquet')").fetchone()[0]
+    except duckdb.Error as e:
+        logger.error(f"Erro ao construir {name}: {str(e)}")
+        return {"table": name, "status": "error", "error": str(e), "seconds": round(time.perf_counter() - start_time, 3)}
+
+    seconds = round(time.perf_counter() - start_time, 3)
+    logger.info(f"{name} construída em {seconds:.2f} segundos ({rows} linhas) -> {target}")
+    return {"table": name, "status": "ok", "rows": rows, "seconds": seconds, "location": target}
+
+
+def build_all(source: str, output: str, only: Optional[List[str]] = None, threads: Optional[int] = None,
+              memory_limit: Optional[str] = None, queries_path: str = QUERIES_PATH) -> List[Dict]:
+    """
+    Constrói todas as tabelas de entrega (ou apenas as de `only`).
+
+    Returns:
+    List[Dict]: Métricas por tabela, na ordem do arquivo de queries.
+    """
+    queries = load_ctas_queries(queries_path)
+    if not source.startswith("s3://") and not output.startswith("s3://"):
+        os.makedirs(output, exist_ok=True)
+
+    selected = [name for name in queries if not only or name in only]
+    if fact_table.FACT_TABLE not in selected and any(fact_table.FACT_TABLE in queries[name] for name in selected):
+        selected.insert(0, fact_table.FACT_TABLE)
+
+    con = connect(source, threads, memory_limit)
+    try:
+        results = []
+        for name in selected:
+            if name != fact_table.FACT_TABLE:
+                results.append(build_table(con, name, queries[name], output))
+                continue
+            # A fato é montada com sort-merge join e exposta como view para as projeções seguintes
+            result = fact_table.build(con, output)
+            if result["status"] == "ok":
+                con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet('{result['location']}/*.parquet')")
+            results.append(result)
+        return results
+    finally:
+        con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói as tabelas tb_gold_* de entrega localmente com DuckDB.")
+    parser.add_argument("--source", required=True, help="diretório local ou s3:// com as pastas tb_gold_<tabela>")
+    parser.add_argument("--output", required=True, help="diretório local ou s3:// de saída")
+    parser.add_argument("--only", nargs="*", help="constrói apenas estas tabelas")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--memory-limit", default=None)
+    args = parser.parse_args()
+
+    results = build_all(args.source, args.output, args.only, args.threads, args.memory_limit)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
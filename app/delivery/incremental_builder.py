@@ -0,0 +1,480 @@
+"""
+Materialização incremental das tabelas de entrega (tb_gold_*) por partição
+BusinessYear/StateCode.
+
+Em vez de recriar todas as tabelas a cada execução, guarda um estado com a
+impressão digital de cada arquivo das tabelas base e as partições
+(BusinessYear, StateCode) que ele contém. A cada execução:
+
+1. Lê apenas os rodapés Parquet das tabelas base (`parquet_metadata`) e compara
+   as impressões digitais com o estado: arquivos novos, alterados e removidos.
+2. Descobre as partições afetadas lendo só as colunas BusinessYear/StateCode
+   dos arquivos novos ou alterados; as partições de arquivos removidos vêm do estado.
+3. Para cada tabela de entrega, recalcula apenas as partições afetadas: as views
+   `tb_silver_<tabela>` passam a ler somente os arquivos que contêm essas
+   partições, já filtrados por elas.
+4. Grava o resultado em `<output>/<tabela>/_staging_<execução>/` e troca cada
+   partição por rename (a antiga vai para `_trash_<execução>/`). Pastas iniciadas
+   por `_` são ignoradas pelos leitores Hive/Glue/Athena.
+5. Só depois de todas as trocas o novo estado é gravado (também por rename).
+   Se a execução for interrompida, a próxima recalcula as mesmas partições;
+   tabelas que falharem guardam as partições afetadas como pendentes.
+
+O tempo e os bytes lidos são proporcionais aos arquivos alterados, não ao
+tamanho das tabelas. Mudanças nas queries (`athena_queries.txt`) ou no layout
+de partição forçam a reconstrução completa.
+
+A saída precisa ser um diretório local (a troca depende de rename atômico);
+a origem pode ser local ou s3://.
+
+Uso:
+    python app/delivery/incremental_builder.py --source ./data/delivery --output ./data/delivery_local
+    python app/delivery/incremental_builder.py --source s3://delivery-test-edb --output ./out --full
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import argparse
+from urllib.parse import unquote
+from typing import Dict, List, Optional, Set, Tuple
+
+import duckdb
+
+import gold_builder
+from fact_table import FACT_TABLE
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configurações
+STATE_FILE_NAME = "_incremental_state.json"
+STATE_VERSION = 1
+
+# Partição de cada tabela de entrega e como cada tabela base é filtrada:
+# "estado" -> filtra por (BusinessYear, StateCode), pois o StateCode da base é o da saída
+#             (ou está no join com ele);
+# "ano"    -> filtra só por BusinessYear; uma mudança nela afeta todos os estados do ano.
+# Todas as queries fazem join por BusinessYear, então o filtro por ano é sempre exato.
+# As tabelas projetadas da fato (tb_gold_fact_plan_rate_benefit) listam as bases da fato.
+GOLD_PARTITIONS = {
+    "tb_gold_benefits_rates_by_state": {
+        "keys": ("BusinessYear", "StateCode"),
+        "inputs": {"rate": "estado", "benefits_cost_sharing": "estado", "plan_attributes": "ano"},
+    },
+    "tb_gold_benefits_vs_rates": {
+        "keys": ("BusinessYear", "StateCode"),
+        "inputs": {"benefits_cost_sharing": "estado", "rate": "estado", "plan_attributes": "ano"},
+    },
+    "tb_gold_rates_by_age": {
+        "keys": ("BusinessYear", "StateCode"),
+        "inputs": {"rate": "estado"},
+    },
+    "tb_gold_plan_network_comparison": {
+        "keys": ("BusinessYear",),
+        "inputs": {"plan_attributes": "ano", "service_area": "ano"},
+    },
+    "tb_gold_yearly_price_progression": {
+        "keys": ("BusinessYear",),
+        "inputs": {"rate": "ano"},
+    },
+    "tb_gold_plan_detail": {
+        "keys": ("BusinessYear",),
+        "inputs": {"plan_attributes": "ano", "business_rules": "ano"},
+    },
+}
+
+Partition = Tuple[str, str]
+
+FINGERPRINT_SQL = """
+SELECT
+    file_name,
+    md5(string_agg(concat_ws('|', row_group_id, column_id, total_compressed_size,
+                             stats_min_value, stats_max_value, stats_null_count), ','
+                   ORDER BY row_group_id, column_id)) AS fingerprint,
+    sum(total_compressed_size) AS bytes
+FROM parquet_metadata('{glob}')
+GROUP BY file_name
+"""
+
+
+# ========== ESTADO ==========
+def _state_path(output: str) -> str:
+    return os.path.join(output, STATE_FILE_NAME)
+
+
+def _layout_hash(queries: Dict[str, str]) -> str:
+    return hashlib.md5(json.dumps({"queries": queries, "partitions": GOLD_PARTITIONS},
+                                  sort_keys=True).encode()).hexdigest()[:12]
+
+
+def load_state(output: str) -> Dict:
+    """Lê o estado da última construção (vazio se não existir)."""
+    try:
+        with open(_state_path(output), encoding="utf-8") as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return {}
+    return state if state.get("version") == STATE_VERSION else {}
+
+
+def save_state(output: str, state: Dict) -> None:
+    """Grava o estado de forma atômica (arquivo temporário + rename)."""
+    tmp_path = f"{_state_path(output)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, _state_path(output))
+
+
+# ========== DETECÇÃO DE MUDANÇAS ==========
+def _sql_list(values) -> str:
+    return ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+
+
+def scan_files(con: duckdb.DuckDBPyConnection, source: str, table: str) -> Dict[str, Dict]:
+    """
+    Impressão digital de cada arquivo de uma tabela base, lida só dos rodapés Parquet.
+
+    Returns:
+    Dict[str, Dict]: Caminho do arquivo -> {"fingerprint", "bytes"}.
+    """
+    glob = gold_builder._table_glob(source, table)
+    try:
+        rows = con.execute(FINGERPRINT_SQL.format(glob=glob)).fetchall()
+    except duckdb.Error as e:
+        logger.warning(f"Tabela base tb_gold_{table} indisponível em {source}: {str(e).splitlines()[0]}")
+        return {}
+    return {file_name: {"fingerprint": fingerprint, "bytes": int(size or 0)} for file_name, fingerprint, size in rows}
+
+
+def read_file_partitions(con: duckdb.DuckDBPyConnection, files: List[str]) -> Dict[str, List[Partition]]:
+    """Partições (BusinessYear, StateCode) de cada arquivo, lendo apenas essas duas colunas."""
+    if not files:
+        return {}
+    rows = con.execute(f"""
+        SELECT DISTINCT filename, CAST(BusinessYear AS VARCHAR), coalesce(CAST(StateCode AS VARCHAR), '')
+        FROM read_parquet([{_sql_list(files)}], union_by_name = true, filename = true)
+    """).fetchall()
+    partitions = {file_name: [] for file_name in files}
+    for file_name, year, state in rows:
+        partitions[file_name].append((year, state))
+    return partitions
+
+
+def detect_changes(con: duckdb.DuckDBPyConnection, source: str, previous: Dict) -> Tuple[Dict, Dict[str, Set[Partition]], Dict]:
+    """
+    Compara os arquivos atuais das tabelas base com o estado anterior.
+
+    Args:
+    con (duckdb.DuckDBPyConnection): Conexão criada por `gold_builder.connect`.
+    source (str): Diretório local ou URI s3:// com as pastas tb_gold_<tabela>.
+    previous (Dict): Arquivos do estado anterior, por tabela base.
+
+    Returns:
+    Tuple: (arquivos atuais por tabela, partições afetadas por tabela, métricas da detecção)
+    """
+    files, affected, metrics = {}, {}, {}
+    for table in gold_builder.BASE_TABLES:
+        old = previous.get(table, {})
+        current = scan_files(con, source, table)
+        changed = [path for path, info in current.items()
+                   if path not in old or old[path]["fingerprint"] != info["fingerprint"]]
+        removed = [path for path in old if path not in current]
+
+        new_partitions = read_file_partitions(con, changed)
+        for path, info in current.items():
+            info["partitions"] = new_partitions[path] if path in new_partitions else [tuple(p) for p in old[path]["partitions"]]
+
+        touched = set()
+        for path in changed:
+            touched.update(new_partitions[path])
+            if path in old:
+                touched.update(tuple(p) for p in old[path]["partitions"])
+        for path in removed:
+            touched.update(tuple(p) for p in old[path]["partitions"])
+
+        files[table], affected[table] = current, touched
+        metrics[table] = {"files": len(current), "changed": len(changed), "removed": len(removed),
+                          "partitions_affected": len(touched)}
+        if changed or removed:
+            logger.info(f"tb_gold_{table}: {len(changed)} arquivos novos/alterados, {len(removed)} removidos, "
+                        f"{len(touched)} partições afetadas")
+    return files, affected, metrics
+
+
+def affected_partitions(spec: Dict, affected: Dict[str, Set[Partition]]) -> Tuple[Set[Partition], Set[str]]:
+    """
+    Partições de uma tabela de entrega afetadas pelas mudanças nas bases.
+
+    Returns:
+    Tuple[Set[Partition], Set[str]]: (pares afetados, anos afetados por inteiro)
+    """
+    pairs, years = set(), set()
+    by_state = spec["keys"] == ("BusinessYear", "StateCode")
+    for table, granularity in spec["inputs"].items():
+        for year, state in affected.get(table, ()):
+            if by_state and granularity == "estado":
+                pairs.add((year, state))
+            else:
+                years.add(year)
+    return {pair for pair in pairs if pair[0] not in years}, years
+
+
+# ========== RECÁLCULO ==========
+def _partition_filter(pairs: Set[Partition], years: Set[str], granularity: str) -> str:
+    year_expr = "CAST(BusinessYear AS VARCHAR)"
+    conditions = []
+    if granularity == "estado":
+        if pairs:
+            keys = {f"{year}|{state}" for year, state in pairs}
+            conditions.append(f"{year_expr} || '|' || coalesce(CAST(StateCode AS VARCHAR), '') IN ({_sql_list(sorted(keys))})")
+        if years:
+            conditions.append(f"{year_expr} IN ({_sql_list(sorted(years))})")
+    else:
+        all_years = years | {year for year, _ in pairs}
+        if all_years:
+            conditions.append(f"{year_expr} IN ({_sql_list(sorted(all_years))})")
+    return " OR ".join(conditions) or "false"
+
+
+def _drop_restricted_views(con: duckdb.DuckDBPyConnection, table: str) -> None:
+    """Volta a usar as views completas criadas por `gold_builder.connect`."""
+    con.execute(f"DROP VIEW IF EXISTS temp.tb_silver_{table}")
+    con.execute(f"DROP VIEW IF EXISTS temp.tb_gold_{table}")
+
+
+def _restrict_views(con: duckdb.DuckDBPyConnection, spec: Dict, files: Dict[str, Dict],
+                    pairs: Set[Partition], years: Set[str]) -> Tuple[int, int]:
+    """
+    Redefine as views das tabelas base usadas pela query para ler apenas os
+    arquivos que contêm as partições afetadas, filtrados por elas.
+
+    Returns:
+    Tuple[int, int]: (arquivos lidos, bytes comprimidos lidos, estimados pelo rodapé)
+    """
+    scanned_files, scanned_bytes = 0, 0
+    for table, granularity in spec["inputs"].items():
+        table_files = files.get(table, {})
+        wanted_years = years | {year for year, _ in pairs}
+        selected = [path for path, info in sorted(table_files.items())
+                    if any(year in years or (year, state) in pairs
+                           or (granularity == "ano" and year in wanted_years)
+                           for year, state in info["partitions"])]
+        scanned_files += len(selected)
+        scanned_bytes += sum(table_files[path]["bytes"] for path in selected)
+
+        if selected:
+            scan = f"read_parquet([{_sql_list(selected)}], union_by_name = true)"
+            where = _partition_filter(pairs, years, granularity)
+        elif table_files:
+            # Nenhum arquivo relevante: view vazia com o schema da tabela
+            scan = f"read_parquet([{_sql_list(sorted(table_files)[:1])}])"
+            where = "false"
+        else:
+            _drop_restricted_views(con, table)
+            continue
+        for view in (f"tb_gold_{table}", f"tb_silver_{table}"):
+            con.execute(f"CREATE OR REPLACE TEMP VIEW {view} AS SELECT * FROM {scan} WHERE {where}")
+    return scanned_files, scanned_bytes
+
+
+def _partition_dirs(root: str, depth: int) -> Dict[Tuple[str, ...], str]:
+    """Pastas Hive (`chave=valor`) até a profundidade das chaves: valores -> caminho."""
+    found = {(): root}
+    for _ in range(depth):
+        level = {}
+        for values, path in found.items():
+            if not os.path.isdir(path):
+                continue
+            for entry in os.listdir(path):
+                if "=" in entry and not entry.startswith(("_", ".")):
+                    value = unquote(entry.split("=", 1)[1])
+                    level[values + ("" if value == "NULL" else value,)] = os.path.join(path, entry)
+        found = level
+    return found
+
+
+def swap_partitions(target: str, staging: str, keys: Tuple[str, ...], pairs: Set[Partition],
+                    years: Set[str], full: bool, run_id: str) -> int:
+    """
+    Troca as partições afetadas de `target` pelas recém-calculadas em `staging`.
+
+    Cada partição é substituída com dois renames no mesmo sistema de arquivos; a
+    antiga é apagada ao final. Partições afetadas que ficaram vazias são removidas.
+
+    Returns:
+    int: Número de partições trocadas.
+    """
+    depth = len(keys)
+    trash = os.path.join(target, f"_trash_{run_id}")
+
+    def is_affected(values: Tuple[str, ...]) -> bool:
+        return full or values[0] in years or (depth == 2 and values in pairs)
+
+    new_dirs = _partition_dirs(staging, depth)
+    old_dirs = {values: path for values, path in _partition_dirs(target, depth).items() if is_affected(values)}
+
+    swapped = 0
+    for values in sorted(set(new_dirs) | set(old_dirs)):
+        relative = os.path.relpath(new_dirs.get(values) or old_dirs[values], staging if values in new_dirs else target)
+        final_path = os.path.join(target, relative)
+        if values in old_dirs:
+            os.makedirs(os.path.dirname(os.path.join(trash, relative)), exist_ok=True)
+            os.rename(old_dirs[values], os.path.join(trash, relative))
+        if values in new_dirs:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.rename(new_dirs[values], final_path)
+        swapped += 1
+
+    shutil.rmtree(trash, ignore_errors=True)
+    shutil.rmtree(staging, ignore_errors=True)
+    # Remove pastas de ano que ficaram vazias após a troca
+    for path in _partition_dirs(target, 1).values():
+        if os.path.isdir(path) and not os.listdir(path):
+            os.rmdir(path)
+    return swapped
+
+
+def build_partitions(con: duckdb.DuckDBPyConnection, name: str, select: str, output: str, files: Dict[str, Dict],
+                     pairs: Set[Partition], years: Set[str], full: bool, run_id: str) -> Dict:
+    """
+    Recalcula e troca as partições afetadas de uma tabela de entrega.
+
+    Returns:
+    Dict: Métricas da execução (partições, linhas, arquivos e bytes lidos, segundos, status).
+    """
+    spec = GOLD_PARTITIONS[name]
+    target = os.path.join(output, name)
+    staging = os.path.join(target, f"_staging_{run_id}")
+    start_time = time.perf_counter()
+
+    if full:
+        for table in spec["inputs"]:
+            _drop_restricted_views(con, table)
+        scanned_files = sum(len(files.get(table, {})) for table in spec["inputs"])
+        scanned_bytes = sum(info["bytes"] for table in spec["inputs"] for info in files.get(table, {}).values())
+    else:
+        scanned_files, scanned_bytes = _restrict_views(con, spec, files, pairs, years)
+
+    try:
+        os.makedirs(target, exist_ok=True)
+        con.execute(f"COPY ({select}) TO '{staging}' "
+                    f"(FORMAT PARQUET, PARTITION_BY ({', '.join(spec['keys'])}), OVERWRITE_OR_IGNORE true)")
+        rows = con.execute(f"SELECT count(*) FROM read_parquet('{staging}/**/*.parquet')").fetchone()[0] \
+            if os.path.isdir(staging) else 0
+        swapped = swap_partitions(target, staging, spec["keys"], pairs, years, full, run_id)
+    except (duckdb.Error, OSError) as e:
+        logger.error(f"Erro ao construir {name}: {str(e)}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return {"table": name, "status": "error", "error": str(e), "seconds": round(time.perf_counter() - start_time, 3)}
+
+    seconds = round(time.perf_counter() - start_time, 3)
+    logger.info(f"{name}: {swapped} partições trocadas em {seconds:.2f} segundos "
+                f"({rows} linhas, {scanned_files} arquivos / {scanned_bytes} bytes lidos)")
+    return {"table": name, "status": "ok", "mode": "full" if full else "incremental", "partitions": swapped,
+            "rows": rows, "files_scanned": scanned_files, "bytes_scanned": scanned_bytes,
+            "seconds": seconds, "location": target}
+
+
+def build_incremental(source: str, output: str, only: Optional[List[str]] = None, full: bool = False,
+                      threads: Optional[int] = None, memory_limit: Optional[str] = None,
+                      queries_path: str = gold_builder.QUERIES_PATH) -> Dict:
+    """
+    Atualiza as tabelas de entrega recalculando apenas as partições afetadas.
+
+    Tabelas fora de `only` ou que falharem guardam suas partições afetadas como
+    pendentes no estado, para serem recalculadas na próxima execução.
+
+    Args:
+    source (str): Diretório local ou URI s3:// com as pastas tb_gold_<tabela>.
+    output (str): Diretório local de saída.
+    only (Optional[List[str]]): Atualiza apenas estas tabelas.
+    full (bool): Ignora o estado e reconstrói tudo.
+
+    Returns:
+    Dict: {"changes": métricas por tabela base, "tables": métricas por tabela de entrega}
+    """
+    if output.startswith("s3://"):
+        raise ValueError("A materialização incremental exige saída local (a troca de partições usa rename)")
+    os.makedirs(output, exist_ok=True)
+
+    all_queries = gold_builder.load_ctas_queries(queries_path)
+    queries = {name: select for name, select in all_queries.items() if name in GOLD_PARTITIONS}
+    layout = _layout_hash(queries)
+    state = {} if full else load_state(output)
+    if state.get("layout") != layout:
+        state = {}
+    built = set(state.get("tables", []))
+    pending = state.get("pending", {})
+
+    con = gold_builder.connect(source, threads, memory_limit)
+    if FACT_TABLE in all_queries:
+        # A fato vira uma view sobre as tabelas base, que são restritas às partições afetadas
+        con.execute(f"CREATE OR REPLACE VIEW {FACT_TABLE} AS {all_queries[FACT_TABLE]}")
+    run_id = time.strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:6]
+    results, new_pending = [], {}
+    try:
+        files, affected, changes = detect_changes(con, source, state.get("files", {}))
+        for name, select in queries.items():
+            pairs, years = affected_partitions(GOLD_PARTITIONS[name], affected)
+            pairs |= {tuple(pair) for pair in pending.get(name, {}).get("pairs", [])}
+            years |= set(pending.get(name, {}).get("years", []))
+            pairs = {pair for pair in pairs if pair[0] not in years}
+
+            if only and name not in only:
+                if name in built and (pairs or years):
+                    new_pending[name] = {"pairs": sorted(map(list, pairs)), "years": sorted(years)}
+                continue
+
+            table_full = name not in built or not os.path.isdir(os.path.join(output, name))
+            if not table_full and not pairs and not years:
+                logger.info(f"{name}: nenhuma partição afetada")
+                results.append({"table": name, "status": "ok", "mode": "unchanged", "partitions": 0,
+                                "rows": 0, "files_scanned": 0, "bytes_scanned": 0, "seconds": 0.0})
+                continue
+
+            result = build_partitions(con, name, select, output, files, pairs, years, table_full, run_id)
+            results.append(result)
+            if result["status"] == "ok":
+                built.add(name)
+            elif not table_full:
+                new_pending[name] = {"pairs": sorted(map(list, pairs)), "years": sorted(years)}
+            else:
+                built.discard(name)
+    finally:
+        con.close()
+
+    save_state(output, {
+        "version": STATE_VERSION,
+        "layout": layout,
+        "tables": sorted(built),
+        "pending": new_pending,
+        "files": {table: {path: {**info, "partitions": [list(p) for p in info["partitions"]]}
+                          for path, info in table_files.items()}
+                  for table, table_files in files.items()},
+        "updated_at": run_id,
+    })
+    return {"changes": changes, "tables": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza incrementalmente as tabelas tb_gold_* de entrega com DuckDB.")
+    parser.add_argument("--source", required=True, help="diretório local ou s3:// com as pastas tb_gold_<tabela>")
+    parser.add_argument("--output", required=True, help="diretório local de saída")
+    parser.add_argument("--only", nargs="*", help="atualiza apenas estas tabelas")
+    parser.add_argument("--full", action="store_true", help="ignora o estado e reconstrói tudo")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--memory-limit", default=None)
+    args = parser.parse_args()
+
+    results = build_incremental(args.source, args.output, args.only, args.full, args.threads, args.memory_limit)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Busca pontual por identificador (PlanId, StandardComponentId, IssuerId) nos
+arquivos Parquet das camadas silver e gold, com DuckDB.
+
+Responde perguntas como "todas as linhas de rate e benefícios do plano X" sem
+varrer todos os arquivos. Para cada tabela, em três etapas:
+
+1. Estatísticas: lê só os rodapés (`parquet_metadata`) e descarta os row groups
+   cujo min/max da coluna não contém o valor.
+2. Bloom filters: nos row groups restantes, consulta os Bloom filters gravados
+   pelos jobs trusted (`parquet_bloom_probe`, ver `app/trusted/parquet_index.py`)
+   e descarta os que certamente não contêm o valor.
+3. Leitura: lê apenas os arquivos que sobraram, com o filtro de igualdade (o
+   DuckDB volta a podar os row groups descartados ao ler).
+
+Arquivos sem a coluna são ignorados; arquivos sem Bloom filter só são podados
+pelas estatísticas.
+
+Requer:
+- Bibliotecas: duckdb (extensões httpfs/aws para caminhos s3://)
+
+Uso:
+    python app/delivery/point_lookup.py --source ./data/silver --value 21989AK0010001
+    python app/delivery/point_lookup.py --source s3://delivery-test-edb --column IssuerId --value 21989 --tables tb_gold_rate
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+import duckdb
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configurações
+LOOKUP_COLUMNS = ("PlanId", "StandardComponentId", "IssuerId")
+TABLE_PREFIXES = ("tb_silver_", "tb_gold_")
+INTEGER_TYPES = ("INT32", "INT64")
+
+
+def _sql_list(values) -> str:
+    return ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+
+
+def list_tables(source: str) -> List[str]:
+    """Pastas de tabela (tb_silver_*/tb_gold_*) sob a origem local; no S3, use `tables`."""
+    return sorted(entry for entry in os.listdir(source)
+                  if entry.startswith(TABLE_PREFIXES) and os.path.isdir(os.path.join(source, entry)))
+
+
+def _literal(value: str, physical_type: str):
+    """O valor no tipo da coluna; None se não for convertível (nenhuma linha pode casar)."""
+    if physical_type in INTEGER_TYPES:
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+    return value
+
+
+def prune_files(con: duckdb.DuckDBPyConnection, glob: str, column: str, value: str) -> Dict:
+    """
+    Descobre quais arquivos de uma tabela podem conter o valor.
+
+    Returns:
+    Dict: {"files": arquivos candidatos, "type": tipo físico da coluna,
+           "metrics": contagens de arquivos e row groups podados}
+    """
+    try:
+        rows = con.execute(f"""
+            SELECT file_name, row_group_id, type, stats_min_value, stats_max_value
+            FROM parquet_metadata('{glob}')
+            WHERE path_in_schema = ?
+        """, [column]).fetchall()
+        total_files = con.execute(f"SELECT count(*) FROM glob('{glob}')").fetchone()[0]
+    except duckdb.Error as e:
+        logger.warning(f"Nenhum arquivo legível em {glob}: {str(e).splitlines()[0]}")
+        return {"files": [], "type": None, "metrics": {"files": 0}}
+
+    # 1. Estatísticas min/max
+    candidates: Dict[str, Dict] = {}
+    row_groups = 0
+    for file_name, row_group, physical_type, minimum, maximum in rows:
+        row_groups += 1
+        target = _literal(value, physical_type)
+        if target is None:
+            continue
+        if minimum is not None and maximum is not None:
+            bounds = (_literal(minimum, physical_type), _literal(maximum, physical_type))
+            if not bounds[0] <= target <= bounds[1]:
+                continue
+        candidates.setdefault(file_name, {"type": physical_type, "row_groups": set()})["row_groups"].add(row_group)
+    after_stats = sum(len(info["row_groups"]) for info in candidates.values())
+
+    # 2. Bloom filters (agrupados por tipo físico, pois o valor sondado precisa ter o tipo da coluna)
+    by_type: Dict[str, List[str]] = {}
+    for file_name, info in candidates.items():
+        by_type.setdefault(info["type"], []).append(file_name)
+    for physical_type, files in by_type.items():
+        probes = con.execute(
+            f"SELECT file_name, row_group_id, bloom_filter_excludes "
+            f"FROM parquet_bloom_probe([{_sql_list(files)}], ?, ?)",
+            [column, _literal(value, physical_type)]
+        ).fetchall()
+        for file_name, row_group, excluded in probes:
+            if excluded:
+                candidates[file_name]["row_groups"].discard(row_group)
+
+    surviving = sorted(file_name for file_name, info in candidates.items() if info["row_groups"])
+    after_bloom = sum(len(info["row_groups"]) for info in candidates.values())
+    physical_type = next(iter(by_type), None)
+    return {"files": surviving, "type": physical_type, "metrics": {
+        "files": total_files,
+        "files_with_column": len({row[0] for row in rows}),
+        "files_after_stats": len(candidates),
+        "files_read": len(surviving),
+        "row_groups": row_groups,
+        "row_groups_after_stats": after_stats,
+        "row_groups_read": after_bloom,
+    }}
+
+
+def lookup(source: str, value: str, column: str = "PlanId", tables: Optional[List[str]] = None,
+           threads: Optional[int] = None, limit: Optional[int] = None) -> Dict:
+    """
+    Busca as linhas em que `column` = `value` em todas as tabelas da origem.
+
+    Args:
+    source (str): Diretório local ou URI s3:// com as pastas das tabelas.
+    value (str): O valor procurado.
+    column (str): A coluna de identificador.
+    tables (Optional[List[str]]): Tabelas a consultar (obrigatório para origens s3://).
+    limit (Optional[int]): Máximo de linhas devolvidas por tabela.
+
+    Returns:
+    Dict: Tabela -> {"rows": linhas encontradas (lista de dicts), "metrics": poda e tempos}
+    """
+    if column not in LOOKUP_COLUMNS:
+        raise ValueError(f"Coluna sem índice: {column} (use uma de {LOOKUP_COLUMNS})")
+    if tables is None:
+        if source.startswith("s3://"):
+            raise ValueError("Informe as tabelas ao buscar em s3://")
+        tables = list_tables(source)
+
+    con = duckdb.connect()
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    if source.startswith("s3://"):
+        con.execute("INSTALL httpfs; LOAD httpfs;")
+        con.execute("INSTALL aws; LOAD aws;")
+        con.execute("CREATE OR REPLACE SECRET (TYPE S3, PROVIDER CREDENTIAL_CHAIN)")
+
+    results = {}
+    try:
+        for table in tables:
+            start_time = time.perf_counter()
+            glob = f"{source.rstrip('/')}/{table}/**/*.parquet"
+            pruned = prune_files(con, glob, column, value)
+            prune_seconds = time.perf_counter() - start_time
+
+            rows = []
+            if pruned["files"]:
+                scan = f"read_parquet([{_sql_list(pruned['files'])}], union_by_name = true, filename = true)"
+                query = f"SELECT * FROM {scan} WHERE {column} = ?"
+                if limit:
+                    query += f" LIMIT {int(limit)}"
+                cursor = con.execute(query, [_literal(value, pruned["type"])])
+                names = [description[0] for description in cursor.description]
+                rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+
+            seconds = time.perf_counter() - start_time
+            results[table] = {"rows": rows, "metrics": {
+                **pruned["metrics"], "rows": len(rows),
+                "prune_seconds": round(prune_seconds, 4), "seconds": round(seconds, 4),
+            }}
+            logger.info(f"{table}: {len(rows)} linhas, {pruned['metrics'].get('files_read', 0)}/"
+                        f"{pruned['metrics'].get('files', 0)} arquivos lidos em {seconds:.3f} segundos")
+    finally:
+        con.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca pontual por identificador nos arquivos Parquet silver/gold.")
+    parser.add_argument("--source", required=True, help="diretório local ou s3:// com as pastas tb_silver_*/tb_gold_*")
+    parser.add_argument("--value", required=True, help="valor procurado")
+    parser.add_argument("--column", default="PlanId", choices=LOOKUP_COLUMNS)
+    parser.add_argument("--tables", nargs="*", help="tabelas a consultar (padrão: todas as pastas da origem local)")
+    parser.add_argument("--limit", type=int, default=None, help="máximo de linhas por tabela")
+    parser.add_argument("--metrics-only", action="store_true", help="mostra só as métricas de poda")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    results = lookup(args.source, args.value, args.column, args.tables, args.threads, args.limit)
+    if args.metrics_only:
+        results = {table: result["metrics"] for table, result in results.items()}
+    print(json.dumps(results, indent=2, default=str, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
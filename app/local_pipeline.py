@@ -0,0 +1,283 @@
+"""
+Execução local do pipeline completo (landing -> raw -> trusted -> validate) por dependências.
+
+O Step Functions em `cloud_formation.yaml` roda as etapas em ondas: Landing,
+Raw, TrustedZipCode, os cinco jobs trusted em paralelo e Validate. Nessa ordem,
+rate, benefits, business rules e plan attributes esperam o TrustedZipCode
+mesmo sem ler a sua saída; só `tb_silver_service_area` depende dele.
+
+Este runner chama os mesmos handlers das Lambdas, mas agenda cada etapa assim
+que as suas entradas reais ficam prontas (grafo em `STAGES`). Cada etapa roda
+em um processo próprio, recém-criado (como um container Lambda), até
+`--max-workers` ao mesmo tempo.
+
+Armazenamento (`--storage`), pela camada `object_store` usada por todas as etapas:
+- local (padrão): sem rede; cada bucket é uma pasta sob `--local-root`
+  (padrão `app/.object_store/`).
+- endpoint: um S3 compatível local (padrão http://localhost:9000), passado aos
+  handlers por AWS_ENDPOINT_URL. O serviço `s3-local` do docker-compose sobe um
+  MinIO com os dados em `app/.s3_local/`.
+- aws: os buckets reais, com as credenciais do ambiente.
+
+Com endpoint e aws, as leituras passam pelo cache em disco de `object_cache`
+(`--cache-dir`, padrão `app/.object_cache/`): reexecuções só baixam de novo os
+objetos que mudaram. `--cache-dir ""` desliga o cache.
+
+Ao final, imprime o relatório de caminho crítico: início, fim e duração de cada
+etapa, a folga (quanto ela poderia atrasar sem atrasar o pipeline) e o tempo
+total estimado para a ordem em ondas do Step Functions com as mesmas durações.
+
+Requer:
+- As dependências de app/raw/requirements.txt e app/trusted/requirements.txt
+- Bibliotecas: boto3
+
+Uso:
+    python app/local_pipeline.py --skip landing --local-root ./data/object_store
+    docker compose --profile local up -d s3-local
+    python app/local_pipeline.py --storage endpoint --only trusted_rate trusted_validate --max-workers 2
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Configurações
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(BASE_DIR, "trusted")  # object_store e aws_clients, usados por todas as etapas
+DEFAULT_LOCAL_ROOT = os.path.join(BASE_DIR, ".object_store")
+BUCKETS = ["landing-test-edb", "raw-test-edb", "cleaned-test-edb", "delivery-test-edb"]
+DEFAULT_ENDPOINT = "http://localhost:9000"
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, ".object_cache")
+
+# Etapa -> pasta do código, módulo, handler e etapas cujas saídas ela lê
+STAGES = {
+    "landing": {"dir": "raw", "module": "raw_download", "handler": "handler", "deps": []},
+    "raw": {"dir": "raw", "module": "raw_processing_aws", "handler": "handler", "deps": ["landing"]},
+    "trusted_zipcodes": {"dir": "trusted", "module": "tb_silver_zipcodes", "handler": "lambda_handler", "deps": ["raw"]},
+    "trusted_service_area": {"dir": "trusted", "module": "tb_silver_service_area", "handler": "lambda_handler",
+                             "deps": ["raw", "trusted_zipcodes"]},
+    "trusted_rate": {"dir": "trusted", "module": "tb_silver_rate", "handler": "lambda_handler", "deps": ["raw"]},
+    "trusted_benefits": {"dir": "trusted", "module": "tb_silver_benefits_cost_sharing", "handler": "lambda_handler",
+                         "deps": ["raw"]},
+    "trusted_business_rules": {"dir": "trusted", "module": "tb_silver_business_rules", "handler": "lambda_handler",
+                               "deps": ["raw"]},
+    "trusted_plan_attributes": {"dir": "trusted", "module": "tb_silver_plan_attributes", "handler": "lambda_handler",
+                                "deps": ["raw"]},
+    "trusted_validate": {"dir": "trusted", "module": "quality_valid", "handler": "lambda_handler",
+                         "deps": ["trusted_service_area", "trusted_rate", "trusted_benefits",
+                                  "trusted_business_rules", "trusted_plan_attributes"]},
+}
+
+# Ondas do Step Functions (cloud_formation.yaml), para comparação
+STEP_FUNCTION_WAVES = [
+    ["landing"], ["raw"], ["trusted_zipcodes"],
+    ["trusted_service_area", "trusted_rate", "trusted_benefits", "trusted_business_rules", "trusted_plan_attributes"],
+    ["trusted_validate"],
+]
+
+
+# ========== EXECUÇÃO DE UMA ETAPA ==========
+def run_stage(name: str, started_at: float) -> Dict:
+    """
+    Roda o handler de uma etapa no processo atual (chamada dentro do processo filho).
+
+    Returns:
+    Dict: Etapa, status, instantes de início/fim relativos ao início do pipeline e resposta do handler.
+    """
+    stage = STAGES[name]
+    sys.path[:0] = [os.path.join(BASE_DIR, stage["dir"]), SHARED_DIR]
+    start = time.time() - started_at
+    try:
+        handler = getattr(importlib.import_module(stage["module"]), stage["handler"])
+        response = handler({}, None)
+        # Etapas que param antes do limite de tempo devolvem um token; reinvoca até concluir
+        while isinstance(response, dict) and response.get("continuation"):
+            response = handler({"continuation": response["continuation"]}, None)
+        failed = isinstance(response, dict) and int(response.get("statusCode", 200)) >= 400
+        status = "error" if failed else "ok"
+    except Exception as e:
+        response, status = {"error": str(e)}, "error"
+    return {"stage": name, "status": status, "start": round(start, 3),
+            "end": round(time.time() - started_at, 3), "response": response}
+
+
+# ========== AGENDAMENTO ==========
+def configure_storage(storage: str, endpoint_url: str, local_root: str, cache_dir: Optional[str] = None) -> None:
+    """
+    Configura, por variáveis de ambiente herdadas pelas etapas, o backend do
+    `object_store` e o cache de leituras, e cria os buckets no armazenamento
+    local ou no endpoint. Sem `cache_dir`, o cache só é ligado fora do
+    armazenamento local (onde as leituras já são do disco).
+    """
+    if cache_dir is None:
+        cache_dir = "" if storage == "local" else DEFAULT_CACHE_DIR
+    os.environ["OBJECT_STORE_CACHE_DIR"] = os.path.abspath(cache_dir) if cache_dir else ""
+    if storage == "aws":
+        return
+    if storage == "local":
+        os.environ["OBJECT_STORE"] = "local"
+        os.environ["OBJECT_STORE_ROOT"] = os.path.abspath(local_root)
+    else:
+        os.environ["OBJECT_STORE"] = "s3"
+        os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "minioadmin")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "minioadmin")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    sys.path.insert(0, SHARED_DIR)
+    import object_store
+    store = object_store.get_store()
+    for bucket in BUCKETS:
+        store.create_bucket(bucket)
+    logger.info(f"Armazenamento {storage} pronto: {', '.join(BUCKETS)}")
+
+
+def run_pipeline(stages: List[str], max_workers: int) -> Dict[str, Dict]:
+    """
+    Roda as etapas selecionadas respeitando as dependências.
+
+    Etapas fora da seleção são consideradas prontas (as suas saídas já existem no
+    armazenamento). Se uma etapa falhar, as que dependem dela não são executadas.
+
+    Returns:
+    Dict[str, Dict]: Etapa -> resultado de `run_stage` (ou status 'skipped').
+    """
+    pending = {name: [dep for dep in STAGES[name]["deps"] if dep in stages] for name in stages}
+    results: Dict[str, Dict] = {}
+    started_at = time.time()
+
+    # Um processo novo por etapa: os módulos dos handlers carregam clientes e configurações do
+    # zero. O forkserver já traz as bibliotecas importadas, para não pagar esse custo a cada etapa.
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["boto3", "pandas", "pyarrow.parquet"])
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, max_tasks_per_child=1) as executor:
+        running = {}
+        while pending or running:
+            for name in [name for name, deps in pending.items() if all(dep in results for dep in deps)]:
+                failed = [dep for dep in pending[name] if results[dep]["status"] != "ok"]
+                del pending[name]
+                if failed:
+                    results[name] = {"stage": name, "status": "skipped", "reason": f"dependências falharam: {failed}"}
+                    logger.warning(f"{name} não executada: dependências falharam ({', '.join(failed)})")
+                    continue
+                logger.info(f"Iniciando {name}")
+                running[executor.submit(run_stage, name, started_at)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = {"stage": name, "status": "error", "response": {"error": str(e)}}
+                result = results[name]
+                logger.info(f"{name} finalizada ({result['status']}) em "
+                            f"{result.get('end', 0) - result.get('start', 0):.2f} segundos")
+    return results
+
+
+# ========== CAMINHO CRÍTICO ==========
+def critical_path_report(results: Dict[str, Dict]) -> Dict:
+    """
+    Calcula o caminho crítico a partir das durações medidas.
+
+    Para cada etapa executada: término mais cedo possível (maior término das
+    dependências + duração), término mais tarde sem atrasar o pipeline e a folga
+    entre os dois. As etapas com folga zero formam o caminho crítico.
+
+    Returns:
+    Dict: Tempo real, tempo mínimo pelo grafo, tempo estimado nas ondas do Step
+    Functions, caminho crítico e métricas por etapa.
+    """
+    executed = [name for name in STAGES if results.get(name, {}).get("status") in ("ok", "error")]
+    duration = {name: results[name]["end"] - results[name]["start"] for name in executed}
+    deps = {name: [dep for dep in STAGES[name]["deps"] if dep in duration] for name in executed}
+
+    earliest_finish: Dict[str, float] = {}
+    for name in executed:  # STAGES está em ordem topológica
+        earliest_finish[name] = max((earliest_finish[dep] for dep in deps[name]), default=0.0) + duration[name]
+    makespan = max(earliest_finish.values(), default=0.0)
+
+    latest_finish = {name: makespan for name in executed}
+    for name in reversed(executed):
+        for dep in deps[name]:
+            latest_finish[dep] = min(latest_finish[dep], latest_finish[name] - duration[name])
+
+    waves = sum(max((duration[name] for name in wave if name in duration), default=0.0) for wave in STEP_FUNCTION_WAVES)
+    stages = {}
+    for name in executed:
+        slack = max(0.0, latest_finish[name] - earliest_finish[name])
+        stages[name] = {
+            "status": results[name]["status"],
+            "start": results[name]["start"],
+            "end": results[name]["end"],
+            "seconds": round(duration[name], 3),
+            "slack_seconds": round(slack, 3),
+            "critical": slack < 1e-6,
+        }
+
+    return {
+        "wall_seconds": round(max((results[name]["end"] for name in executed), default=0.0), 3),
+        "critical_path_seconds": round(makespan, 3),
+        "step_function_waves_seconds": round(waves, 3),
+        "critical_path": [name for name in executed if stages[name]["critical"]],
+        "stages": stages,
+        "not_run": {name: result.get("reason") for name, result in results.items() if result["status"] == "skipped"},
+    }
+
+
+def select_stages(only: Optional[List[str]], skip: Optional[List[str]]) -> List[str]:
+    selected = list(only) if only else list(STAGES)
+    unknown = [name for name in selected + list(skip or []) if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Etapas desconhecidas: {unknown} (use {list(STAGES)})")
+    return [name for name in STAGES if name in selected and name not in (skip or [])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roda o pipeline localmente, agendando cada etapa pelas dependências.")
+    parser.add_argument("--storage", choices=("local", "endpoint", "aws"), default="local")
+    parser.add_argument("--local-root", default=DEFAULT_LOCAL_ROOT, help="pasta dos buckets com --storage local")
+    parser.add_argument("--endpoint-url", default=os.environ.get("AWS_ENDPOINT_URL", DEFAULT_ENDPOINT),
+                        help="S3 compatível usado com --storage endpoint")
+    parser.add_argument("--cache-dir", help="cache em disco das leituras (padrão: app/.object_cache/ com "
+                                            "endpoint e aws; \"\" desliga)")
+    parser.add_argument("--only", nargs="*", help="etapas a executar (padrão: todas)")
+    parser.add_argument("--skip", nargs="*", help="etapas cujas saídas já existem (ex.: landing)")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--report", help="arquivo JSON para gravar o relatório")
+    args = parser.parse_args()
+
+    stages = select_stages(args.only, args.skip)
+    configure_storage(args.storage, args.endpoint_url, args.local_root, args.cache_dir)
+    results = run_pipeline(stages, args.max_workers)
+    report = critical_path_report(results)
+
+    logger.info(f"Pipeline concluído em {report['wall_seconds']:.2f} segundos "
+                f"(caminho crítico: {' -> '.join(report['critical_path'])}, "
+                f"{report['critical_path_seconds']:.2f} s; ondas do Step Functions: "
+                f"{report['step_function_waves_seconds']:.2f} s)")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if any(result["status"] != "ok" for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Divisão de um CSV grande em shards por faixas de bytes, para parsing em paralelo.
+
+Um arquivo como o Rate_PUF é lido por um só núcleo quando processado inteiro.
+`plan_shards` divide o arquivo em faixas [start, end) de tamanho próximo ao
+alvo, cada uma começando no início de um registro: o corte vai para a primeira
+quebra de linha depois do alvo que esteja fora de campos entre aspas. A
+paridade das aspas é contada desde o início do arquivo (aspas escapadas `""`
+não a alteram), então campos com quebras de linha não são cortados ao meio.
+A varredura lê o arquivo uma vez, em blocos, sem decodificar.
+
+O separador e a codificação são detectados uma vez por arquivo (`detect_format`),
+com as mesmas alternativas do `read_csv_with_options` do raw: UTF-8 e, se algum
+byte não decodificar, ISO-8859-1; vírgula ou, se o cabeçalho só tiver tabs, tab.
+O formato vale para o cabeçalho e para todos os shards.
+
+`iter_shard` lê uma faixa como um CSV sem cabeçalho (com os nomes de colunas
+do plano), em chunks do `chunking`. Cada shard pode rodar em um processo ou em
+uma Lambda própria, a partir do descritor (o dict de `Shard._asdict()` e o formato).
+
+Uso:
+    csv_format = csv_shards.detect_format(path)
+    header, shards = csv_shards.plan_shards(path, target_bytes=64 * 2**20, csv_format=csv_format)
+    for chunk in csv_shards.iter_shard(path, header, shards[0], chunker, csv_format): ...
+"""
+
+import io
+import os
+import csv
+import codecs
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+import chunking
+
+# Configurações
+SHARD_TARGET_MB = float(os.environ.get("RAW_SHARD_TARGET_MB", "64"))
+SCAN_BLOCK_SIZE = 8 * 2**20
+READ_BUFFER_SIZE = 2**20
+
+
+class Shard(NamedTuple):
+    index: int
+    start: int  # início de um registro
+    end: int    # início do próximo shard (ou o tamanho do arquivo)
+
+
+class CsvFormat(NamedTuple):
+    sep: str = ","
+    encoding: str = "utf-8"
+
+
+def detect_format(path: str) -> CsvFormat:
+    """
+    Codificação e separador do arquivo. A decodificação UTF-8 percorre o arquivo
+    inteiro em blocos: um byte inválido no meio dele faria o shard falhar.
+    """
+    encoding = "utf-8"
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        try:
+            for block in iter(lambda: f.read(SCAN_BLOCK_SIZE), b""):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            encoding = "ISO-8859-1"
+    with open(path, newline="", encoding="utf-8-sig" if encoding == "utf-8" else encoding) as f:
+        first_line = f.readline()
+    sep = "\t" if "\t" in first_line and "," not in first_line else ","
+    return CsvFormat(sep, encoding)
+
+
+def _record_starts(path: str, targets: List[int]) -> List[int]:
+    """Para cada posição alvo (em ordem), o início do primeiro registro a partir dela."""
+    starts = []
+    pending = iter(targets)
+    target = next(pending, None)
+    quotes = 0   # aspas antes do bloco atual
+    offset = 0   # posição do bloco atual no arquivo
+    with open(path, "rb") as f:
+        while target is not None:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            position = max(target - offset, 0)
+            while target is not None and position < len(block):
+                newline = block.find(b"\n", position)
+                # Quebra de linha dentro de um campo entre aspas: tenta a próxima
+                while newline != -1 and (quotes + block.count(b'"', 0, newline)) % 2:
+                    newline = block.find(b"\n", newline + 1)
+                if newline == -1:
+                    break
+                starts.append(offset + newline + 1)
+                target = next(pending, None)
+                while target is not None and target <= starts[-1]:
+                    target = next(pending, None)
+                if target is not None:
+                    position = max(target - offset, newline + 1)
+            quotes += block.count(b'"')
+            offset += len(block)
+    return starts
+
+
+def _text_encoding(csv_format: CsvFormat) -> str:
+    # O BOM do UTF-8 só aparece no início do arquivo, antes do cabeçalho
+    return "utf-8-sig" if csv_format.encoding == "utf-8" else csv_format.encoding
+
+
+def read_header(path: str, csv_format: CsvFormat = CsvFormat()) -> Tuple[List[str], int]:
+    """Nomes das colunas e a posição onde começam os dados."""
+    header_end = _record_starts(path, [0])
+    with open(path, newline="", encoding=_text_encoding(csv_format)) as f:
+        header = next(csv.reader(f, delimiter=csv_format.sep))
+    return header, header_end[0] if header_end else os.path.getsize(path)
+
+
+def plan_shards(path: str, target_bytes: Optional[int] = None, num_shards: Optional[int] = None,
+                csv_format: Optional[CsvFormat] = None) -> Tuple[List[str], List[Shard]]:
+    """
+    Divide os dados do CSV em faixas alinhadas a registros, de ~`target_bytes`
+    cada ou em `num_shards` partes iguais. Sem `csv_format`, detecta o formato.
+
+    Returns:
+    Tuple[List[str], List[Shard]]: Cabeçalho e shards, na ordem do arquivo.
+    """
+    header, data_start = read_header(path, csv_format or detect_format(path))
+    size = os.path.getsize(path)
+    if num_shards is None:
+        num_shards = max(1, round((size - data_start) / (target_bytes or SHARD_TARGET_MB * 2**20)))
+    step = (size - data_start) / num_shards
+    targets = [int(data_start + step * i) for i in range(1, num_shards)]
+
+    bounds = [data_start] + [start for start in _record_starts(path, targets) if start < size] + [size]
+    bounds = sorted(set(bounds))
+    shards = [Shard(i, start, end) for i, (start, end) in enumerate(zip(bounds, bounds[1:]))]
+    return header, shards
+
+
+class _RangeFile(io.RawIOBase):
+    """Arquivo restrito à faixa [start, end), para o pandas ler como um CSV inteiro."""
+
+    def __init__(self, path: str, start: int, end: int):
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self._remaining]
+        read = self._file.readinto(view)
+        self._remaining -= read
+        return read
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def iter_shard(path: str, header: List[str], shard: Shard, chunker: "chunking.AdaptiveChunker",
+               csv_format: CsvFormat = CsvFormat()) -> Iterator[pd.DataFrame]:
+    """Chunks de um shard, com as colunas do cabeçalho do arquivo."""
+    source = io.BufferedReader(_RangeFile(path, shard.start, shard.end), READ_BUFFER_SIZE)
+    reader = pd.read_csv(source, header=None, names=header, sep=csv_format.sep, encoding=csv_format.encoding,
+                         low_memory=False, chunksize=chunking.SAMPLE_ROWS)
+    try:
+        yield from chunking.iter_csv(reader, chunker)
+    finally:
+        source.close()
@@ -1,12 +1,14 @@
-import kagglehub
 import os
 import json
-import boto3
 import shutil
+import object_store
+import metrics
 
 
 
 def download_files(download_path:str):
+    import kagglehub
+
     files = [
     "raw/2016/Plan_Attributes_PUF_2015-12-08.csv",
     "raw/2016/Benefits_Cost_Sharing_PUF_2015-12-08.csv",
@@ -47,14 +49,14 @@ def download_files(download_path:str):
     }
 
 def find_and_upload(local_path: str, bucket_name:str, bucket_folder: str):
-    s3 = boto3.client("s3")
-    
-    s3.upload_file(local_path, bucket_name, bucket_folder)
+    # Upload multipart concorrente (S3) ou cópia para a pasta do bucket (local)
+    object_store.get_store().upload(bucket_name, bucket_folder, local_path)
 
 
 def create_zip_file(path: str, zip_file_path: str):
     shutil.make_archive(zip_file_path, 'zip', path)
 
+@metrics.stage("raw_download")
 def handler(event, context):
     
     bucket_name = "landing-test-edb"
@@ -81,4 +83,5 @@ def handler(event, context):
         "body": json.dumps(succeed)
     }
 
-handler(None, None)
\ No newline at end of file
+if __name__ == "__main__":
+    handler(None, None)
@@ -4,51 +4,77 @@ import csv
 import hashlib
 import traceback
 import gc
-from typing import Dict, Optional, Union
+import time
+import uuid
+from typing import Dict, List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import numpy as np
-import boto3
-from botocore.exceptions import ClientError
 import io
 import zipfile
 import logging
 import json
+import object_store
+import metrics
+import chunking
+import csv_shards
+import parquet_layout
+import partition_discovery
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Configuração AWS
-s3_client = boto3.client('s3')
 input_bucket = 'landing-test-edb'
 output_bucket = 'raw-test-edb'
 zip_key = 'health-insurance-marketplace'
 
+# Armazenamento de objetos (S3 ou disco local), compartilhado com a camada trusted
+store = object_store.get_store()
+
 # Anos para processar
 years_to_process = ['2014', '2015', '2016']
 
+# Pasta onde o zip da landing é extraído
+extract_dir = '/tmp/extracted_data'
+
+# CSVs a partir deste tamanho são divididos em shards (faixas de bytes) processados em paralelo
+shard_min_file_mb = float(os.environ.get("RAW_SHARD_MIN_FILE_MB", "128"))
+shard_workers = int(os.environ.get("RAW_SHARD_WORKERS", str(os.cpu_count() or 1)))
+
+# Checkpoint da execução: permite retomar, em outra invocação, do último chunk concluído
+checkpoint_bucket = output_bucket
+checkpoint_key = os.environ.get("RAW_CHECKPOINT_KEY", "_checkpoint/raw_processing.json")
+# Margem antes do limite da Lambda para gravar o checkpoint e devolver o token de continuação
+time_margin_seconds = float(os.environ.get("RAW_TIME_MARGIN_SECONDS", "60"))
+
+@metrics.timed
 def download_and_extract_zip(bucket: str, key: str) -> str:
     """
     Baixa o arquivo zip do S3 e extrai seu conteúdo para um diretório temporário.
     """
     try:
-        zip_obj = s3_client.get_object(Bucket=bucket, Key=key)
-        buffer = io.BytesIO(zip_obj['Body'].read())
-        
+        # Download multipart concorrente direto para o buffer
+        buffer = io.BytesIO()
+        store.download(bucket, key, buffer)
+        buffer.seek(0)
+
         with zipfile.ZipFile(buffer) as zip_file:
-            temp_dir = '/tmp/extracted_data'
-            zip_file.extractall(temp_dir)
+            zip_file.extractall(extract_dir)
         
-        logger.info(f"Arquivo ZIP extraído com sucesso para {temp_dir}")
-        return temp_dir
-    except ClientError as e:
+        logger.info(f"Arquivo ZIP extraído com sucesso para {extract_dir}")
+        return extract_dir
+    except (object_store.ObjectNotFound, zipfile.BadZipFile) as e:
         logger.error(f"Erro ao baixar ou extrair o arquivo ZIP: {e}")
         raise
 
 def normalize_file_name(file_name: str) -> str:
     return re.sub(r"_PUF.*", "", file_name)
 
-def read_csv_with_options(file_path: str, chunksize: Optional[int] = None) -> Union[pd.DataFrame, pd.io.parsers.TextFileReader]:
+def read_csv_with_options(file_path: str, chunksize: Optional[int] = None, skip_rows: int = 0) -> Union[pd.DataFrame, pd.io.parsers.TextFileReader]:
+    # Retomada: pula as `skip_rows` primeiras linhas de dados, mantendo o cabeçalho
+    skiprows = range(1, skip_rows + 1) if skip_rows else None
     options = [
         {"header": 0},
         {"header": 0, "sep": ","},
@@ -58,14 +84,14 @@ def read_csv_with_options(file_path: str, chunksize: Optional[int] = None) -> Un
 
     for option in options:
         try:
-            return pd.read_csv(file_path, **option, low_memory=False, chunksize=chunksize)
+            return pd.read_csv(file_path, **option, low_memory=False, chunksize=chunksize, skiprows=skiprows)
         except Exception as e:
             logger.warning(f"Falha ao ler {file_path} com opções {option}: {str(e)}")
 
     logger.info(f"Tentando inferir schema manualmente para {file_path}")
     with open(file_path, 'r') as file:
         header = next(csv.reader(file))
-    return pd.read_csv(file_path, header=0, names=header, chunksize=chunksize)
+    return pd.read_csv(file_path, header=0, names=header, chunksize=chunksize, skiprows=skiprows)
 
 def validate_data(df: pd.DataFrame) -> Dict:
     total_rows = len(df)
@@ -91,87 +117,341 @@ def is_csv_file(filename: str) -> bool:
 def generate_version_hash(df: pd.DataFrame) -> str:
     return hashlib.md5(pd.util.hash_pandas_object(df).values).hexdigest()
 
-def save_to_s3(df: pd.DataFrame, bucket: str, key: str):
+def save_to_s3(df: pd.DataFrame, bucket: str, key: str, table_name: str):
     """
-    Salva o DataFrame como um arquivo Parquet no S3.
+    Salva o DataFrame como um arquivo Parquet no S3, no layout do perfil da tabela
+    (perfil RAW para as tabelas sem perfil próprio).
     """
     buffer = io.BytesIO()
-    df.to_parquet(buffer, engine='pyarrow', compression='snappy', index=False)
+    df.to_parquet(buffer, engine='pyarrow', index=False,
+                  **parquet_layout.write_options(table_name, df, parquet_layout.profile(table_name, parquet_layout.RAW)))
     buffer.seek(0)
-    s3_client.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+    store.put(bucket, key, buffer.getbuffer())
     logger.info(f"Arquivo salvo no S3: s3://{bucket}/{key}")
 
-def process_and_save_file(file_path: str, table_name: str) -> None:
+class TimeBudget:
+    """
+    Tempo restante da invocação. Esgota quando sobra menos que a margem mais o
+    chunk mais lento já visto, para haver tempo de gravar o checkpoint.
+    """
+
+    def __init__(self, context=None, seconds: Optional[float] = None):
+        self.context = context
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.slowest_chunk = 0.0
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is not None:
+            return self.deadline - time.monotonic()
+        if hasattr(self.context, "get_remaining_time_in_millis"):
+            return self.context.get_remaining_time_in_millis() / 1000
+        return None
+
+    def record_chunk(self, seconds: float) -> None:
+        self.slowest_chunk = max(self.slowest_chunk, seconds)
+
+    def exhausted(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining < time_margin_seconds + self.slowest_chunk
+
+def new_checkpoint(zip_etag: Optional[str]) -> Dict:
+    return {
+        "run_id": uuid.uuid4().hex,
+        "zip_etag": zip_etag,
+        "partition_date": pd.Timestamp.now().strftime("%Y%m%d"),
+        "completed": False,
+        "files": {},
+    }
+
+def load_checkpoint(zip_etag: Optional[str], continuation: Optional[str] = None) -> Dict:
+    """
+    Retoma o checkpoint de uma execução inacabada sobre o mesmo zip; senão, começa
+    uma execução nova. Um checkpoint inexistente ou ilegível é tratado como ausente.
+    """
+    try:
+        checkpoint = json.loads(store.get(checkpoint_bucket, checkpoint_key))
+    except object_store.ObjectNotFound:
+        checkpoint = None
+    except Exception as e:
+        logger.warning(f"Não foi possível ler o checkpoint s3://{checkpoint_bucket}/{checkpoint_key}: {str(e)}")
+        checkpoint = None
+
+    if checkpoint and not checkpoint.get("completed") and checkpoint.get("zip_etag") == zip_etag:
+        if continuation and continuation != checkpoint["run_id"]:
+            logger.warning(f"Token de continuação {continuation} não corresponde ao checkpoint {checkpoint['run_id']}; retomando o checkpoint")
+        logger.info(f"Retomando a execução {checkpoint['run_id']} (partição {checkpoint['partition_date']})")
+        metrics.count("checkpoint_resumes")
+        return checkpoint
+
+    if continuation:
+        logger.warning(f"Token de continuação {continuation} sem checkpoint pendente; iniciando nova execução")
+    return new_checkpoint(zip_etag)
+
+def save_checkpoint(checkpoint: Dict) -> None:
+    store.put(checkpoint_bucket, checkpoint_key, json.dumps(checkpoint, sort_keys=True).encode('utf-8'))
+
+def prepare_chunk(chunk: pd.DataFrame, table_name: str, partition_date: str) -> pd.DataFrame:
+    """Adiciona as colunas de controle ao chunk e registra a validação."""
+    chunk = chunk.infer_objects()
+    chunk['ingestDate'] = pd.Timestamp.now()
+    chunk['partitionDate'] = partition_date
+    chunk['version'] = generate_version_hash(chunk)
+
+    # Aqui você pode implementar a lógica para verificar dados existentes no S3, se necessário
+
+    validation_results = validate_data(chunk)
+    logger.info(f"Validação para {table_name}: {validation_results}")
+    return chunk
+
+def plan_work_units(file_path: str, file_key: str, table_name: str, partition_date: str,
+                    target_bytes: Optional[int] = None) -> List[Dict]:
+    """
+    Divide um CSV grande em shards. Cada descritor basta para processar o shard
+    em outro processo ou em outra Lambda (evento `{"work_unit": ...}`).
+    """
+    csv_format = csv_shards.detect_format(file_path)
+    header, shards = csv_shards.plan_shards(file_path, target_bytes=target_bytes, csv_format=csv_format)
+    logger.info(f"{file_key} dividido em {len(shards)} shards ({csv_format.encoding}, separador {csv_format.sep!r})")
+    return [{"file_key": file_key, "table": table_name, "partition_date": partition_date, "header": header,
+             "sep": csv_format.sep, "encoding": csv_format.encoding,
+             "shard": shard.index, "start": shard.start, "end": shard.end} for shard in shards]
+
+def process_shard(work_unit: Dict) -> Dict:
+    """
+    Processa um shard: um parquet por chunk, em `{tabela}_part{shard}_{chunk}.parquet`.
+    Os objetos de uma tentativa anterior do mesmo shard são removidos antes, para
+    que refazer o shard não duplique linhas.
+    """
+    started = time.monotonic()
+    table_name, partition_date = work_unit["table"], work_unit["partition_date"]
+    prefix = f"{table_name}/partition_date={partition_date}/{table_name}_part{work_unit['shard']:04d}_"
+    for info in list(store.list(output_bucket, prefix)):
+        store.delete(output_bucket, info.key)
+
+    file_path = os.path.join(extract_dir, work_unit["file_key"])
+    shard = csv_shards.Shard(work_unit["shard"], work_unit["start"], work_unit["end"])
+    # Planos gravados antes do formato no descritor eram lidos como UTF-8 com vírgula
+    csv_format = csv_shards.CsvFormat(work_unit.get("sep", ","), work_unit.get("encoding", "utf-8"))
+    chunker = chunking.AdaptiveChunker(table_name)
+    rows, objects = 0, []
+    for number, chunk in enumerate(csv_shards.iter_shard(file_path, work_unit["header"], shard, chunker, csv_format), 1):
+        if chunk.empty:
+            continue
+        chunk = prepare_chunk(chunk, table_name, partition_date)
+        s3_key = f"{prefix}{number}.parquet"
+        save_to_s3(chunk, output_bucket, s3_key, table_name)
+        rows += len(chunk)
+        objects.append(s3_key)
+        del chunk
+        gc.collect()
+    return {"shard": work_unit["shard"], "rows": rows, "objects": objects, "seconds": time.monotonic() - started}
+
+def _create_shard_pool(max_workers: int):
+    """
+    Cria o pool de processos dos shards. Onde não há suporte a semáforos de
+    multiprocessing (ex.: Lambda, sem /dev/shm), usa um pool de threads.
+    """
+    try:
+        return ProcessPoolExecutor(max_workers=max_workers)
+    except (OSError, NotImplementedError) as e:
+        logger.warning(f"Pool de processos indisponível ({e}); usando threads para os shards.")
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+def process_sharded_file(file_path: str, table_name: str, file_key: str, checkpoint: Dict, budget: TimeBudget,
+                         max_workers: int = shard_workers) -> bool:
+    """
+    Processa um CSV grande em shards paralelos. O plano fica no checkpoint, para
+    a retomada usar as mesmas faixas, e cada shard concluído é registrado nele.
+
+    Returns:
+    bool: False se o tempo da invocação esgotou antes de todos os shards.
+    """
+    state = checkpoint["files"][file_key]
+    if "work_units" not in state:
+        state["work_units"] = plan_work_units(file_path, file_key, table_name, checkpoint["partition_date"])
+        state["shards_done"] = {}
+        save_checkpoint(checkpoint)
+    pending = iter([unit for unit in state["work_units"] if str(unit["shard"]) not in state["shards_done"]])
+
+    with _create_shard_pool(max_workers) as pool:
+        running = {}
+
+        def submit() -> None:
+            unit = next(pending, None) if not budget.exhausted() else None
+            if unit is not None:
+                running[pool.submit(process_shard, unit)] = unit
+
+        for _ in range(max_workers):
+            submit()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                result = future.result()
+                state["shards_done"][str(result["shard"])] = {"rows": result["rows"], "objects": result["objects"]}
+                state.update(chunks=state["chunks"] + len(result["objects"]), rows=state["rows"] + result["rows"])
+                state["objects"].extend(result["objects"])
+                save_checkpoint(checkpoint)
+                metrics.count("rows_in", result["rows"], table=table_name)
+                metrics.count("rows_out", result["rows"], table=table_name)
+                metrics.observe("shard_seconds", result["seconds"], "Seconds", table=table_name)
+                logger.info(f"Shard {result['shard']} de {file_key} concluído: {result['rows']} linhas "
+                            f"em {result['seconds']:.1f} s ({len(state['shards_done'])}/{len(state['work_units'])})")
+                budget.record_chunk(result["seconds"])
+                submit()
+
+    return len(state["shards_done"]) == len(state["work_units"])
+
+@metrics.timed
+def process_and_save_file(file_path: str, table_name: str, file_key: str, checkpoint: Dict, budget: TimeBudget) -> bool:
+    """
+    Processa um CSV em chunks, registrando no checkpoint, a cada chunk salvo, as
+    linhas já lidas e os objetos gravados. Retoma do último chunk concluído; as
+    chaves dos chunks são determinísticas, então um chunk refeito sobrescreve o
+    anterior em vez de duplicá-lo. CSVs grandes vão para `process_sharded_file`.
+
+    Returns:
+    bool: False se o tempo da invocação esgotou antes do fim do arquivo.
+    """
+    state = checkpoint["files"].setdefault(file_key, {"status": "pending", "chunks": 0, "rows": 0, "objects": []})
+    if state["status"] in ("completed", "error"):
+        logger.info(f"Arquivo já processado nesta execução ({state['status']}): {file_path}")
+        return True
+
     try:
         logger.info(f"Começando o processamento do arquivo: {file_path}")
         if os.path.basename(file_path).startswith('.') or not is_csv_file(file_path):
             logger.info(f"Ignorando arquivo não CSV ou oculto: {file_path}")
-            return
+            return True
 
         if not os.path.exists(file_path):
             logger.info(f"Arquivo não encontrado: {file_path}")
-            return
+            return True
 
         table_name = normalize_file_name(os.path.basename(file_path))
-        chunk_size = 100000
-        chunks = read_csv_with_options(file_path, chunksize=chunk_size)
-    
-        compare_columns = None
-        new_records_total = 0
-        processed_chunks = 0
+        partition_date = checkpoint["partition_date"]
+        new_records_total = state["rows"]
 
-        for chunk in chunks:
-            processed_chunks += 1
-            logger.info(f"Processando chunk {processed_chunks} para {table_name}")
+        if "work_units" in state or os.path.getsize(file_path) >= shard_min_file_mb * 2**20:
+            if not process_sharded_file(file_path, table_name, file_key, checkpoint, budget):
+                logger.info(f"Tempo da invocação esgotando: {file_path} parado após {state['rows']} linhas")
+                return False
+        else:
+            if state["rows"]:
+                logger.info(f"Retomando {file_path} após {state['rows']} linhas ({state['chunks']} chunks)")
 
-            if chunk.empty:
-                continue
+            # O tamanho de cada chunk segue o orçamento de memória e os bytes por linha do arquivo
+            chunker = chunking.AdaptiveChunker(table_name)
+            chunks = chunking.iter_csv(read_csv_with_options(file_path, chunksize=chunking.SAMPLE_ROWS, skip_rows=state["rows"]), chunker)
 
-            chunk = chunk.infer_objects()
-            chunk['ingestDate'] = pd.Timestamp.now()
-            chunk['partitionDate'] = pd.Timestamp.now().strftime("%Y%m%d")
-            chunk['version'] = generate_version_hash(chunk)
+            for chunk in chunks:
+                started = time.monotonic()
+                processed_chunks = state["chunks"] + 1
+                logger.info(f"Processando chunk {processed_chunks} para {table_name} ({len(chunk)} linhas)")
 
-            if compare_columns is None:
-                compare_columns = [col for col in chunk.columns if col not in ["ingestDate", "partitionDate", "version"]]
+                if chunk.empty:
+                    continue
+                metrics.count("rows_in", len(chunk), table=table_name)
 
-            # Aqui você pode implementar a lógica para verificar dados existentes no S3, se necessário
+                chunk = prepare_chunk(chunk, table_name, partition_date)
 
-            validation_results = validate_data(chunk)
-            logger.info(f"Validação para {table_name}: {validation_results}")
+                # Salvar no S3
+                s3_key = f"{table_name}/partition_date={partition_date}/{table_name}_{processed_chunks}.parquet"
+                save_to_s3(chunk, output_bucket, s3_key, table_name)
 
-            # Salvar no S3
-            s3_key = f"{table_name}/partition_date={chunk['partitionDate'].iloc[0]}/{table_name}_{processed_chunks}.parquet"
-            save_to_s3(chunk, output_bucket, s3_key)
+                metrics.count("rows_out", len(chunk), table=table_name)
+                state.update(chunks=processed_chunks, rows=state["rows"] + len(chunk))
+                if s3_key not in state["objects"]:
+                    state["objects"].append(s3_key)
+                save_checkpoint(checkpoint)
 
-            new_records_total += len(chunk)
+                del chunk
+                gc.collect()
 
-            del chunk
-            gc.collect()
+                budget.record_chunk(time.monotonic() - started)
+                if budget.exhausted():
+                    logger.info(f"Tempo da invocação esgotando: {file_path} parado após {state['rows']} linhas")
+                    return False
+
+        if state["chunks"]:
+            # Ponteiro `{table_name}/_LATEST` lido pela trusted, sem listar o prefixo
+            partition_discovery.write_latest_pointer(f"{table_name}/", output_bucket, partition_date)
+        state["status"] = "completed"
+        save_checkpoint(checkpoint)
 
         logger.info(f"Processamento concluído para {file_path}")
-        logger.info(f"Total de novos registros para {table_name}: {new_records_total}")
+        logger.info(f"Total de novos registros para {table_name}: {state['rows'] - new_records_total} (acumulado: {state['rows']})")
 
     except Exception as e:
         logger.error(f"Erro ao processar {file_path}: {str(e)}")
         logger.error(traceback.format_exc())
+        state.update(status="error", error=str(e))
+        save_checkpoint(checkpoint)
+    return True
 
-def process_directory(base_path: str) -> None:
+def process_directory(base_path: str, checkpoint: Dict, budget: TimeBudget) -> bool:
+    """Processa os CSVs dos anos configurados; False se o tempo esgotou antes de terminar."""
     for root, _, files in os.walk(base_path):
         year = os.path.basename(root)
         if year in years_to_process:
-            for file in files:
+            for file in sorted(files):
                 if is_csv_file(file):
                     file_path = os.path.join(root, file)
                     normalized_name = normalize_file_name(file)
                     table_name = f"tb_{normalized_name.lower()}"
-                    process_and_save_file(file_path, table_name)
+                    if budget.exhausted():
+                        return False
+                    file_key = os.path.relpath(file_path, base_path)
+                    if not process_and_save_file(file_path, table_name, file_key, checkpoint, budget):
+                        return False
+    return True
 
 
+def handle_work_unit(work_unit: Dict) -> Dict:
+    """Processa um único shard (descritor de `plan_work_units`), para distribuir um CSV entre Lambdas."""
+    try:
+        if not os.path.exists(os.path.join(extract_dir, work_unit["file_key"])):
+            download_and_extract_zip(input_bucket, zip_key)
+        result = process_shard(work_unit)
+        metrics.count("rows_out", result["rows"], table=work_unit["table"])
+        return {"statusCode": 200, "body": json.dumps(result)}
+    except Exception as e:
+        logger.error(f"Erro ao processar o shard {work_unit.get('shard')} de {work_unit.get('file_key')}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {"statusCode": 400, "body": "error"}
+
+@metrics.stage("raw_processing")
 def handler(event, context):
+    """
+    Processa o zip da landing. Perto do limite de tempo da Lambda, grava o
+    checkpoint e responde com `continuation`; a próxima invocação (com esse
+    token ou não) retoma do último chunk concluído.
+
+    Event (opcional):
+    - continuation: token devolvido pela invocação anterior
+    - time_budget_seconds: limite de tempo da invocação fora da Lambda
+    - work_unit: processa só este shard (ver `plan_work_units`)
+    """
+    event = event or {}
+    if event.get("work_unit"):
+        return handle_work_unit(event["work_unit"])
     try:
+        zip_info = store.head(input_bucket, zip_key)
+        checkpoint = load_checkpoint(zip_info.etag if zip_info else None, event.get("continuation"))
+        budget = TimeBudget(context, event.get("time_budget_seconds"))
+
         extracted_path = download_and_extract_zip(input_bucket, zip_key)
-        process_directory(extracted_path)
+        completed = process_directory(extracted_path, checkpoint, budget)
+        checkpoint["completed"] = completed
+        save_checkpoint(checkpoint)
+
+        if not completed:
+            metrics.count("continuations")
+            return {
+                "statusCode": 200,
+                "body": "Tempo esgotado; continuar a partir do checkpoint",
+                "continuation": checkpoint["run_id"]
+            }
         return {
            "statusCode": 200,
             "body": "OK"
@@ -183,4 +463,3 @@ def handler(event, context):
          "statusCode": 400,
          "body": "error"
         }
-        
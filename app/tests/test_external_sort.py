@@ -0,0 +1,163 @@
+"""
+Testes do `external_sort`: ordenação e deduplicação em disco (orçamento de
+memória minúsculo) comparadas com o `sort_by` do pyarrow e com o
+`drop_duplicates` do pandas, com chaves nulas e NaN.
+
+Uso:
+    python -m pytest -q app/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trusted"))
+
+import external_sort
+
+# Configurações
+LINHAS = 3_000
+LOTE = 100
+ORCAMENTO_MINIMO_MB = 0.002   # ~2 KB: cada lote já passa do orçamento
+
+
+def tabela_de_teste(semente: int = 7) -> pa.Table:
+    """Chaves repetidas, com nulos (texto e inteiro) e NaN (float), e `v` único por linha."""
+    rng = np.random.default_rng(semente)
+    estado = rng.choice(["AK", "AL", "AZ", None], LINHAS).tolist()
+    ano = pa.array(rng.integers(2014, 2017, LINHAS), mask=rng.random(LINHAS) < 0.1)
+    taxa = rng.choice([0.5, 1.5, 2.5, np.nan], LINHAS)
+    return pa.table({
+        "estado": pa.array(estado, pa.large_string()),
+        "ano": ano,
+        "taxa": pa.array(taxa, pa.float64()),
+        "v": pa.array(np.arange(LINHAS), pa.int64()),
+    })
+
+
+def lotes(tabela: pa.Table):
+    return tabela.to_batches(max_chunksize=LOTE)
+
+
+def assert_tabelas_iguais(tabela: pa.Table, esperada: pa.Table):
+    # `Table.equals` não considera NaN igual a NaN
+    pd.testing.assert_frame_equal(tabela.to_pandas(), esperada.to_pandas())
+
+
+def ordenar_em_disco(tabela: pa.Table, chaves) -> pa.Table:
+    saida = list(external_sort.sort_batches(lotes(tabela), chaves, budget_mb=ORCAMENTO_MINIMO_MB, output_rows=LOTE))
+    return pa.Table.from_batches(saida, schema=tabela.schema)
+
+
+CHAVES_ORDENACAO = [
+    [("estado", "ascending")],
+    [("taxa", "descending")],
+    [("ano", "descending"), ("estado", "ascending")],
+    [("taxa", "ascending"), ("ano", "ascending"), ("estado", "descending")],
+]
+
+
+@pytest.mark.parametrize("chaves", CHAVES_ORDENACAO)
+def test_sort_batches_com_desempate_igual_ao_sort_by(chaves):
+    tabela = tabela_de_teste()
+    chaves = chaves + [("v", "ascending")]
+    assert_tabelas_iguais(ordenar_em_disco(tabela, chaves), tabela.sort_by(chaves))
+
+
+@pytest.mark.parametrize("chaves", CHAVES_ORDENACAO)
+def test_sort_batches_com_empates_mantem_ordem_e_linhas(chaves):
+    tabela = tabela_de_teste()
+    ordenada = ordenar_em_disco(tabela, chaves)
+    esperada = tabela.sort_by(chaves)
+    colunas = [coluna for coluna, _ in chaves]
+    assert_tabelas_iguais(ordenada.select(colunas), esperada.select(colunas))
+    assert sorted(ordenada.column("v").to_pylist()) == list(range(LINHAS))
+
+
+def test_sort_batches_dentro_do_orcamento():
+    tabela = tabela_de_teste()
+    chaves = [("estado", "ascending"), ("v", "descending")]
+    saida = external_sort.sort_batches(lotes(tabela), chaves, budget_mb=64)
+    assert_tabelas_iguais(pa.Table.from_batches(list(saida), schema=tabela.schema), tabela.sort_by(chaves))
+
+
+def test_sort_batches_sem_entrada():
+    assert list(external_sort.sort_batches([], ["estado"], budget_mb=ORCAMENTO_MINIMO_MB)) == []
+
+
+def deduplicado_pelo_pandas(tabela: pa.Table, subset, keep, order_by) -> pd.DataFrame:
+    df = tabela.to_pandas()
+    if order_by:
+        df = df.sort_values([coluna for coluna, _ in order_by], ascending=[o == "ascending" for _, o in order_by],
+                            kind="stable")
+    return df.drop_duplicates(subset=subset, keep=keep)
+
+
+def em_ordem_de_v(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values("v").reset_index(drop=True)
+
+
+def assert_frames_iguais(df: pd.DataFrame, esperado: pd.DataFrame):
+    # Sem nulos restantes, `ano` volta do Arrow como int64 e não float64
+    pd.testing.assert_frame_equal(df, esperado, check_dtype=False)
+
+
+@pytest.mark.parametrize("orcamento_mb", [ORCAMENTO_MINIMO_MB, 64])
+@pytest.mark.parametrize("keep", ["first", "last"])
+@pytest.mark.parametrize("subset, order_by", [
+    (["estado"], []),
+    (["estado", "ano"], [("v", "descending")]),
+    (["taxa"], [("ano", "descending")]),
+    (["estado", "ano", "taxa"], [("ano", "ascending")]),
+])
+def test_drop_duplicates_igual_ao_pandas(subset, order_by, keep, orcamento_mb):
+    tabela = tabela_de_teste()
+    saida = external_sort.drop_duplicates(lotes(tabela), subset, keep, order_by, budget_mb=orcamento_mb,
+                                          output_rows=LOTE)
+    resultado = pa.Table.from_batches(list(saida), schema=tabela.schema).to_pandas()
+    esperado = deduplicado_pelo_pandas(tabela, subset, keep, order_by)
+    assert_frames_iguais(em_ordem_de_v(resultado), em_ordem_de_v(esperado))
+
+
+def test_drop_duplicates_em_memoria_sai_na_ordem_do_order_by():
+    tabela = tabela_de_teste()
+    order_by = [("ano", "descending")]
+    saida = external_sort.drop_duplicates(lotes(tabela), ["estado", "ano"], "first", order_by, budget_mb=64)
+    resultado = pa.Table.from_batches(list(saida), schema=tabela.schema).to_pandas()
+    esperado = deduplicado_pelo_pandas(tabela, ["estado", "ano"], "first", order_by)
+    assert_frames_iguais(resultado, esperado.reset_index(drop=True))
+
+
+def test_drop_duplicates_reparticiona_partição_acima_do_orcamento(monkeypatch):
+    # Com 2 partições, cada uma passa do orçamento e é particionada de novo
+    monkeypatch.setattr(external_sort, "PARTITIONS", 2)
+    tabela = tabela_de_teste()
+    saida = external_sort.drop_duplicates(lotes(tabela), ["estado", "ano", "taxa"], "last", [("v", "ascending")],
+                                          budget_mb=ORCAMENTO_MINIMO_MB)
+    resultado = pa.Table.from_batches(list(saida), schema=tabela.schema).to_pandas()
+    esperado = deduplicado_pelo_pandas(tabela, ["estado", "ano", "taxa"], "last", [("v", "ascending")])
+    assert_frames_iguais(em_ordem_de_v(resultado), em_ordem_de_v(esperado))
+
+
+def test_drop_duplicates_sem_entrada():
+    assert list(external_sort.drop_duplicates([], ["estado"], budget_mb=ORCAMENTO_MINIMO_MB)) == []
+
+
+@pytest.mark.parametrize("frames", [[], [None, None]])
+def test_drop_duplicates_frame_sem_dataframes(frames):
+    resultado = external_sort.drop_duplicates_frame(frames, subset=["estado"])
+    assert isinstance(resultado, pd.DataFrame) and resultado.empty
+
+
+def test_drop_duplicates_frame_acima_do_orcamento_igual_ao_pandas():
+    df = tabela_de_teste().to_pandas()
+    partes = [df.iloc[:1_000], df.iloc[1_000:]]
+    order_by = [("ano", "descending")]
+    resultado = external_sort.drop_duplicates_frame(partes, ["estado", "ano"], "first", order_by,
+                                                    budget_mb=ORCAMENTO_MINIMO_MB)
+    esperado = deduplicado_pelo_pandas(tabela_de_teste(), ["estado", "ano"], "first", order_by)
+    assert_frames_iguais(em_ordem_de_v(resultado), em_ordem_de_v(esperado))
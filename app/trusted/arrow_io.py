@@ -0,0 +1,65 @@
+"""
+Leitura de Parquet do armazenamento de objetos direto para Arrow.
+
+O caminho antigo, `pd.read_parquet(BytesIO(store.get(...)))`, copia o corpo da
+resposta para `bytes`, de novo para o BytesIO e, na conversão para pandas,
+cada coluna mais uma vez (consolidando os blocos). Aqui:
+- o objeto chega como um `pyarrow.Buffer` (`object_store.get_buffer`): no S3,
+  lido direto para um buffer pré-alocado; no disco local, mapeado em memória
+- o Parquet é decodificado a partir desse buffer (`pa.BufferReader`, sem
+  cópia), só com as colunas pedidas e, com `filters`, só com os row groups que
+  as estatísticas não descartam
+- quem pode seguir em Arrow usa `read_table`; quem precisa de pandas usa
+  `read_pandas`/`to_pandas`, que convertem com split_blocks (um bloco por
+  coluna, sem consolidar) e self_destruct (cada coluna Arrow é liberada assim
+  que convertida), de modo que as duas cópias não coexistem inteiras
+
+O pico de memória por arquivo fica em torno de um payload mais os dados
+decodificados, em vez de três ou quatro cópias.
+
+Quem processa o arquivo em lotes usa `iter_batches`, que decodifica um lote
+(RecordBatch) por vez a partir do mesmo buffer.
+
+Uso:
+    tabela = arrow_io.read_table("raw-test-edb", key, columns=COLUMNS)
+    for batch in arrow_io.iter_batches("raw-test-edb", key, columns=COLUMNS): ...
+    df = arrow_io.read_pandas("raw-test-edb", key, columns=COLUMNS)
+    df = arrow_io.to_pandas(tabela)  # a tabela fica inutilizável
+"""
+
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import object_store
+
+# Configurações
+BATCH_ROWS = 64 * 1024
+
+
+def read_table(bucket: str, key: str, columns: Optional[List[str]] = None, filters=None, store=None) -> pa.Table:
+    """Lê um objeto Parquet como tabela Arrow, a partir do buffer do objeto, sem cópias intermediárias."""
+    buffer = (store or object_store.get_store()).get_buffer(bucket, key)
+    return pq.read_table(pa.BufferReader(buffer), columns=columns, filters=filters)
+
+
+def iter_batches(bucket: str, key: str, columns: Optional[List[str]] = None, batch_size: int = BATCH_ROWS,
+                 store=None) -> Iterator[pa.RecordBatch]:
+    """Lê um objeto Parquet em lotes de até `batch_size` linhas, a partir do buffer do objeto."""
+    buffer = (store or object_store.get_store()).get_buffer(bucket, key)
+    yield from pq.ParquetFile(pa.BufferReader(buffer)).iter_batches(batch_size=batch_size, columns=columns,
+                                                                     use_threads=False)
+
+
+def to_pandas(table: pa.Table) -> pd.DataFrame:
+    """
+    Converte para pandas liberando cada coluna Arrow ao convertê-la. A tabela
+    não pode ser usada depois.
+    """
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_pandas(bucket: str, key: str, columns: Optional[List[str]] = None, filters=None, store=None) -> pd.DataFrame:
+    """Lê um objeto Parquet como DataFrame, pelo caminho Arrow de `read_table` e `to_pandas`."""
+    return to_pandas(read_table(bucket, key, columns, filters, store))
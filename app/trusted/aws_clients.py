@@ -0,0 +1,94 @@
+"""
+Clientes AWS compartilhados e criados sob demanda.
+
+Um cliente por serviço e por processo, criado no primeiro uso (o boto3 só é
+importado nesse momento, fora do init da Lambda) e compartilhado entre módulos
+e threads. O acesso ao S3 das etapas passa por `object_store`, que usa o
+cliente daqui.
+
+Cada requisição dos clientes é registrada em `metrics` (aws_requests,
+aws_request_ms e aws_retries, por serviço e operação), pelos eventos do botocore.
+
+A configuração dos clientes (pool de conexões, retries com backoff e timeouts)
+fica aqui, por variáveis de ambiente:
+- AWS_MAX_POOL_CONNECTIONS: conexões HTTP simultâneas por cliente (padrão 50,
+  acima das threads de I/O do quality_valid; o padrão do botocore é 10)
+- AWS_RETRY_MODE / AWS_MAX_ATTEMPTS: modo e tentativas do botocore ('standard',
+  com backoff exponencial e jitter; 5 tentativas)
+- AWS_CONNECT_TIMEOUT / AWS_READ_TIMEOUT: em segundos
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict
+
+import metrics
+
+# Configurações
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50"))
+RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "standard")
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "5"))
+CONNECT_TIMEOUT = float(os.environ.get("AWS_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("AWS_READ_TIMEOUT", "60"))
+
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _before_call(context, **kwargs):
+    context["metrics_start"] = time.perf_counter()
+
+
+def _record_call(event_name: str, context: dict, failed: bool, retries: int = 0) -> None:
+    # event_name: "<evento>.<serviço>.<operação>"
+    _, service, operation = event_name.split(".", 2)
+    dims = {"service": service, "operation": operation}
+    if "metrics_start" in context:
+        metrics.observe("aws_request_ms", (time.perf_counter() - context.pop("metrics_start")) * 1000, **dims)
+    metrics.count("aws_requests", **dims)
+    if retries:
+        metrics.count("aws_retries", retries, **dims)
+    if failed:
+        metrics.count("aws_errors", **dims)
+
+
+def _after_call(event_name, http_response, parsed, context, **kwargs):
+    retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    _record_call(event_name, context, http_response.status_code >= 300, retries)
+
+
+def _after_call_error(event_name, context, **kwargs):
+    _record_call(event_name, context, True)
+
+
+def get_client(service: str):
+    """
+    Retorna o cliente boto3 do serviço, criando-o na primeira chamada.
+
+    Args:
+    service (str): Nome do serviço AWS (ex.: 's3').
+
+    Returns:
+    O cliente boto3 compartilhado do processo.
+    """
+    client = _clients.get(service)
+    if client is None:
+        with _lock:
+            client = _clients.get(service)
+            if client is None:
+                import boto3
+                from botocore.config import Config
+                config = Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"mode": RETRY_MODE, "max_attempts": MAX_ATTEMPTS},
+                    connect_timeout=CONNECT_TIMEOUT,
+                    read_timeout=READ_TIMEOUT,
+                )
+                client = boto3.client(service, config=config)
+                client.meta.events.register("before-call", _before_call)
+                client.meta.events.register("after-call", _after_call)
+                client.meta.events.register("after-call-error", _after_call_error)
+                _clients[service] = client
+    return client
+
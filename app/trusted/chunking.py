@@ -0,0 +1,180 @@
+"""
+Chunks de tamanho adaptativo, limitados por um orçamento de memória.
+
+Em vez de um número fixo de linhas por chunk (que estoura a memória com as
+linhas largas do Plan_Attributes e subaproveita as estreitas do CEP), o
+`AdaptiveChunker` mede os bytes por linha já em memória (pandas, `deep=True`)
+numa amostra inicial e dimensiona cada chunk para caber no orçamento:
+
+    linhas = orçamento / bytes_por_linha   (limitado a [MIN_ROWS, MAX_ROWS])
+
+A medida é refeita a cada chunk (média móvel), e sob pressão de memória (RSS do
+processo acima de PRESSURE_FRACTION do limite) o orçamento cai pela metade,
+até SHRINK_FLOOR do original; ele volta a crescer aos poucos quando a pressão
+passa. Os tamanhos gerados vão para as métricas: chunk_rows (histograma),
+bytes_per_row (gauge) e chunk_shrinks (contador), por tabela.
+
+Configurações, por variáveis de ambiente:
+- CHUNK_MEMORY_BUDGET_MB: orçamento por chunk, em MB
+- CHUNK_MEMORY_FRACTION: sem orçamento explícito, a fração do limite de
+  memória usada por chunk (padrão 0.1)
+- CHUNK_MEMORY_LIMIT_MB: limite de memória (padrão: a memória da Lambda, em
+  AWS_LAMBDA_FUNCTION_MEMORY_SIZE, ou a memória física fora dela)
+
+Uso:
+    chunker = chunking.AdaptiveChunker("Rate")
+    for chunk in chunking.iter_csv(reader, chunker): ...
+    for chunk in chunking.iter_table(table, chunker): ...
+    for chunk in chunking.iter_frame(df, chunker): ...
+"""
+
+import os
+import logging
+from typing import Callable, Iterator, Optional
+
+import pandas as pd
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _physical_memory_mb() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+    except (ValueError, OSError, AttributeError):
+        return 1024
+
+
+# Configurações
+MEMORY_LIMIT_MB = int(os.environ.get("CHUNK_MEMORY_LIMIT_MB")
+                      or os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+                      or _physical_memory_mb())
+MEMORY_FRACTION = float(os.environ.get("CHUNK_MEMORY_FRACTION", "0.1"))
+MEMORY_BUDGET_MB = float(os.environ.get("CHUNK_MEMORY_BUDGET_MB") or MEMORY_LIMIT_MB * MEMORY_FRACTION)
+SAMPLE_ROWS = 1_000         # amostra inicial usada para medir os bytes por linha
+MIN_ROWS = 1_000
+MAX_ROWS = 2_000_000
+PRESSURE_FRACTION = 0.7     # RSS acima desta fração do limite reduz o orçamento
+SHRINK_FLOOR = 1 / 16       # menor fração do orçamento original após reduções
+SMOOTHING = 0.5             # peso da última medida na média de bytes por linha
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as status:
+            return next(int(line.split()[1]) for line in status if line.startswith("VmRSS:")) / 1024
+    except (OSError, StopIteration):
+        return None
+
+
+class AdaptiveChunker:
+    """Escolhe o número de linhas do próximo chunk a partir do orçamento de memória."""
+
+    def __init__(self, table: str, budget_mb: Optional[float] = None,
+                 min_rows: int = MIN_ROWS, max_rows: int = MAX_ROWS):
+        self.table = table
+        self.budget_bytes = (budget_mb or MEMORY_BUDGET_MB) * 2**20
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.scale = 1.0
+        self.bytes_per_row: Optional[float] = None
+
+    def observe(self, df: pd.DataFrame) -> None:
+        """Atualiza os bytes por linha com um chunk (ou amostra) já carregado."""
+        if len(df) == 0:
+            return
+        medida = df.memory_usage(index=True, deep=True).sum() / len(df)
+        if self.bytes_per_row is None:
+            self.bytes_per_row = medida
+        else:
+            self.bytes_per_row = SMOOTHING * medida + (1 - SMOOTHING) * self.bytes_per_row
+        metrics.gauge("bytes_per_row", round(self.bytes_per_row, 1), "Bytes", table=self.table)
+
+    def _check_pressure(self) -> None:
+        rss = _rss_mb()
+        if rss is None:
+            return
+        if rss > PRESSURE_FRACTION * MEMORY_LIMIT_MB:
+            if self.scale > SHRINK_FLOOR:
+                self.scale = max(SHRINK_FLOOR, self.scale / 2)
+                metrics.count("chunk_shrinks", table=self.table)
+                logger.warning(f"Pressão de memória em {self.table} ({rss:.0f} MB de {MEMORY_LIMIT_MB} MB): "
+                               f"orçamento do chunk reduzido para {self.scale:.0%}")
+        elif self.scale < 1.0:
+            self.scale = min(1.0, self.scale * 1.25)
+
+    def next_rows(self) -> int:
+        """Linhas do próximo chunk; sem medida ainda, o tamanho da amostra."""
+        if self.bytes_per_row is None:
+            return SAMPLE_ROWS
+        self._check_pressure()
+        linhas = int(self.budget_bytes * self.scale / max(self.bytes_per_row, 1.0))
+        return max(self.min_rows, min(self.max_rows, linhas))
+
+
+def iter_chunks(read: Callable[[int], Optional[pd.DataFrame]], chunker: AdaptiveChunker) -> Iterator[pd.DataFrame]:
+    """
+    Gera chunks a partir de `read(n)`, que devolve as próximas n linhas (ou None
+    no fim). A amostra inicial é juntada ao primeiro chunk, que já sai no
+    tamanho do orçamento.
+    """
+    amostra = read(SAMPLE_ROWS)
+    if amostra is None:
+        return
+    chunker.observe(amostra)
+    if len(amostra) == SAMPLE_ROWS:
+        resto = read(max(chunker.next_rows() - SAMPLE_ROWS, 1))
+        if resto is not None:
+            amostra = pd.concat([amostra, resto])
+    metrics.observe("chunk_rows", len(amostra), "Count", table=chunker.table)
+    yield amostra
+
+    while True:
+        chunk = read(chunker.next_rows())
+        if chunk is None:
+            return
+        chunker.observe(chunk)
+        metrics.observe("chunk_rows", len(chunk), "Count", table=chunker.table)
+        yield chunk
+
+
+def iter_csv(reader, chunker: AdaptiveChunker) -> Iterator[pd.DataFrame]:
+    """Chunks de um `pd.read_csv(..., chunksize=...)` (TextFileReader), no tamanho do orçamento."""
+    def read(n: int) -> Optional[pd.DataFrame]:
+        try:
+            return reader.get_chunk(n)
+        except StopIteration:
+            return None
+    try:
+        yield from iter_chunks(read, chunker)
+    finally:
+        reader.close()
+
+
+def iter_table(table, chunker: AdaptiveChunker) -> Iterator[pd.DataFrame]:
+    """Chunks (em pandas) de uma tabela pyarrow, fatiada sem cópia."""
+    posicao = 0
+
+    def read(n: int) -> Optional[pd.DataFrame]:
+        nonlocal posicao
+        if posicao >= table.num_rows:
+            return None
+        fatia = table.slice(posicao, n).to_pandas()
+        fatia.index = pd.RangeIndex(posicao, posicao + len(fatia))
+        posicao += len(fatia)
+        return fatia
+    return iter_chunks(read, chunker)
+
+
+def iter_frame(df: pd.DataFrame, chunker: AdaptiveChunker) -> Iterator[pd.DataFrame]:
+    """Chunks de um DataFrame já carregado."""
+    posicao = 0
+
+    def read(n: int) -> Optional[pd.DataFrame]:
+        nonlocal posicao
+        if posicao >= len(df):
+            return None
+        fatia = df.iloc[posicao:posicao + n]
+        posicao += len(fatia)
+        return fatia
+    return iter_chunks(read, chunker)
@@ -0,0 +1,149 @@
+"""
+Clusterização das saídas trusted pelas chaves de consulta, para poda por row group.
+
+As consultas da gold filtram e agrupam por StateCode, BusinessYear e PlanId,
+mas as linhas chegam na ordem dos arquivos da raw: cada row group cobre quase
+todos os valores e as estatísticas min/max não descartam nenhum. Ordenando a
+tabela pelas chaves antes da escrita, cada row group cobre uma faixa estreita e
+um filtro de igualdade lê só os row groups que podem conter o valor.
+
+Métodos (campo `cluster_method` do perfil em `parquet_layout`):
+- "sort": ordem lexicográfica pelas chaves; ótimo para filtros na primeira
+  chave (e nas seguintes combinadas com ela)
+- "zorder": ordem pela curva Z dos ranks densos das chaves (bits intercalados),
+  que divide a poda entre as chaves quando os filtros usam qualquer uma delas
+
+Acima do orçamento de memória a ordenação vai para o `external_sort` (runs em
+disco e merge em streaming), sem uma segunda cópia da tabela em memória.
+
+`pruning_report` mede o efeito: para cada predicado, quantos row groups de um
+arquivo as estatísticas descartam. O benchmark `app/benchmarks/bench_clustering.py`
+compara os métodos nas tabelas silver.
+
+Uso:
+    for batch in clustering.cluster_batches(tabela, ("StateCode", "PlanId"), "zorder", name=TABLE_NAME): ...
+    clustering.pruning_report(pa.BufferReader(dados), [[("StateCode", "==", "TX")]])
+"""
+
+import logging
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import external_sort
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+METHODS = ("sort", "zorder")
+ZORDER_COLUMN = "__zorder"
+ZORDER_BITS = 63   # bits da chave Z, divididos entre as colunas
+
+Predicate = List[Tuple[str, str, object]]   # conjunção de (coluna, operador, valor)
+
+
+def present_keys(table: pa.Table, keys: Sequence[str], name: str = "") -> Tuple[str, ...]:
+    """Chaves de clusterização que existem na tabela (as ausentes são ignoradas com aviso)."""
+    ausentes = [key for key in keys if key not in table.column_names]
+    if ausentes:
+        logger.warning(f"Chaves de clusterização ausentes em {name or 'tabela'}: {ausentes}")
+    return tuple(key for key in keys if key in table.column_names)
+
+
+def zorder_values(table: pa.Table, keys: Sequence[str]) -> pa.Array:
+    """
+    Chave Z (uint64) de cada linha: o rank denso de cada coluna, reduzido a
+    ZORDER_BITS / len(keys) bits, com os bits das colunas intercalados.
+    """
+    bits = max(1, ZORDER_BITS // len(keys))
+    topo = 2**bits - 1
+    chave = np.zeros(table.num_rows, dtype=np.uint64)
+    for posicao, key in enumerate(keys):
+        # Rank denso, nulos por último; começa em 1
+        ranks = pc.rank(table.column(key).combine_chunks(), sort_keys="ascending",
+                        tiebreaker="dense").to_numpy().astype(np.uint64) - np.uint64(1)
+        maior = int(ranks.max()) if len(ranks) else 0
+        if maior > topo:
+            ranks = (ranks.astype(np.float64) * (topo / maior)).astype(np.uint64)
+        for bit in range(bits):
+            chave |= ((ranks >> np.uint64(bit)) & np.uint64(1)) << np.uint64(bit * len(keys) + posicao)
+    return pa.array(chave, type=pa.uint64())
+
+
+def cluster_batches(table: pa.Table, keys: Sequence[str], method: str = "sort", name: str = "cluster",
+                    budget_mb: Optional[float] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Lotes da tabela na ordem de clusterização. Sem chaves presentes, a tabela
+    sai na ordem original.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Método de clusterização desconhecido: {method} (use {METHODS})")
+    keys = present_keys(table, keys, name)
+    if not keys or table.num_rows == 0:
+        yield from table.to_batches()
+        return
+
+    if method == "sort":
+        yield from external_sort.sort_table(table, keys, budget_mb, name=name)
+        return
+    chaveada = table.append_column(ZORDER_COLUMN, zorder_values(table, keys))
+    for batch in external_sort.sort_table(chaveada, [ZORDER_COLUMN], budget_mb, name=name):
+        yield batch.drop_columns([ZORDER_COLUMN])
+
+
+def cluster(table: pa.Table, keys: Sequence[str], method: str = "sort", name: str = "cluster",
+            budget_mb: Optional[float] = None) -> pa.Table:
+    """A tabela inteira na ordem de clusterização."""
+    return pa.Table.from_batches(list(cluster_batches(table, keys, method, name, budget_mb)), schema=table.schema)
+
+
+def _excludes(statistics, op: str, value) -> bool:
+    """Se as estatísticas min/max de um row group garantem que nenhuma linha atende (coluna op valor)."""
+    if statistics is None or not statistics.has_min_max:
+        return False
+    minimo, maximo = statistics.min, statistics.max
+    try:
+        if op in ("==", "="):
+            return value < minimo or value > maximo
+        if op == "<":
+            return minimo >= value
+        if op == "<=":
+            return minimo > value
+        if op == ">":
+            return maximo <= value
+        if op == ">=":
+            return maximo < value
+        if op == "in":
+            return all(v < minimo or v > maximo for v in value)
+    except TypeError:
+        return False
+    return False
+
+
+def pruning_report(source, predicates: Sequence[Predicate]) -> List[Dict]:
+    """
+    Row groups descartados pelas estatísticas para cada predicado (conjunção de
+    condições; um row group é descartado se qualquer condição o exclui).
+
+    Returns:
+    List[Dict]: Por predicado: predicate, row_groups, skipped e skipped_fraction.
+    """
+    metadados = pq.ParquetFile(source).metadata
+    posicoes = {metadados.schema.column(i).path: i for i in range(metadados.num_columns)}
+    relatorio = []
+    for predicado in predicates:
+        descartados = 0
+        for grupo in range(metadados.num_row_groups):
+            row_group = metadados.row_group(grupo)
+            if any(coluna in posicoes and _excludes(row_group.column(posicoes[coluna]).statistics, op, valor)
+                   for coluna, op, valor in predicado):
+                descartados += 1
+        relatorio.append({
+            "predicate": " and ".join(f"{coluna} {op} {valor!r}" for coluna, op, valor in predicado),
+            "row_groups": metadados.num_row_groups,
+            "skipped": descartados,
+            "skipped_fraction": round(descartados / metadados.num_row_groups, 3) if metadados.num_row_groups else None,
+        })
+    return relatorio
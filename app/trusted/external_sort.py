@@ -0,0 +1,384 @@
+"""
+Ordenação e deduplicação externas de tabelas Arrow, com memória limitada.
+
+Ordenar uma tabela com `Table.sort_by` materializa uma cópia inteira dela
+(índices + `take`). Acima do orçamento de memória, `sort_batches` lê a entrada
+em blocos de até o orçamento, ordena cada bloco em memória e o grava como um
+run em Arrow IPC no disco local (/tmp na Lambda); depois intercala os runs,
+lidos por memory map, em lotes:
+
+    limite = a menor última chave entre os lotes atuais dos runs não esgotados
+    saída  = as linhas <= limite de todos os lotes, ordenadas em memória
+
+O run que define o limite esvazia o lote dele a cada passo, então o merge
+sempre avança, e nenhuma linha ainda no disco pode ser menor que o limite. A
+memória usada fica em torno de um lote por run.
+
+A ordenação segue a do `sort_by` do pyarrow: nulos no fim (e NaN logo antes
+deles), em ordem crescente ou decrescente por chave.
+
+`drop_duplicates` remove linhas repetidas nas colunas `subset`, mantendo a
+primeira (ou a última) de cada grupo na ordem `order_by` (empates pela ordem de
+entrada), como `sort_values(order_by, kind="stable").drop_duplicates(subset)`
+do pandas. Cabendo no orçamento, deduplica em memória (group_by do Arrow);
+senão particiona as linhas pelo hash das colunas `subset` em PARTITIONS
+arquivos Arrow IPC no disco, de modo que linhas iguais caem na mesma partição,
+e deduplica uma partição por vez (uma partição ainda grande demais é
+particionada de novo, com outra semente). Na saída particionada, as linhas
+ficam em ordem `order_by` dentro de cada partição, não no total.
+
+`drop_duplicates_frame` é a entrada para DataFrames já em memória: abaixo do
+orçamento usa o próprio pandas, acima dele passa pelo caminho em disco (com uma
+cópia Arrow dos frames). Quem lê Parquet deve passar os lotes do arquivo direto
+para `drop_duplicates`, como o tb_silver_zipcodes, sem materializar a entrada.
+
+Configurações, por variáveis de ambiente:
+- EXTERNAL_SORT_MEMORY_MB: orçamento em MB (padrão: o de chunk do `chunking`)
+- EXTERNAL_SORT_DIR: diretório dos runs (padrão: o temporário do sistema)
+- EXTERNAL_SORT_PARTITIONS: partições da deduplicação em disco (padrão 16)
+
+Uso:
+    for batch in external_sort.sort_table(tabela, [("StateCode", "ascending")]): ...
+    for batch in external_sort.sort_batches(batches, ["PlanId"], budget_mb=256): ...
+    unicos = external_sort.drop_duplicates_table(tabela, subset=["PlanId"], keep="last")
+    df = external_sort.drop_duplicates_frame([df1, df2], subset=colunas, order_by=[("partitionDate", "descending")])
+"""
+
+import os
+import math
+import logging
+import tempfile
+import functools
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import chunking
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+MEMORY_BUDGET_MB = float(os.environ.get("EXTERNAL_SORT_MEMORY_MB") or chunking.MEMORY_BUDGET_MB)
+SPILL_DIR = os.environ.get("EXTERNAL_SORT_DIR") or tempfile.gettempdir()
+RUN_BATCHES = 16           # lotes por run no disco (o merge mantém um lote de cada run em memória)
+MIN_BATCH_ROWS = 1_024
+OUTPUT_BATCH_ROWS = 64 * 1024
+PARTITIONS = int(os.environ.get("EXTERNAL_SORT_PARTITIONS", "16"))
+MAX_PARTITION_DEPTH = 3    # reparticionamentos de uma partição que não coube no orçamento
+SEQUENCE_COLUMN = "__seq"  # posição de entrada, para desempate e para o keep
+
+SortKeys = Sequence[Union[str, Tuple[str, str]]]
+
+
+def normalize_keys(sort_keys: SortKeys) -> List[Tuple[str, str]]:
+    """Chaves como pares (coluna, "ascending" | "descending")."""
+    return [(key, "ascending") if isinstance(key, str) else (key[0], key[1]) for key in sort_keys]
+
+
+def _is_nan(value) -> bool:
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _compare_values(a, b, order: str) -> int:
+    # Classes na ordem do sort_by: valores, NaN, nulos (as duas últimas no fim em qualquer sentido)
+    classe_a = 2 if a is None else 1 if _is_nan(a) else 0
+    classe_b = 2 if b is None else 1 if _is_nan(b) else 0
+    if classe_a != classe_b or classe_a:
+        return (classe_a > classe_b) - (classe_a < classe_b)
+    resultado = (a > b) - (a < b)
+    return resultado if order == "ascending" else -resultado
+
+
+def _compare_rows(a: tuple, b: tuple, keys: List[Tuple[str, str]]) -> int:
+    for x, y, (_, order) in zip(a, b, keys):
+        resultado = _compare_values(x, y, order)
+        if resultado:
+            return resultado
+    return 0
+
+
+def _last_key(table: pa.Table, keys: List[Tuple[str, str]]) -> tuple:
+    return tuple(table.column(column)[table.num_rows - 1].as_py() for column, _ in keys)
+
+
+def _before_or_equal(table: pa.Table, keys: List[Tuple[str, str]], bound: tuple) -> pa.ChunkedArray:
+    """Máscara das linhas com chave <= `bound`, na ordem do sort_by."""
+    mascara = None
+    # Monta de trás para frente: (k1 < b1) | (k1 == b1 & ((k2 < b2) | (k2 == b2 & ...)))
+    for (column, order), value in reversed(list(zip(keys, bound))):
+        coluna = table.column(column)
+        if value is None:
+            antes, igual = pc.is_valid(coluna), pc.is_null(coluna)
+        elif _is_nan(value):
+            igual = pc.fill_null(pc.is_nan(coluna), False)
+            antes = pc.and_(pc.is_valid(coluna), pc.invert(igual))
+        else:
+            escalar = pa.scalar(value, type=coluna.type)
+            comparar = pc.less if order == "ascending" else pc.greater
+            antes = pc.fill_null(comparar(coluna, escalar), False)
+            igual = pc.fill_null(pc.equal(coluna, escalar), False)
+        mascara = pc.or_(antes, igual if mascara is None else pc.and_(igual, mascara))
+    return mascara
+
+
+def _write_run(batches: List[pa.RecordBatch], keys: List[Tuple[str, str]], directory: str, index: int) -> str:
+    run = pa.Table.from_batches(batches).sort_by(keys)
+    path = os.path.join(directory, f"run_{index:05d}.arrow")
+    batch_rows = max(MIN_BATCH_ROWS, math.ceil(run.num_rows / RUN_BATCHES))
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, run.schema) as writer:
+        for batch in run.to_batches(max_chunksize=batch_rows):
+            writer.write_batch(batch)
+    return path
+
+
+class _Run:
+    """Um run no disco, lido lote a lote por memory map."""
+
+    def __init__(self, path: str):
+        self._reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        self._next = 0
+        self.pending: Optional[pa.Table] = None
+        self.load()
+
+    @property
+    def exhausted(self) -> bool:
+        return self._next >= self._reader.num_record_batches
+
+    def load(self) -> None:
+        """Carrega o próximo lote quando o atual acabou."""
+        while (self.pending is None or self.pending.num_rows == 0) and not self.exhausted:
+            self.pending = pa.Table.from_batches([self._reader.get_batch(self._next)])
+            self._next += 1
+
+
+def _merge_runs(paths: List[str], keys: List[Tuple[str, str]], output_rows: int) -> Iterator[pa.RecordBatch]:
+    runs = [_Run(path) for path in paths]
+    comparar = functools.cmp_to_key(lambda a, b: _compare_rows(a, b, keys))
+    while True:
+        ativos = [run for run in runs if run.pending is not None and run.pending.num_rows]
+        if not ativos:
+            return
+        abertos = [run for run in ativos if not run.exhausted]
+        partes = []
+        if not abertos:
+            # Nenhum run tem mais lotes no disco: o que sobrou sai inteiro
+            partes = [run.pending for run in ativos]
+            for run in ativos:
+                run.pending = None
+        else:
+            limite = min((_last_key(run.pending, keys) for run in abertos), key=comparar)
+            for run in ativos:
+                mascara = _before_or_equal(run.pending, keys, limite)
+                partes.append(run.pending.filter(mascara))
+                run.pending = run.pending.filter(pc.invert(mascara))
+                run.load()
+        saida = pa.concat_tables(partes).sort_by(keys)
+        yield from saida.to_batches(max_chunksize=output_rows)
+
+
+def sort_batches(batches: Iterable[pa.RecordBatch], sort_keys: SortKeys, budget_mb: Optional[float] = None,
+                 name: str = "sort", output_rows: int = OUTPUT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """
+    Ordena um fluxo de RecordBatches (de mesmo schema) pelas chaves. Cabendo no
+    orçamento, ordena em memória; senão grava runs ordenados em disco e os
+    intercala em streaming.
+
+    Returns:
+    Iterator[pa.RecordBatch]: Lotes ordenados, de até `output_rows` linhas.
+    """
+    keys = normalize_keys(sort_keys)
+    orcamento = (budget_mb or MEMORY_BUDGET_MB) * 2**20
+    bloco: List[pa.RecordBatch] = []
+    bytes_bloco = 0
+    runs: List[str] = []
+
+    with tempfile.TemporaryDirectory(prefix="external_sort_", dir=SPILL_DIR) as diretorio:
+        for batch in batches:
+            bloco.append(batch)
+            bytes_bloco += batch.nbytes
+            if bytes_bloco >= orcamento:
+                runs.append(_write_run(bloco, keys, diretorio, len(runs)))
+                metrics.count("sort_spill_bytes", bytes_bloco, "Bytes", table=name)
+                bloco, bytes_bloco = [], 0
+
+        if not runs:
+            if bloco:
+                yield from pa.Table.from_batches(bloco).sort_by(keys).to_batches(max_chunksize=output_rows)
+            return
+
+        if bloco:
+            runs.append(_write_run(bloco, keys, diretorio, len(runs)))
+            metrics.count("sort_spill_bytes", bytes_bloco, "Bytes", table=name)
+            bloco = []
+        metrics.count("sort_runs", len(runs), table=name)
+        logger.info(f"Ordenação externa de {name}: {len(runs)} runs em disco")
+        yield from _merge_runs(runs, keys, output_rows)
+
+
+def sort_table(table: pa.Table, sort_keys: SortKeys, budget_mb: Optional[float] = None,
+               name: str = "sort", output_rows: int = OUTPUT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """Ordena uma tabela; acima do orçamento, pelos runs em disco, sem cópia ordenada inteira em memória."""
+    orcamento = (budget_mb or MEMORY_BUDGET_MB) * 2**20
+    if table.nbytes <= orcamento:
+        yield from table.sort_by(normalize_keys(sort_keys)).to_batches(max_chunksize=output_rows)
+        return
+    # Fatias sem cópia, de ~1/4 do orçamento, para os runs fecharem perto dele
+    linhas = max(MIN_BATCH_ROWS, int(table.num_rows * orcamento / 4 / max(table.nbytes, 1)))
+    yield from sort_batches(table.to_batches(max_chunksize=linhas), sort_keys, budget_mb, name, output_rows)
+
+
+def _dedupe_in_memory(table: pa.Table, subset: List[str], keep: str, order_by: List[Tuple[str, str]]) -> pa.Table:
+    """Deduplica uma tabela com a coluna de sequência; devolve as linhas mantidas na ordem `order_by`."""
+    ordem = pc.sort_indices(table, sort_keys=order_by + [(SEQUENCE_COLUMN, "ascending")])
+    posicao = np.empty(table.num_rows, dtype=np.int64)
+    posicao[ordem.to_numpy()] = np.arange(table.num_rows)
+    agregacao = "min" if keep == "first" else "max"
+    grupos = (table.select(subset).append_column("__rank", pa.array(posicao))
+              .group_by(subset, use_threads=False).aggregate([("__rank", agregacao)]))
+    mantidas = np.sort(grupos.column(f"__rank_{agregacao}").to_numpy())
+    return table.take(ordem.take(pa.array(mantidas)))
+
+
+def _partition_of(batch: pa.RecordBatch, subset: List[str], partitions: int, depth: int) -> np.ndarray:
+    # hash_pandas_object é estável entre lotes; a semente muda a cada reparticionamento. Inteiros e
+    # booleanos vão como float64, senão viram float só nos lotes com nulos e o mesmo valor muda de hash
+    chaves = pa.table([
+        pc.cast(coluna, pa.float64(), safe=False) if pa.types.is_integer(coluna.type) or pa.types.is_boolean(coluna.type)
+        else coluna
+        for coluna in batch.select(subset).columns
+    ], names=subset).to_pandas()
+    hashes = pd.util.hash_pandas_object(chaves, index=False, hash_key=f"{depth:016d}").to_numpy()
+    return (hashes % np.uint64(partitions)).astype(np.int64)
+
+
+def _spill_partitions(batches: Iterable[pa.RecordBatch], schema: pa.Schema, subset: List[str],
+                      directory: str, depth: int, name: str) -> List[str]:
+    """Grava os lotes em PARTITIONS arquivos Arrow IPC pelo hash das colunas `subset`."""
+    caminhos = [os.path.join(directory, f"part_{depth}_{i:03d}.arrow") for i in range(PARTITIONS)]
+    arquivos = [pa.OSFile(caminho, "wb") for caminho in caminhos]
+    escritores = [pa.ipc.new_file(arquivo, schema) for arquivo in arquivos]
+    try:
+        for batch in batches:
+            particoes = _partition_of(batch, subset, PARTITIONS, depth)
+            for particao in np.unique(particoes):
+                escritores[particao].write_batch(batch.filter(pa.array(particoes == particao)))
+            metrics.count("dedupe_spill_bytes", batch.nbytes, "Bytes", table=name)
+    finally:
+        for escritor, arquivo in zip(escritores, arquivos):
+            escritor.close()
+            arquivo.close()
+    return caminhos
+
+
+def _dedupe_partitions(paths: List[str], subset: List[str], keep: str, order_by: List[Tuple[str, str]],
+                       orcamento: float, directory: str, depth: int, name: str) -> Iterator[pa.Table]:
+    for caminho in paths:
+        with pa.memory_map(caminho, "r") as origem:
+            particao = pa.ipc.open_file(origem).read_all()
+        if particao.num_rows and particao.nbytes > orcamento and depth < MAX_PARTITION_DEPTH:
+            logger.info(f"Partição de {name} com {particao.nbytes / 2**20:.0f} MB acima do orçamento: reparticionando")
+            subdiretorio = os.path.join(directory, f"{depth + 1}_{os.path.basename(caminho)}")
+            os.makedirs(subdiretorio)
+            caminhos = _spill_partitions(particao.to_batches(), particao.schema, subset, subdiretorio, depth + 1, name)
+            del particao
+            os.remove(caminho)
+            yield from _dedupe_partitions(caminhos, subset, keep, order_by, orcamento, subdiretorio, depth + 1, name)
+            continue
+        if particao.num_rows:
+            yield _dedupe_in_memory(particao, subset, keep, order_by)
+        os.remove(caminho)
+
+
+def drop_duplicates(batches: Iterable[pa.RecordBatch], subset: Optional[Sequence[str]] = None, keep: str = "first",
+                    order_by: SortKeys = (), budget_mb: Optional[float] = None, name: str = "dedupe",
+                    output_rows: int = OUTPUT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """
+    Remove as linhas repetidas em `subset` (padrão: todas as colunas), mantendo
+    a primeira ou a última (`keep`) de cada grupo na ordem `order_by`.
+
+    Returns:
+    Iterator[pa.RecordBatch]: Lotes das linhas mantidas, de até `output_rows` linhas.
+    """
+    if keep not in ("first", "last"):
+        raise ValueError(f"keep deve ser 'first' ou 'last', não {keep!r}")
+    ordem = normalize_keys(order_by)
+    orcamento = (budget_mb or MEMORY_BUDGET_MB) * 2**20
+    lotes = iter(batches)
+    colunas: Optional[List[str]] = list(subset) if subset else None
+    posicao = 0
+
+    def numerados() -> Iterator[pa.RecordBatch]:
+        nonlocal posicao
+        for batch in lotes:
+            sequencia = pa.array(np.arange(posicao, posicao + batch.num_rows, dtype=np.uint64))
+            posicao += batch.num_rows
+            yield batch.append_column(SEQUENCE_COLUMN, sequencia)
+
+    entrada = numerados()
+    bloco: List[pa.RecordBatch] = []
+    bytes_bloco = 0
+    for batch in entrada:
+        bloco.append(batch)
+        bytes_bloco += batch.nbytes
+        if bytes_bloco > orcamento:
+            break
+    if not bloco:
+        return
+    schema = bloco[0].schema
+    colunas = colunas or [coluna for coluna in schema.names if coluna != SEQUENCE_COLUMN]
+
+    if bytes_bloco <= orcamento:
+        tabela = _dedupe_in_memory(pa.Table.from_batches(bloco), colunas, keep, ordem)
+        yield from tabela.drop_columns([SEQUENCE_COLUMN]).to_batches(max_chunksize=output_rows)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="external_dedupe_", dir=SPILL_DIR) as diretorio:
+        def todos() -> Iterator[pa.RecordBatch]:
+            yield from bloco
+            yield from entrada
+        caminhos = _spill_partitions(todos(), schema, colunas, diretorio, 0, name)
+        bloco = []
+        metrics.count("dedupe_partitions", len(caminhos), table=name)
+        logger.info(f"Deduplicação externa de {name}: {len(caminhos)} partições em disco")
+        for tabela in _dedupe_partitions(caminhos, colunas, keep, ordem, orcamento, diretorio, 0, name):
+            yield from tabela.drop_columns([SEQUENCE_COLUMN]).to_batches(max_chunksize=output_rows)
+
+
+def drop_duplicates_table(table: pa.Table, subset: Optional[Sequence[str]] = None, keep: str = "first",
+                          order_by: SortKeys = (), budget_mb: Optional[float] = None, name: str = "dedupe") -> pa.Table:
+    """`drop_duplicates` sobre uma tabela, fatiada sem cópia; devolve a tabela deduplicada."""
+    orcamento = (budget_mb or MEMORY_BUDGET_MB) * 2**20
+    linhas = max(MIN_BATCH_ROWS, int(table.num_rows * orcamento / 4 / max(table.nbytes, 1)))
+    lotes = drop_duplicates(table.to_batches(max_chunksize=linhas), subset, keep, order_by, budget_mb, name)
+    return pa.Table.from_batches(list(lotes), schema=table.schema)
+
+
+def drop_duplicates_frame(frames: Union[pd.DataFrame, Sequence[pd.DataFrame]], subset: Optional[Sequence[str]] = None,
+                          keep: str = "first", order_by: SortKeys = (), budget_mb: Optional[float] = None,
+                          name: str = "dedupe") -> pd.DataFrame:
+    """
+    Concatena os DataFrames e remove as linhas repetidas em `subset`, mantendo a
+    primeira ou a última de cada grupo na ordem `order_by`. Dentro do orçamento,
+    em pandas; acima dele, em Arrow com as partições em disco.
+
+    Returns:
+    pd.DataFrame: As linhas mantidas, com índice novo (vazio sem nenhum DataFrame).
+    """
+    frames = [frames] if isinstance(frames, pd.DataFrame) else [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame()
+    ordem = normalize_keys(order_by)
+    orcamento = (budget_mb or MEMORY_BUDGET_MB) * 2**20
+    if sum(int(df.memory_usage(index=True, deep=True).sum()) for df in frames) <= orcamento:
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if ordem:
+            df = df.sort_values([coluna for coluna, _ in ordem], ascending=[o == "ascending" for _, o in ordem],
+                                kind="stable")
+        return df.drop_duplicates(subset=subset, keep=keep).reset_index(drop=True)
+
+    tabela = pa.concat_tables([pa.Table.from_pandas(df, preserve_index=False) for df in frames],
+                              promote_options="permissive")
+    return drop_duplicates_table(tabela, subset, keep, order_by, budget_mb, name).to_pandas()
@@ -0,0 +1,298 @@
+"""
+Métricas estruturadas das etapas: contadores, gauges, histogramas e timers.
+
+Cada etapa registra as suas métricas em memória e as emite no fim do handler,
+em linhas no stdout (que vão para o CloudWatch Logs na Lambda):
+- json: uma linha JSON por série, com tipo, unidade, dimensões e valor (os
+  histogramas saem resumidos: count, sum, min, max, p50, p90, p99)
+- emf: CloudWatch Embedded Metric Format, que o CloudWatch transforma em
+  métricas sem chamadas à API; os histogramas saem com os valores observados
+- off: não emite
+
+Toda série leva a dimensão Stage (a etapa em execução); as demais vêm dos
+argumentos nomeados (ex.: `table=...` vira a dimensão Table).
+
+O que é medido:
+- `stage`: duration_ms, peak_rss_mb e failures da etapa
+- `timer` / `timed`: duration_ms e peak_rss_mb de cada passo (dimensão Step)
+- `object_store`: object_store_ms, object_store_requests, object_store_errors,
+  bytes_read e bytes_written por operação, nos dois backends
+- `aws_clients`: aws_requests, aws_request_ms, aws_retries e aws_errors por
+  operação
+- as etapas: rows_in e rows_out por tabela
+
+O pico de memória de um passo usa o VmHWM do processo, zerado no início do
+passo (/proc/self/clear_refs); onde isso não é possível, é o pico do processo
+até o fim do passo.
+
+Configurações, por variáveis de ambiente:
+- METRICS_FORMAT: json, emf ou off (padrão: emf na Lambda, json fora dela)
+- METRICS_NAMESPACE: namespace das métricas no EMF
+
+Uso:
+    import metrics
+
+    @metrics.stage("tb_silver_rate")
+    def lambda_handler(event, context): ...
+
+    @metrics.timed
+    def save_as_parquet(df): ...
+
+    metrics.count("rows_in", len(df), table="Rate")
+    with metrics.timer("upload", table="Rate"):
+        ...
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import functools
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+FORMAT = os.environ.get("METRICS_FORMAT", "emf" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else "json")
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "HealthInsuranceMarketplace")
+MAX_SAMPLES = 10_000  # valores guardados por histograma (count/sum/min/max seguem exatos)
+EMF_MAX_VALUES = 100  # limite de valores por métrica em um documento EMF
+
+Dimensions = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_series: Dict[Tuple[str, str, Dimensions], Dict] = {}
+_stage: Optional[str] = None
+
+
+# ========== REGISTRO ==========
+def _dimensions(dims: Dict[str, object]) -> Dimensions:
+    base = {"Stage": _stage} if _stage else {}
+    base.update({key[:1].upper() + key[1:]: str(value) for key, value in dims.items()})
+    return tuple(sorted(base.items()))
+
+
+def _serie(kind: str, name: str, unit: str, dims: Dict[str, object]) -> Dict:
+    key = (kind, name, _dimensions(dims))
+    serie = _series.get(key)
+    if serie is None:
+        serie = _series[key] = {"type": kind, "name": name, "unit": unit, "dimensions": dict(key[2]),
+                                "value": 0, "count": 0, "sum": 0.0, "min": None, "max": None, "samples": []}
+    return serie
+
+
+def count(name: str, value: float = 1, unit: str = "Count", **dims) -> None:
+    """Soma `value` ao contador."""
+    with _lock:
+        _serie("counter", name, unit, dims)["value"] += value
+
+
+def gauge(name: str, value: float, unit: str = "None", **dims) -> None:
+    """Guarda o último valor do gauge."""
+    with _lock:
+        _serie("gauge", name, unit, dims)["value"] = value
+
+
+def observe(name: str, value: float, unit: str = "Milliseconds", **dims) -> None:
+    """Registra uma observação no histograma."""
+    with _lock:
+        serie = _serie("histogram", name, unit, dims)
+        serie["count"] += 1
+        serie["sum"] += value
+        serie["min"] = value if serie["min"] is None else min(serie["min"], value)
+        serie["max"] = value if serie["max"] is None else max(serie["max"], value)
+        if len(serie["samples"]) < MAX_SAMPLES:
+            serie["samples"].append(value)
+
+
+def reset() -> None:
+    with _lock:
+        _series.clear()
+
+
+# ========== MEMÓRIA ==========
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as status:
+            return next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb // 1024 if sys.platform == "darwin" else kb
+
+
+def _reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+class _Span:
+    """Passo em execução: o pico de memória visto desde o seu início."""
+
+    _active: List["_Span"] = []
+
+    def __enter__(self):
+        with _lock:
+            current = _peak_rss_kb()
+            for span in self._active:
+                span.peak_kb = max(span.peak_kb, current)
+            _reset_peak_rss()
+            self.peak_kb = _peak_rss_kb()
+            self._active.append(self)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        with _lock:
+            self.seconds = time.perf_counter() - self.start
+            self.peak_kb = max(self.peak_kb, _peak_rss_kb())
+            self._active.remove(self)
+            for span in self._active:
+                span.peak_kb = max(span.peak_kb, self.peak_kb)
+        return False
+
+
+# ========== TIMERS ==========
+class timer:
+    """
+    Context manager que mede um passo: duration_ms (histograma) e peak_rss_mb
+    (gauge), com a dimensão Step.
+    """
+
+    def __init__(self, step: str, **dims):
+        self.step = step
+        self.dims = dims
+        self.span = _Span()
+
+    def __enter__(self):
+        self.span.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.span.__exit__(*exc)
+        observe("duration_ms", self.span.seconds * 1000, step=self.step, **self.dims)
+        gauge("peak_rss_mb", round(self.span.peak_kb / 1024, 1), "Megabytes", step=self.step, **self.dims)
+        return False
+
+    @property
+    def seconds(self) -> float:
+        return self.span.seconds
+
+
+def timed(func=None, *, step: Optional[str] = None, **dims):
+    """
+    Decorador que mede a função com `timer` (Step = nome da função) e loga o
+    tempo de execução. Aceita `@metrics.timed` e `@metrics.timed(step=...)`.
+    """
+    def decorator(func):
+        name = step or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **dims) as medida:
+                result = func(*args, **kwargs)
+            logger.info(f"{name} executado em {medida.seconds:.2f} segundos")
+            return result
+        return wrapper
+    return decorator(func) if func is not None else decorator
+
+
+def stage(name: str):
+    """
+    Decorador do handler de uma etapa: define a dimensão Stage, mede a etapa
+    (duration_ms, peak_rss_mb e failures, quando o handler lança exceção ou
+    responde statusCode >= 400) e emite as métricas ao final.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            global _stage
+            reset()
+            _stage = name
+            failed = True
+            try:
+                with _Span() as span:
+                    response = handler(*args, **kwargs)
+                failed = isinstance(response, dict) and int(response.get("statusCode", 200)) >= 400
+                return response
+            finally:
+                observe("duration_ms", span.seconds * 1000)
+                gauge("peak_rss_mb", round(span.peak_kb / 1024, 1), "Megabytes")
+                count("failures", int(failed))
+                flush()
+        return wrapper
+    return decorator
+
+
+# ========== SAÍDA ==========
+def _summary(serie: Dict) -> Dict:
+    if serie["type"] != "histogram":
+        return {"value": serie["value"]}
+    samples = sorted(serie["samples"])
+
+    def percentile(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))], 3)
+
+    return {"count": serie["count"], "sum": round(serie["sum"], 3), "min": round(serie["min"], 3),
+            "max": round(serie["max"], 3), "p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)}
+
+
+def snapshot() -> List[Dict]:
+    """As séries registradas, com os histogramas resumidos."""
+    with _lock:
+        return [{key: serie[key] for key in ("type", "name", "unit", "dimensions")} | _summary(serie)
+                for serie in _series.values()]
+
+
+def _emf_documents(timestamp: int) -> List[Dict]:
+    """Um documento por conjunto de dimensões; histogramas longos seguem em documentos extras."""
+    grupos: Dict[Dimensions, List[Dict]] = {}
+    for (_, _, dims), serie in _series.items():
+        grupos.setdefault(dims, []).append(serie)
+
+    documents = []
+    for dims, series in grupos.items():
+        parte = 0
+        while True:
+            valores = {}
+            for serie in series:
+                if serie["type"] == "histogram":
+                    lote = serie["samples"][parte * EMF_MAX_VALUES:(parte + 1) * EMF_MAX_VALUES]
+                    if lote:
+                        valores[serie["name"]] = (lote, serie["unit"])
+                elif parte == 0:
+                    valores[serie["name"]] = (serie["value"], serie["unit"])
+            if not valores:
+                break
+            documents.append({
+                "_aws": {"Timestamp": timestamp, "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [[key for key, _ in dims]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in valores.items()],
+                }]},
+                **dict(dims),
+                **{name: value for name, (value, _) in valores.items()},
+            })
+            parte += 1
+    return documents
+
+
+def flush() -> None:
+    """Emite as métricas registradas no formato de METRICS_FORMAT e limpa o registro."""
+    if FORMAT == "off":
+        reset()
+        return
+    timestamp = int(time.time() * 1000)
+    if FORMAT == "emf":
+        with _lock:
+            lines = [json.dumps(document) for document in _emf_documents(timestamp)]
+    else:
+        lines = [json.dumps({"timestamp": timestamp, **serie}) for serie in snapshot()]
+    reset()
+    for line in lines:
+        print(line, flush=True)
@@ -0,0 +1,202 @@
+"""
+Cache local em disco, read-through, para os objetos lidos do armazenamento.
+
+A tabela de CEPs é gravada pelo `tb_silver_zipcodes` e lida pelo
+`tb_silver_service_area`, e os mesmos objetos da raw são baixados de novo a
+cada reexecução local e a cada repetição dos benchmarks. Com o cache, as
+leituras de objetos inteiros (get, get_buffer, get_with_etag) passam por um
+diretório local compartilhado entre processos:
+
+- cada objeto fica em <raiz>/<sha1(bucket/key)>/<ETag>, um arquivo por versão
+- toda leitura revalida a entrada com um GET condicional (If-None-Match no
+  ETag guardado): se o objeto não mudou, o S3 responde 304 sem corpo e o
+  arquivo local é usado; se mudou, o corpo novo vai direto para o disco e
+  substitui a versão anterior
+- o arquivo é entregue mapeado em memória (`pyarrow.memory_map`), sem cópia
+  para o heap do processo
+- o tamanho total é limitado por OBJECT_STORE_CACHE_MB; acima dele, as
+  entradas usadas há mais tempo (mtime, atualizado a cada acerto) são removidas
+- gravações, cópias e remoções feitas por este processo invalidam a entrada
+
+Gravações no diretório são atômicas (arquivo temporário + rename), então
+etapas em processos diferentes podem usar o mesmo cache ao mesmo tempo. Um
+erro de disco no cache não falha a leitura: ela vai direto ao armazenamento.
+
+Métricas: object_cache_hits, object_cache_misses, object_cache_bytes (bytes
+servidos do disco sem transferência) e object_cache_evictions.
+
+Configurações, por variáveis de ambiente:
+- OBJECT_STORE_CACHE_DIR: diretório do cache (vazio: desligado; ver `object_store.get_store`)
+- OBJECT_STORE_CACHE_MB: tamanho máximo do cache em MB (padrão 2048)
+
+Uso:
+    OBJECT_STORE_CACHE_DIR=app/.object_cache python app/local_pipeline.py --storage endpoint
+    store = object_cache.CachedStore(object_store.S3Store(), object_cache.DiskCache("/tmp/cache"))
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Optional, Tuple
+from urllib.parse import quote, unquote
+
+import pyarrow as pa
+import object_store
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+CACHE_MAX_MB = float(os.environ.get("OBJECT_STORE_CACHE_MB", "2048"))
+TEMP_SUFFIX = ".tmp-cache"
+
+
+class DiskCache:
+    """Arquivos por (bucket, key, ETag) sob `root`, com remoção LRU acima de `max_mb`."""
+
+    def __init__(self, root: str, max_mb: float = CACHE_MAX_MB):
+        self.root = os.path.abspath(root)
+        self.max_bytes = int(max_mb * 2**20)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _dir(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(f"{bucket}/{key}".encode()).hexdigest())
+
+    def lookup(self, bucket: str, key: str) -> Optional[Tuple[str, str]]:
+        """(ETag, caminho) da versão guardada do objeto, ou None."""
+        try:
+            names = [name for name in os.listdir(self._dir(bucket, key)) if not name.endswith(TEMP_SUFFIX)]
+        except FileNotFoundError:
+            return None
+        if not names:
+            return None
+        return unquote(names[0]), os.path.join(self._dir(bucket, key), names[0])
+
+    def temp_path(self, bucket: str, key: str) -> str:
+        directory = self._dir(bucket, key)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}")
+
+    def commit(self, bucket: str, key: str, temp: str, etag: str) -> str:
+        """Promove o arquivo baixado a versão guardada do objeto, removendo as anteriores."""
+        directory = self._dir(bucket, key)
+        path = os.path.join(directory, quote(etag, safe=""))
+        os.replace(temp, path)
+        for name in os.listdir(directory):
+            if name != os.path.basename(path) and not name.endswith(TEMP_SUFFIX):
+                self._remove(os.path.join(directory, name))
+        self.evict(keep=path)
+        return path
+
+    def open(self, path: str) -> pa.Buffer:
+        """O arquivo mapeado em memória; o acesso conta como uso recente (LRU)."""
+        os.utime(path)
+        with pa.memory_map(path, "r") as source:
+            return source.read_buffer()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, bucket: str, key: str) -> None:
+        shutil.rmtree(self._dir(bucket, key), ignore_errors=True)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove as entradas usadas há mais tempo até o cache caber no limite."""
+        entries = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(TEMP_SUFFIX):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+            metrics.count("object_cache_evictions")
+
+
+class CachedStore:
+    """Um backend do `object_store` com as leituras de objetos inteiros passando pelo `DiskCache`."""
+
+    def __init__(self, store, cache: DiskCache):
+        self._store = store
+        self.cache = cache
+        self.name = f"{store.name}+cache"
+
+    def __getattr__(self, attr):
+        return getattr(self._store, attr)
+
+    def _read(self, bucket: str, key: str) -> Tuple[pa.Buffer, str]:
+        try:
+            entry = self.cache.lookup(bucket, key)
+            temp = self.cache.temp_path(bucket, key)
+        except OSError as e:
+            logger.warning(f"Cache indisponível para {bucket}/{key} ({e}); lendo direto")
+            data, etag = self._store.get_with_etag(bucket, key)
+            return pa.py_buffer(data), etag
+
+        try:
+            etag = self._store.fetch_if_changed(bucket, key, entry[0] if entry else None, temp)
+            if etag is None:
+                try:
+                    buffer = self.cache.open(entry[1])
+                except FileNotFoundError:
+                    # Removida por outro processo depois da consulta: baixa de novo
+                    etag = self._store.fetch_if_changed(bucket, key, None, temp)
+                else:
+                    metrics.count("object_cache_hits")
+                    metrics.count("object_cache_bytes", buffer.size, "Bytes")
+                    return buffer, entry[0]
+            metrics.count("object_cache_misses")
+            try:
+                return self.cache.open(self.cache.commit(bucket, key, temp, etag)), etag
+            except OSError as e:
+                # O arquivo baixado continua mapeado depois de removido do cache
+                logger.warning(f"Não foi possível guardar {bucket}/{key} no cache ({e})")
+                return self.cache.open(temp), etag
+        except object_store.ObjectNotFound:
+            self.cache.invalidate(bucket, key)
+            raise
+        finally:
+            self.cache._remove(temp)
+
+    def get_buffer(self, bucket: str, key: str) -> pa.Buffer:
+        return self._read(bucket, key)[0]
+
+    def get(self, bucket: str, key: str) -> bytes:
+        return self._read(bucket, key)[0].to_pybytes()
+
+    def get_with_etag(self, bucket: str, key: str):
+        buffer, etag = self._read(bucket, key)
+        return buffer.to_pybytes(), etag
+
+    def put(self, bucket: str, key: str, *args, **kwargs):
+        self.cache.invalidate(bucket, key)
+        return self._store.put(bucket, key, *args, **kwargs)
+
+    def upload(self, bucket: str, key: str, source) -> None:
+        self.cache.invalidate(bucket, key)
+        self._store.upload(bucket, key, source)
+
+    def copy(self, source_bucket: str, source_key: str, bucket: str, key: str) -> None:
+        self.cache.invalidate(bucket, key)
+        self._store.copy(source_bucket, source_key, bucket, key)
+
+    def delete(self, bucket: str, key: str) -> None:
+        self.cache.invalidate(bucket, key)
+        self._store.delete(bucket, key)
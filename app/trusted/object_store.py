@@ -0,0 +1,538 @@
+"""
+Camada de armazenamento de objetos compartilhada por todas as etapas do pipeline.
+
+Os módulos leem e gravam por esta interface em vez de chamar o boto3 direto, de
+modo que o acesso ao S3 é ajustado em um só lugar e o pipeline inteiro pode
+rodar sem rede, sobre pastas locais.
+
+Backends (variável OBJECT_STORE):
+- s3 (padrão): cliente boto3 compartilhado de `aws_clients` (pool de conexões e
+  retries configurados lá), transferências multipart concorrentes com
+  `TransferConfig` e novas tentativas com backoff também na leitura do corpo
+  das respostas, que o botocore não repete.
+- local: cada bucket é uma pasta sob OBJECT_STORE_ROOT e cada key um arquivo.
+  Gravações são atômicas (arquivo temporário + rename) e as condicionais
+  (if_match / if_none_match) são serializadas com um lock de arquivo. O ETag é
+  derivado do tamanho e do mtime do arquivo.
+
+Operações: get, get_buffer, get_range, open, put (com condições),
+upload/download (multipart no S3), fetch_if_changed (GET condicional para um
+arquivo), copy, delete, head, list e list_prefixes. Chaves inexistentes
+levantam `ObjectNotFound` e condições não atendidas, `PreconditionFailed`, nos
+dois backends.
+
+As operações de leitura, gravação e cópia registram em `metrics` a latência
+(object_store_ms), o número de chamadas e de erros e os bytes lidos/gravados,
+por operação. As requisições HTTP ao S3 são contadas em `aws_clients`.
+
+`get_buffer` entrega o objeto como um `pyarrow.Buffer`, para leitores Arrow,
+sem cópias intermediárias: no S3 o corpo é lido direto para um buffer alocado
+uma vez com o tamanho do objeto (ContentLength), e uma leitura interrompida
+continua de onde parou com um GET por faixa (If-Match no ETag); no disco local
+o arquivo é mapeado em memória (mmap), sem cópia alguma.
+
+Com OBJECT_STORE_CACHE_DIR definido, `get_store` devolve o backend embrulhado
+no cache local em disco de `object_cache` (read-through, por ETag, com LRU).
+
+Uso:
+    store = object_store.get_store()
+    dados = store.get("raw-test-edb", "tb_rate/partitionDate=20250322/data.parquet")
+    tabela = pq.read_table(pa.BufferReader(store.get_buffer("raw-test-edb", "Rate/Rate_1.parquet")))
+    store.put("cleaned-test-edb", "tb_silver_rate/data.parquet", dados)
+"""
+
+import os
+import time
+import errno
+import fcntl
+import random
+import shutil
+import logging
+import functools
+import threading
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Union
+
+import aws_clients
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+BACKEND = os.environ.get("OBJECT_STORE", "s3")
+LOCAL_ROOT = os.environ.get("OBJECT_STORE_ROOT", os.path.join(os.getcwd(), ".s3_local"))
+MULTIPART_THRESHOLD = int(os.environ.get("OBJECT_STORE_MULTIPART_THRESHOLD_MB", "64")) * 1024 * 1024
+MULTIPART_CHUNKSIZE = int(os.environ.get("OBJECT_STORE_MULTIPART_CHUNKSIZE_MB", "16")) * 1024 * 1024
+TRANSFER_CONCURRENCY = int(os.environ.get("OBJECT_STORE_TRANSFER_CONCURRENCY", "10"))
+READ_ATTEMPTS = int(os.environ.get("OBJECT_STORE_READ_ATTEMPTS", "4"))
+READ_CHUNK_SIZE = 1024 * 1024  # bytes por leitura do corpo em get_buffer
+CACHE_DIR = os.environ.get("OBJECT_STORE_CACHE_DIR", "")  # vazio: sem cache em disco
+
+TEMP_SUFFIX = ".tmp-write"
+LOCK_NAME = ".object_store.lock"
+
+Data = Union[bytes, bytearray, memoryview]
+
+
+class ObjectNotFound(KeyError):
+    """A key (ou o bucket) não existe."""
+
+
+class PreconditionFailed(Exception):
+    """A condição de uma gravação condicional não foi atendida (ETag diferente ou objeto já existente)."""
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    size: int
+    etag: str
+
+
+def _as_bytes(data: Data) -> bytes:
+    return data if isinstance(data, bytes) else memoryview(data).tobytes()
+
+
+def _with_retries(operation, description: str):
+    """
+    Repete leituras interrompidas no meio do corpo da resposta, com backoff
+    exponencial e jitter. Erros de requisição já são repetidos pelo botocore.
+    """
+    from botocore.exceptions import ConnectionError as BotoConnectionError, IncompleteReadError, \
+        ReadTimeoutError, ResponseStreamingError
+
+    for attempt in range(1, READ_ATTEMPTS + 1):
+        try:
+            return operation()
+        except (IncompleteReadError, ReadTimeoutError, ResponseStreamingError, BotoConnectionError) as e:
+            if attempt == READ_ATTEMPTS:
+                raise
+            delay = min(8.0, 0.2 * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"Leitura interrompida de {description} ({e}); nova tentativa em {delay:.2f} s")
+            time.sleep(delay)
+
+
+def _transferred(operation: str, result, args: tuple, position: Optional[int]) -> int:
+    """Bytes lidos ou gravados por uma operação (0 quando não é possível saber)."""
+    if not args and operation in ("put", "upload", "download"):
+        return 0
+    if operation in ("get", "get_range"):
+        return len(result)
+    if operation == "get_with_etag":
+        return len(result[0])
+    if operation == "get_buffer":
+        return result.size
+    if operation == "fetch_if_changed":
+        return os.path.getsize(args[1]) if result else 0
+    if operation == "put":
+        return memoryview(args[0]).nbytes
+    if operation in ("upload", "download"):
+        if isinstance(args[0], str):
+            return os.path.getsize(args[0])
+        return args[0].tell() - position if position is not None else 0
+    return 0
+
+
+def _metered(operation: str):
+    """Registra em `metrics` a latência, as chamadas, os erros e os bytes da operação."""
+    direction = "bytes_read" if operation.startswith("get") or operation in ("download", "fetch_if_changed") \
+        else "bytes_written"
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, bucket: str, key: str, *args, **kwargs):
+            stream = args[0] if args and operation in ("upload", "download") and not isinstance(args[0], str) else None
+            position = stream.tell() if stream is not None and stream.seekable() else None
+            start = time.perf_counter()
+            try:
+                result = method(self, bucket, key, *args, **kwargs)
+            except Exception:
+                metrics.count("object_store_errors", operation=operation)
+                raise
+            finally:
+                metrics.observe("object_store_ms", (time.perf_counter() - start) * 1000, operation=operation)
+                metrics.count("object_store_requests", operation=operation)
+            size = _transferred(operation, result, args, position)
+            if size:
+                metrics.count(direction, size, "Bytes", operation=operation)
+            return result
+        return wrapper
+    return decorator
+
+
+# ========== S3 ==========
+class S3Store:
+    """Backend S3 sobre o cliente compartilhado de `aws_clients`."""
+
+    name = "s3"
+
+    def __init__(self):
+        self._transfer_config = None
+
+    @property
+    def client(self):
+        return aws_clients.get_client('s3')
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(
+                multipart_threshold=MULTIPART_THRESHOLD,
+                multipart_chunksize=MULTIPART_CHUNKSIZE,
+                max_concurrency=TRANSFER_CONCURRENCY,
+            )
+        return self._transfer_config
+
+    @staticmethod
+    def _error_code(error) -> str:
+        return error.response.get('Error', {}).get('Code', '')
+
+    def _translate(self, error, bucket: str, key: str):
+        code = self._error_code(error)
+        if code in ('NoSuchKey', '404', 'NotFound', 'NoSuchBucket'):
+            return ObjectNotFound(f"s3://{bucket}/{key}")
+        if code in ('PreconditionFailed', 'ConditionalRequestConflict', '412'):
+            return PreconditionFailed(f"s3://{bucket}/{key}: {code}")
+        return error
+
+    def _get(self, bucket: str, key: str, **kwargs) -> dict:
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key, **kwargs)
+        except ClientError as e:
+            raise self._translate(e, bucket, key) from e
+
+    @_metered("get")
+    def get(self, bucket: str, key: str) -> bytes:
+        return _with_retries(lambda: self._get(bucket, key)['Body'].read(), f"s3://{bucket}/{key}")
+
+    @_metered("get_with_etag")
+    def get_with_etag(self, bucket: str, key: str):
+        def read():
+            response = self._get(bucket, key)
+            return response['Body'].read(), response['ETag']
+        return _with_retries(read, f"s3://{bucket}/{key}")
+
+    @_metered("get_buffer")
+    def get_buffer(self, bucket: str, key: str):
+        import pyarrow as pa
+        from botocore.exceptions import IncompleteReadError
+
+        response = self._get(bucket, key)
+        size, etag = response['ContentLength'], response['ETag']
+        buffer = pa.allocate_buffer(size)
+        view = memoryview(buffer).cast("B")
+        position = 0
+        body = response['Body']
+
+        def read_rest():
+            nonlocal position, body
+            if body is None:
+                # Retoma do ponto em que parou, desde que o objeto não tenha mudado
+                body = self._get(bucket, key, Range=f"bytes={position}-", IfMatch=etag)['Body']
+            try:
+                while position < size:
+                    chunk = body.read(min(READ_CHUNK_SIZE, size - position))
+                    if not chunk:
+                        raise IncompleteReadError(actual_bytes=position, expected_bytes=size)
+                    view[position:position + len(chunk)] = chunk
+                    position += len(chunk)
+            except Exception:
+                body = None
+                raise
+
+        _with_retries(read_rest, f"s3://{bucket}/{key}")
+        return buffer
+
+    @_metered("get_range")
+    def get_range(self, bucket: str, key: str, start: int, end: Optional[int] = None) -> bytes:
+        byte_range = f"bytes=-{-start}" if start < 0 else f"bytes={start}-{'' if end is None else end - 1}"
+        return _with_retries(lambda: self._get(bucket, key, Range=byte_range)['Body'].read(), f"s3://{bucket}/{key}")
+
+    def open(self, bucket: str, key: str) -> BinaryIO:
+        return self._get(bucket, key)['Body']
+
+    @_metered("fetch_if_changed")
+    def fetch_if_changed(self, bucket: str, key: str, etag: Optional[str], target: str) -> Optional[str]:
+        """
+        GET condicional (If-None-Match): grava o objeto em `target` e devolve o
+        ETag dele, ou None (sem transferir o corpo) se o ETag ainda é `etag`.
+        """
+        from botocore.exceptions import ClientError
+
+        def fetch():
+            try:
+                response = self.client.get_object(Bucket=bucket, Key=key, **({"IfNoneMatch": etag} if etag else {}))
+            except ClientError as e:
+                if self._error_code(e) in ('304', 'NotModified'):
+                    return None
+                raise self._translate(e, bucket, key) from e
+            with open(target, "wb") as f:
+                for chunk in iter(lambda: response['Body'].read(READ_CHUNK_SIZE), b""):
+                    f.write(chunk)
+            return response['ETag']
+        return _with_retries(fetch, f"s3://{bucket}/{key}")
+
+    @_metered("put")
+    def put(self, bucket: str, key: str, data: Data, if_match: Optional[str] = None,
+            if_none_match: bool = False) -> str:
+        from botocore.exceptions import ClientError
+        conditions = {}
+        if if_match:
+            conditions["IfMatch"] = if_match
+        if if_none_match:
+            conditions["IfNoneMatch"] = "*"
+        try:
+            return self.client.put_object(Bucket=bucket, Key=key, Body=_as_bytes(data), **conditions)['ETag']
+        except ClientError as e:
+            raise self._translate(e, bucket, key) from e
+
+    @_metered("upload")
+    def upload(self, bucket: str, key: str, source: Union[str, BinaryIO]) -> None:
+        if isinstance(source, str):
+            self.client.upload_file(source, bucket, key, Config=self.transfer_config)
+        else:
+            self.client.upload_fileobj(source, bucket, key, Config=self.transfer_config)
+
+    @_metered("download")
+    def download(self, bucket: str, key: str, target: Union[str, BinaryIO]) -> None:
+        from botocore.exceptions import ClientError
+        try:
+            if isinstance(target, str):
+                self.client.download_file(bucket, key, target, Config=self.transfer_config)
+            else:
+                self.client.download_fileobj(bucket, key, target, Config=self.transfer_config)
+        except ClientError as e:
+            raise self._translate(e, bucket, key) from e
+
+    @_metered("copy")
+    def copy(self, source_bucket: str, source_key: str, bucket: str, key: str) -> None:
+        self.client.copy({'Bucket': source_bucket, 'Key': source_key}, bucket, key, Config=self.transfer_config)
+
+    def delete(self, bucket: str, key: str) -> None:
+        """Remove a key; remover uma key inexistente não é erro."""
+        self.client.delete_object(Bucket=bucket, Key=key)
+
+    def head(self, bucket: str, key: str) -> Optional[ObjectInfo]:
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            error = self._translate(e, bucket, key)
+            if isinstance(error, ObjectNotFound):
+                return None
+            raise error from e
+        return ObjectInfo(key, response['ContentLength'], response['ETag'])
+
+    def list(self, bucket: str, prefix: str = "") -> Iterator[ObjectInfo]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield ObjectInfo(item['Key'], item['Size'], item['ETag'])
+
+    def list_prefixes(self, bucket: str, prefix: str = "", delimiter: str = "/") -> Iterator[str]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter=delimiter):
+            for common_prefix in page.get('CommonPrefixes', []):
+                yield common_prefix['Prefix']
+
+    def create_bucket(self, bucket: str) -> None:
+        existing = {item["Name"] for item in self.client.list_buckets().get("Buckets", [])}
+        if bucket not in existing:
+            self.client.create_bucket(Bucket=bucket)
+
+
+# ========== DISCO LOCAL ==========
+class LocalStore:
+    """Backend em disco local: <root>/<bucket>/<key>."""
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_ROOT):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+
+    def _path(self, bucket: str, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.join(self.root, bucket) + os.sep):
+            raise ValueError(f"Key inválida: {key}")
+        return path
+
+    @staticmethod
+    def _etag(stat: os.stat_result) -> str:
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def _stat(self, bucket: str, key: str) -> os.stat_result:
+        try:
+            return os.stat(self._path(bucket, key))
+        except FileNotFoundError:
+            raise ObjectNotFound(f"{self.root}/{bucket}/{key}") from None
+
+    def open(self, bucket: str, key: str) -> BinaryIO:
+        try:
+            return open(self._path(bucket, key), "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            raise ObjectNotFound(f"{self.root}/{bucket}/{key}") from None
+
+    @_metered("get")
+    def get(self, bucket: str, key: str) -> bytes:
+        with self.open(bucket, key) as f:
+            return f.read()
+
+    @_metered("fetch_if_changed")
+    def fetch_if_changed(self, bucket: str, key: str, etag: Optional[str], target: str) -> Optional[str]:
+        with self.open(bucket, key) as f:
+            current = self._etag(os.fstat(f.fileno()))
+            if current == etag:
+                return None
+            with open(target, "wb") as out:
+                shutil.copyfileobj(f, out, MULTIPART_CHUNKSIZE)
+        return current
+
+    @_metered("get_with_etag")
+    def get_with_etag(self, bucket: str, key: str):
+        with self.open(bucket, key) as f:
+            return f.read(), self._etag(os.fstat(f.fileno()))
+
+    @_metered("get_buffer")
+    def get_buffer(self, bucket: str, key: str):
+        import pyarrow as pa
+        try:
+            with pa.memory_map(self._path(bucket, key), "r") as source:
+                return source.read_buffer()
+        except (FileNotFoundError, IsADirectoryError):
+            raise ObjectNotFound(f"{self.root}/{bucket}/{key}") from None
+
+    @_metered("get_range")
+    def get_range(self, bucket: str, key: str, start: int, end: Optional[int] = None) -> bytes:
+        with self.open(bucket, key) as f:
+            if start < 0:
+                f.seek(max(0, os.fstat(f.fileno()).st_size + start))
+                return f.read()
+            f.seek(start)
+            return f.read() if end is None else f.read(max(0, end - start))
+
+    def _write(self, bucket: str, key: str, writer) -> str:
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}"
+        try:
+            with open(temp, "wb") as f:
+                writer(f)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return self._etag(os.stat(path))
+
+    @_metered("put")
+    def put(self, bucket: str, key: str, data: Data, if_match: Optional[str] = None,
+            if_none_match: bool = False) -> str:
+        if not if_match and not if_none_match:
+            return self._write(bucket, key, lambda f: f.write(data))
+
+        # Gravação condicional: verificação e escrita sob lock entre processos
+        os.makedirs(os.path.join(self.root, bucket), exist_ok=True)
+        with self._lock, open(os.path.join(self.root, bucket, LOCK_NAME), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                current = self.head(bucket, key)
+                if if_none_match and current is not None:
+                    raise PreconditionFailed(f"{bucket}/{key} já existe")
+                if if_match and (current is None or current.etag != if_match):
+                    raise PreconditionFailed(f"{bucket}/{key}: ETag diferente de {if_match}")
+                return self._write(bucket, key, lambda f: f.write(data))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @_metered("upload")
+    def upload(self, bucket: str, key: str, source: Union[str, BinaryIO]) -> None:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                self._write(bucket, key, lambda target: shutil.copyfileobj(f, target, MULTIPART_CHUNKSIZE))
+        else:
+            self._write(bucket, key, lambda target: shutil.copyfileobj(source, target, MULTIPART_CHUNKSIZE))
+
+    @_metered("download")
+    def download(self, bucket: str, key: str, target: Union[str, BinaryIO]) -> None:
+        if isinstance(target, str):
+            self._stat(bucket, key)
+            shutil.copyfile(self._path(bucket, key), target)
+            return
+        with self.open(bucket, key) as f:
+            shutil.copyfileobj(f, target, MULTIPART_CHUNKSIZE)
+
+    @_metered("copy")
+    def copy(self, source_bucket: str, source_key: str, bucket: str, key: str) -> None:
+        with self.open(source_bucket, source_key) as source:
+            self._write(bucket, key, lambda target: shutil.copyfileobj(source, target, MULTIPART_CHUNKSIZE))
+
+    def delete(self, bucket: str, key: str) -> None:
+        """Remove a key; remover uma key inexistente não é erro."""
+        try:
+            os.remove(self._path(bucket, key))
+        except FileNotFoundError:
+            pass
+
+    def head(self, bucket: str, key: str) -> Optional[ObjectInfo]:
+        try:
+            stat = self._stat(bucket, key)
+        except ObjectNotFound:
+            return None
+        return ObjectInfo(key, stat.st_size, self._etag(stat))
+
+    def list(self, bucket: str, prefix: str = "") -> Iterator[ObjectInfo]:
+        base = os.path.join(self.root, bucket)
+        # Só desce nas pastas que podem conter o prefixo
+        start = os.path.join(base, os.path.dirname(prefix)) if "/" in prefix else base
+        keys = []
+        for directory, _, names in os.walk(start):
+            for name in names:
+                if name.endswith(TEMP_SUFFIX) or name == LOCK_NAME:
+                    continue
+                key = os.path.relpath(os.path.join(directory, name), base).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        for key in sorted(keys):
+            info = self.head(bucket, key)
+            if info is not None:
+                yield info
+
+    def list_prefixes(self, bucket: str, prefix: str = "", delimiter: str = "/") -> Iterator[str]:
+        seen = set()
+        for info in self.list(bucket, prefix):
+            rest = info.key[len(prefix):]
+            if delimiter in rest:
+                common = prefix + rest.split(delimiter, 1)[0] + delimiter
+                if common not in seen:
+                    seen.add(common)
+                    yield common
+
+    def create_bucket(self, bucket: str) -> None:
+        try:
+            os.makedirs(os.path.join(self.root, bucket))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """O backend configurado em OBJECT_STORE, criado uma vez por processo."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BACKEND == "local":
+                    _store = LocalStore(LOCAL_ROOT)
+                elif BACKEND == "s3":
+                    _store = S3Store()
+                else:
+                    raise ValueError(f"OBJECT_STORE inválido: {BACKEND} (use 's3' ou 'local')")
+                if CACHE_DIR:
+                    import object_cache
+                    _store = object_cache.CachedStore(_store, object_cache.DiskCache(CACHE_DIR))
+                logger.info(f"Armazenamento de objetos: {_store.name}")
+    return _store
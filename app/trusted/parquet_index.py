@@ -0,0 +1,63 @@
+"""
+Índices embutidos nos arquivos Parquet da camada trusted.
+
+Os escritores gravam Bloom filters nativos do Parquet nas colunas de
+identificadores usadas em buscas pontuais (PlanId, StandardComponentId e
+IssuerId). Junto com o min/max que o Parquet já guarda por row group, eles
+permitem descartar arquivos e row groups que certamente não contêm um valor
+lendo apenas o rodapé e o próprio filtro (ver `app/delivery/point_lookup.py`).
+
+Os filtros ficam dentro do arquivo, então acompanham a cópia server-side para a
+gold sem objetos extras. Athena (Trino) e DuckDB também os usam em filtros de
+igualdade.
+
+O tamanho de cada filtro é calculado a partir do número de valores distintos da
+coluna, em vez do padrão de 1M do pyarrow, para não inflar arquivos pequenos.
+"""
+
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, Optional, Sequence
+
+# Configurações
+INDEX_COLUMNS = ("PlanId", "StandardComponentId", "IssuerId")
+BLOOM_FPP = float(os.environ.get("PARQUET_BLOOM_FPP", "0.01"))
+
+
+def _distinct_count(data, column: str) -> int:
+    if isinstance(data, (pa.Table, pa.RecordBatch)):
+        return pc.count_distinct(data.column(column)).as_py()
+    return int(data[column].nunique())
+
+
+def bloom_filter_options(data, columns: Sequence[str] = INDEX_COLUMNS,
+                         distinct_counts: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+    """
+    Opções `bloom_filter_options` do pyarrow para as colunas de índice presentes.
+
+    Args:
+    data: Tabela Arrow ou DataFrame pandas que será gravado, ou só o schema
+        (escrita em lotes), com `distinct_counts`.
+    columns (Sequence[str]): Colunas a indexar.
+    distinct_counts (Optional[Dict[str, int]]): Valores distintos por coluna, já
+        contados por quem escreve em lotes. Uma coluna sem contagem fica só com o fpp.
+
+    Returns:
+    Dict[str, Dict]: Coluna -> {"ndv", "fpp"}, apenas para as colunas existentes.
+    """
+    if isinstance(data, pa.Schema):
+        names = data.names
+    else:
+        names = data.column_names if isinstance(data, (pa.Table, pa.RecordBatch)) else list(data.columns)
+    opcoes = {}
+    for column in columns:
+        if column not in names:
+            continue
+        if distinct_counts is None:
+            opcoes[column] = {"ndv": max(1, _distinct_count(data, column)), "fpp": BLOOM_FPP}
+        elif column in distinct_counts:
+            opcoes[column] = {"ndv": max(1, distinct_counts[column]), "fpp": BLOOM_FPP}
+        else:
+            opcoes[column] = {"fpp": BLOOM_FPP}
+    return opcoes
@@ -0,0 +1,207 @@
+"""
+Perfis de layout Parquet por tabela: codec, row groups, páginas, dicionários,
+estatísticas, page index e Bloom filters.
+
+Todos os escritores do pipeline (raw, trusted, reescrita da gold em
+`quality_valid` e dicionários de `surrogate_keys`) pegam as opções de escrita
+daqui, pelo nome da tabela, em vez de usar os padrões do pyarrow:
+- raw: zstd nível 1 (a raw é escrita uma vez e lida inteira uma vez), sem page
+  index nem Bloom filters
+- trusted: zstd nível 3, row groups de 128k linhas, page index e Bloom filters
+  (`parquet_index`) para buscas pontuais, sem dicionário nas colunas de alta
+  cardinalidade (hash `version`, valores de taxa)
+- tabelas grandes ou largas ajustam row groups e páginas (ver PROFILES)
+- as silver são clusterizadas pelas chaves de consulta da gold (StateCode,
+  BusinessYear, PlanId...) antes da escrita (`clustering`), para que as
+  estatísticas min/max descartem row groups em filtros de igualdade;
+  `write_table` aplica a clusterização e as opções juntas
+
+A variável PARQUET_LAYOUT sobrescreve campos de perfis sem novo build, em JSON:
+    PARQUET_LAYOUT='{"tb_silver_rate": {"compression": "snappy", "cluster_method": "zorder"}, "*": {"page_index": false}}'
+("*" vale para todas as tabelas.)
+
+O benchmark `app/benchmarks/bench_parquet_layout.py` mede tamanho, tempo de
+escrita e tempo de leitura de cada tabela com o perfil configurado e variações;
+`app/benchmarks/bench_clustering.py` mede os row groups descartados por predicado.
+
+Uso:
+    parquet_layout.write_table(table, buffer, "tb_silver_rate")
+    pq.write_table(table, buffer, **parquet_layout.write_options("tb_silver_rate", table))
+    df.to_parquet(buffer, index=False, **parquet_layout.write_options("Rate", df))
+    pq.ParquetWriter(saida, schema, **parquet_layout.writer_options("tb_silver_rate", tabela))
+    parquet_layout.write_batches(lotes_ordenados, "/tmp/saida.parquet", schema, "tb_silver_rate")
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import parquet_index
+import clustering
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LayoutProfile(NamedTuple):
+    compression: str = "zstd"
+    compression_level: Optional[int] = 3
+    row_group_size: Optional[int] = 128 * 1024   # linhas por row group (None: um por escrita, até 1M)
+    data_page_size: int = 2**20                  # bytes por página de dados
+    dictionary: bool = True
+    no_dictionary: Tuple[str, ...] = ("version",)  # colunas de alta cardinalidade, sem dicionário
+    statistics: bool = True
+    page_index: bool = True
+    bloom_filters: bool = True
+    cluster_by: Tuple[str, ...] = ()             # chaves de ordenação antes da escrita (vazio: ordem de chegada)
+    cluster_method: str = "sort"                 # "sort" ou "zorder" (ver `clustering`)
+
+
+# Configurações
+TRUSTED = LayoutProfile()
+GOLD_KEYS = ("StateCode", "BusinessYear", "PlanId")   # filtros e agrupamentos das consultas da gold
+RAW = LayoutProfile(compression_level=1, row_group_size=None, no_dictionary=(), page_index=False, bloom_filters=False)
+
+PROFILES: Dict[str, LayoutProfile] = {
+    # raw: um arquivo por chunk, que já vem no tamanho do orçamento de memória
+    "Rate": RAW._replace(no_dictionary=("IndividualRate", "IndividualTobaccoRate", "RowNumber")),
+    "Benefits_Cost_Sharing": RAW._replace(no_dictionary=("RowNumber",)),
+    "Plan_Attributes": RAW._replace(no_dictionary=("RowNumber",)),
+    # trusted
+    "tb_silver_rate": TRUSTED._replace(row_group_size=256 * 1024, data_page_size=256 * 1024,
+                                       no_dictionary=("version", "IndividualRate", "IndividualTobaccoRate"),
+                                       cluster_by=GOLD_KEYS),
+    "tb_silver_benefits_cost_sharing": TRUSTED._replace(data_page_size=256 * 1024, cluster_by=GOLD_KEYS),
+    # ~150 colunas e poucas linhas: row groups menores mantêm a poda por row group útil
+    "tb_silver_plan_attributes": TRUSTED._replace(row_group_size=32 * 1024, cluster_by=GOLD_KEYS),
+    "tb_silver_business_rules": TRUSTED._replace(cluster_by=("StateCode", "BusinessYear", "IssuerId")),
+    "tb_silver_service_area": TRUSTED._replace(cluster_by=("StateCode", "BusinessYear", "ServiceAreaId")),
+    "tb_bronze_zipcodes": TRUSTED._replace(bloom_filters=False),
+    # gold: a fato desnormalizada, em row groups grandes (~1M linhas)
+    "tb_gold_fact_plan_rate_benefit": TRUSTED._replace(row_group_size=1_000_000, cluster_by=GOLD_KEYS),
+    # dicionários de chaves substitutas: valores únicos, lidos inteiros
+    "_chaves": LayoutProfile(dictionary=False, no_dictionary=(), page_index=False, bloom_filters=False,
+                             row_group_size=None),
+}
+DEFAULT = TRUSTED
+MAX_ROW_GROUP_ROWS = 1024 * 1024   # row group da escrita em lotes sem row_group_size (o padrão do pyarrow)
+
+
+def _overrides() -> Dict[str, Dict]:
+    try:
+        return json.loads(os.environ.get("PARQUET_LAYOUT") or "{}")
+    except ValueError as e:
+        logger.warning(f"PARQUET_LAYOUT inválido, ignorado: {e}")
+        return {}
+
+
+def profile(table: str, default: LayoutProfile = DEFAULT) -> LayoutProfile:
+    """
+    Perfil da tabela (raw, trusted ou gold: `tb_gold_*` usa o perfil da `tb_silver_*`).
+    Tabelas sem perfil próprio usam `default`, com os overrides de PARQUET_LAYOUT.
+    """
+    base = PROFILES.get(table) or PROFILES.get(table.replace("tb_gold_", "tb_silver_", 1)) or default
+    overrides = _overrides()
+    for key in ("*", table):
+        if key in overrides:
+            base = base._replace(**overrides[key])
+    return base
+
+
+def _columns(data):
+    if data is None:
+        return None
+    if isinstance(data, (pa.Table, pa.RecordBatch)):
+        return data.column_names
+    if isinstance(data, pa.Schema):
+        return data.names
+    return [str(column) for column in data.columns]
+
+
+def writer_options(table: str, data=None, layout: Optional[LayoutProfile] = None,
+                   distinct_counts: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    Opções para `pq.ParquetWriter` segundo o perfil. `data` (tabela Arrow ou
+    DataFrame) dimensiona os Bloom filters e resolve as colunas sem dicionário;
+    na escrita em lotes, `data` é o schema e `distinct_counts` dimensiona os filtros.
+    """
+    layout = layout or profile(table)
+    columns = _columns(data)
+    use_dictionary = layout.dictionary
+    if use_dictionary and layout.no_dictionary and columns is not None:
+        use_dictionary = [column for column in columns if column not in layout.no_dictionary]
+
+    options = {
+        "compression": layout.compression,
+        "compression_level": layout.compression_level,
+        "data_page_size": layout.data_page_size,
+        "use_dictionary": use_dictionary,
+        "write_statistics": layout.statistics,
+        "write_page_index": layout.page_index,
+    }
+    if layout.bloom_filters and data is not None and (distinct_counts is not None or not isinstance(data, pa.Schema)):
+        bloom = parquet_index.bloom_filter_options(data, distinct_counts=distinct_counts)
+        if bloom:
+            options["bloom_filter_options"] = bloom
+    return options
+
+
+def write_options(table: str, data=None, layout: Optional[LayoutProfile] = None) -> Dict:
+    """Opções para `pq.write_table` e `DataFrame.to_parquet`: as do writer mais o tamanho do row group."""
+    layout = layout or profile(table)
+    options = writer_options(table, data, layout)
+    if layout.row_group_size:
+        options["row_group_size"] = layout.row_group_size
+    return options
+
+
+def write_batches(batches: Iterable[pa.RecordBatch], sink, schema: pa.Schema, table: str,
+                  layout: Optional[LayoutProfile] = None, options: Optional[Dict] = None,
+                  row_group_size: Optional[int] = None) -> int:
+    """
+    Escreve lotes já na ordem final, sem materializar a tabela, em row groups de
+    `row_group_size` linhas (padrão: o do perfil, ou MAX_ROW_GROUP_ROWS). `options`
+    substitui as de `writer_options(table, schema)`. Devolve as linhas escritas.
+    """
+    layout = layout or profile(table)
+    linhas = row_group_size or layout.row_group_size or MAX_ROW_GROUP_ROWS
+    if options is None:
+        options = writer_options(table, schema, layout)
+    escritas = 0
+    with pq.ParquetWriter(sink, schema, **options) as writer:
+        # Cada escrita fecha ao menos um row group: junta os lotes até o tamanho do row group
+        pendentes, acumuladas = [], 0
+        for batch in batches:
+            pendentes.append(batch)
+            acumuladas += batch.num_rows
+            while acumuladas >= linhas:
+                bloco = pa.Table.from_batches(pendentes, schema=schema)
+                writer.write_table(bloco.slice(0, linhas), row_group_size=linhas)
+                pendentes = bloco.slice(linhas).to_batches()
+                acumuladas -= linhas
+                escritas += linhas
+        if pendentes or not escritas:
+            writer.write_table(pa.Table.from_batches(pendentes, schema=schema), row_group_size=linhas)
+            escritas += acumuladas
+    return escritas
+
+
+def write_table(data, sink, table: str, layout: Optional[LayoutProfile] = None) -> None:
+    """
+    Escreve a tabela (Arrow ou DataFrame, sem o índice) no layout do perfil:
+    clusterizada pelas chaves `cluster_by`, em row groups de `row_group_size`
+    linhas, com as opções de `writer_options`.
+    """
+    layout = layout or profile(table)
+    if not isinstance(data, pa.Table):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    options = writer_options(table, data, layout)
+    if not layout.cluster_by:
+        pq.write_table(data, sink, row_group_size=layout.row_group_size, **options)
+        return
+    with metrics.timer("cluster", table=table, method=layout.cluster_method):
+        write_batches(clustering.cluster_batches(data, layout.cluster_by, layout.cluster_method, name=table),
+                      sink, data.schema, table, layout, options, layout.row_group_size or data.num_rows or 1)
@@ -0,0 +1,154 @@
+"""
+Descoberta de partições no S3 compartilhada pelos jobs da camada trusted.
+
+Substitui as versões locais de `get_latest_partition` que faziam uma única chamada
+`list_objects_v2` sem paginação (perdendo partições além dos primeiros 1000 prefixos)
+e repetiam a mesma listagem várias vezes na mesma execução.
+
+Principais funcionalidades:
+- Listagem paginada de prefixos de partição (`partition_date=` / `partitionDate=`)
+- Cache em processo com TTL, evitando LISTs repetidos durante a mesma execução
+- Ponteiro "última partição": um pequeno objeto atualizado pelos escritores que
+  permite aos leitores descobrir a partição mais recente sem nenhum LIST
+
+Formato do ponteiro: objeto `{prefix}_LATEST` contendo apenas o valor da partição
+(ex.: `20250322`) em texto puro.
+"""
+
+import os
+import time
+import logging
+import object_store
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+PARTITION_KEYS: Tuple[str, ...] = ("partition_date", "partitionDate")
+LATEST_POINTER_NAME = "_LATEST"
+CACHE_TTL_SECONDS = float(os.environ.get("PARTITION_CACHE_TTL_SECONDS", "300"))
+
+# Cache em processo: (bucket, prefix) -> (instante da listagem, partições ordenadas)
+_partition_cache: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+
+
+def _pointer_key(prefix: str) -> str:
+    return f"{prefix}{LATEST_POINTER_NAME}"
+
+
+def invalidate_cache(bucket: Optional[str] = None, prefix: Optional[str] = None) -> None:
+    """
+    Remove entradas do cache de partições.
+
+    Args:
+    bucket (Optional[str]): Bucket a invalidar. Se None, invalida todos.
+    prefix (Optional[str]): Prefixo a invalidar. Se None, invalida todo o bucket.
+    """
+    for cache_key in list(_partition_cache):
+        if (bucket is None or cache_key[0] == bucket) and (prefix is None or cache_key[1] == prefix):
+            del _partition_cache[cache_key]
+
+
+def list_partitions(prefix: str, bucket: str, partition_keys: Sequence[str] = PARTITION_KEYS,
+                    ttl: float = CACHE_TTL_SECONDS) -> List[str]:
+    """
+    Lista todos os valores de partição sob um prefixo, com paginação completa e cache.
+
+    Args:
+    prefix (str): O prefixo do caminho no S3 (terminado em '/').
+    bucket (str): O bucket S3.
+    partition_keys (Sequence[str]): Nomes aceitos para a chave de partição.
+    ttl (float): Tempo de vida da listagem em cache, em segundos. 0 desativa o cache.
+
+    Returns:
+    List[str]: Os valores de partição encontrados, em ordem crescente.
+
+    Raises:
+    Exception: Se houver um erro ao listar objetos no S3.
+    """
+    cache_key = (bucket, prefix)
+    cached = _partition_cache.get(cache_key)
+    if cached is not None and ttl > 0 and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+
+    try:
+        starts = tuple(f"{prefix}{key}=" for key in partition_keys)
+
+        partitions = set()
+        for value in object_store.get_store().list_prefixes(bucket, prefix):
+            if value.startswith(starts):
+                partitions.add(value.split('=', 1)[1].rstrip('/'))
+    except Exception as e:
+        logger.error(f"Erro ao listar partições de s3://{bucket}/{prefix}: {str(e)}")
+        raise
+
+    result = sorted(partitions)
+    _partition_cache[cache_key] = (time.monotonic(), result)
+    logger.info(f"{len(result)} partições encontradas em s3://{bucket}/{prefix}")
+    return result
+
+
+def read_latest_pointer(prefix: str, bucket: str) -> Optional[str]:
+    """
+    Lê o ponteiro de última partição escrito pelo job produtor.
+
+    Args:
+    prefix (str): O prefixo do caminho no S3.
+    bucket (str): O bucket S3.
+
+    Returns:
+    Optional[str]: O valor da partição, ou None se o ponteiro não existir.
+    """
+    try:
+        value = object_store.get_store().get(bucket, _pointer_key(prefix)).decode('utf-8').strip()
+        return value or None
+    except object_store.ObjectNotFound:
+        return None
+
+
+def write_latest_pointer(prefix: str, bucket: str, partition: str) -> None:
+    """
+    Atualiza o ponteiro de última partição. Deve ser chamado pelo escritor
+    somente depois que todos os arquivos da partição foram salvos.
+
+    Args:
+    prefix (str): O prefixo do caminho no S3.
+    bucket (str): O bucket S3.
+    partition (str): O valor da partição recém-escrita.
+    """
+    object_store.get_store().put(bucket, _pointer_key(prefix), partition.encode('utf-8'))
+    invalidate_cache(bucket, prefix)
+    logger.info(f"Ponteiro de partição atualizado: s3://{bucket}/{_pointer_key(prefix)} -> {partition}")
+
+
+def get_latest_partition(prefix: str, bucket: str, use_pointer: bool = True) -> str:
+    """
+    Obtém a partição mais recente de um prefixo específico no S3.
+
+    Consulta primeiro o ponteiro de última partição; se ele não existir, recorre
+    à listagem paginada (com cache).
+
+    Args:
+    prefix (str): O prefixo do caminho no S3 para buscar partições.
+    bucket (str): O bucket S3.
+    use_pointer (bool): Se False, ignora o ponteiro e sempre lista.
+
+    Returns:
+    str: A data da partição mais recente.
+
+    Raises:
+    Exception: Se nenhuma partição for encontrada ou houver erro no S3.
+    """
+    try:
+        if use_pointer:
+            latest = read_latest_pointer(prefix, bucket)
+            if latest is not None:
+                return latest
+
+        partitions = list_partitions(prefix, bucket)
+        if not partitions:
+            raise ValueError(f"Nenhuma partição encontrada em s3://{bucket}/{prefix}")
+        return partitions[-1]
+    except Exception as e:
+        logger.error(f"Erro ao obter a última partição: {str(e)}")
+        raise
@@ -0,0 +1,246 @@
+"""
+Motor de regras de qualidade da camada gold, usado por `quality_valid`.
+
+Substitui o schema Pandera: cada tabela declara uma lista de regras que é
+compilada em expressões vetorizadas do `pyarrow.compute`, avaliadas sobre
+tabelas Arrow sem nenhuma iteração por linha em Python e sem converter para
+pandas. Além do resultado, cada regra violada traz a quantidade de falhas e
+uma pequena amostra (linha e valor), obtida sem materializar as linhas válidas.
+
+Tipos de regra:
+- nao_nulo: a coluna não pode ter nulos
+- inteiro: os valores precisam ser convertíveis para inteiro (como o `coerce` do Pandera)
+- texto: a coluna precisa ser do tipo string
+- valores: os valores precisam pertencer a um conjunto (`valores`)
+- intervalo: valores numéricos entre `minimo` e `maximo` (inclusive)
+- padrao: os valores precisam casar com a expressão regular `padrao`
+
+Toda regra tem `coluna` e `obrigatoria`: uma coluna obrigatória ausente falha
+todas as linhas; uma coluna opcional ausente torna a regra vazia.
+"""
+
+import re
+import json
+import hashlib
+from functools import lru_cache
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, List, Optional
+
+# Número de exemplos guardados por regra violada
+TAMANHO_AMOSTRA = 5
+
+PADRAO_INTEIRO = r"^\s*[+-]?\d+(\.0*)?\s*$"
+_PADRAO_INTEIRO_PY = re.compile(PADRAO_INTEIRO)
+
+
+# ========== DECLARAÇÃO DAS REGRAS ==========
+def nao_nulo(coluna: str, obrigatoria: bool = True) -> Dict:
+    return {"tipo": "nao_nulo", "coluna": coluna, "obrigatoria": obrigatoria}
+
+def inteiro(coluna: str, obrigatoria: bool = True) -> Dict:
+    return {"tipo": "inteiro", "coluna": coluna, "obrigatoria": obrigatoria}
+
+def texto(coluna: str, obrigatoria: bool = False) -> Dict:
+    return {"tipo": "texto", "coluna": coluna, "obrigatoria": obrigatoria}
+
+def valores(coluna: str, permitidos: List[str], obrigatoria: bool = False) -> Dict:
+    return {"tipo": "valores", "coluna": coluna, "obrigatoria": obrigatoria, "valores": sorted(permitidos)}
+
+def intervalo(coluna: str, minimo: Optional[float] = None, maximo: Optional[float] = None, obrigatoria: bool = False) -> Dict:
+    return {"tipo": "intervalo", "coluna": coluna, "obrigatoria": obrigatoria, "minimo": minimo, "maximo": maximo}
+
+def padrao(coluna: str, expressao: str, obrigatoria: bool = False) -> Dict:
+    return {"tipo": "padrao", "coluna": coluna, "obrigatoria": obrigatoria, "padrao": expressao}
+
+
+# Regras comuns a todas as tabelas (equivalentes ao antigo schema Pandera)
+REGRAS_PADRAO = [
+    nao_nulo("BusinessYear"), inteiro("BusinessYear"),
+    nao_nulo("IssuerId"), inteiro("IssuerId"),
+    texto("PlanId"),
+    nao_nulo("StateCode", obrigatoria=False), texto("StateCode"),
+    nao_nulo("SourceName", obrigatoria=False), texto("SourceName"),
+]
+
+# Regras adicionais por tabela: chaves usadas nos joins da camada gold
+REGRAS_POR_TABELA = {
+    "tb_silver_rate": REGRAS_PADRAO + [
+        nao_nulo("PlanId", obrigatoria=False),
+        nao_nulo("Age", obrigatoria=False),
+        intervalo("BusinessYear", minimo=2014),
+    ],
+    "tb_silver_benefits_cost_sharing": REGRAS_PADRAO + [
+        nao_nulo("StandardComponentId", obrigatoria=False), texto("StandardComponentId"),
+        nao_nulo("BenefitName", obrigatoria=False),
+    ],
+    "tb_silver_plan_attributes": REGRAS_PADRAO + [
+        nao_nulo("PlanId", obrigatoria=False),
+        nao_nulo("StandardComponentId", obrigatoria=False), texto("StandardComponentId"),
+    ],
+    "tb_silver_business_rules": REGRAS_PADRAO + [
+        nao_nulo("StandardComponentId", obrigatoria=False), texto("StandardComponentId"),
+    ],
+    "tb_silver_service_area": REGRAS_PADRAO + [
+        nao_nulo("ServiceAreaId", obrigatoria=False),
+    ],
+}
+
+# Muda sempre que alguma regra muda (usado pelo ledger de validação)
+VERSAO_REGRAS = hashlib.md5(json.dumps(
+    {"padrao": REGRAS_PADRAO, "tabelas": REGRAS_POR_TABELA}, sort_keys=True
+).encode()).hexdigest()[:12]
+
+
+def regras_da_tabela(key: str) -> List[Dict]:
+    """Regras aplicáveis a um arquivo, a partir do nome da tabela no início da key."""
+    return REGRAS_POR_TABELA.get(key.split('/', 1)[0], REGRAS_PADRAO)
+
+def regras_compiladas_da_tabela(key: str) -> List:
+    """Como `regras_da_tabela`, já compiladas (uma vez por tabela e por processo)."""
+    return _compilar_tabela(key.split('/', 1)[0])
+
+@lru_cache(maxsize=None)
+def _compilar_tabela(tabela: str) -> List:
+    return compilar(REGRAS_POR_TABELA.get(tabela, REGRAS_PADRAO))
+
+
+# ========== COMPILAÇÃO ==========
+def _eh_texto(tipo: pa.DataType) -> bool:
+    return pa.types.is_string(tipo) or pa.types.is_large_string(tipo)
+
+def _mascara_inteiro(coluna: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Máscara das linhas convertíveis para inteiro (nulos ficam nulos)."""
+    if pa.types.is_integer(coluna.type):
+        return pc.is_valid(coluna)
+    if pa.types.is_floating(coluna.type):
+        return pc.equal(pc.floor(coluna), coluna)
+    if pa.types.is_decimal(coluna.type):
+        return pc.equal(pc.floor(coluna), coluna)
+    if _eh_texto(coluna.type):
+        return pc.match_substring_regex(coluna, PADRAO_INTEIRO)
+    return pc.is_null(coluna)
+
+def _como_numero(coluna: pa.ChunkedArray) -> pa.ChunkedArray:
+    if _eh_texto(coluna.type):
+        coluna = pc.if_else(pc.match_substring_regex(coluna, r"^\s*[+-]?(\d+\.?\d*|\.\d+)\s*$"), pc.utf8_trim_whitespace(coluna), None)
+    return pc.cast(coluna, pa.float64())
+
+def _compilar_regra(regra: Dict):
+    """Devolve uma função coluna -> máscara booleana das linhas que violam a regra."""
+    tipo = regra["tipo"]
+
+    if tipo == "nao_nulo":
+        return lambda coluna: pc.is_null(coluna)
+    if tipo == "inteiro":
+        return lambda coluna: pc.invert(_mascara_inteiro(coluna))
+    if tipo == "texto":
+        return lambda coluna: pa.repeat(pa.scalar(not _eh_texto(coluna.type)), len(coluna))
+    if tipo == "valores":
+        permitidos = pa.array(regra["valores"])
+        return lambda coluna: pc.invert(pc.is_in(pc.cast(coluna, pa.string()), value_set=permitidos))
+    if tipo == "intervalo":
+        def violacoes(coluna):
+            numeros = _como_numero(coluna)
+            fora = pc.is_null(numeros)
+            if regra["minimo"] is not None:
+                fora = pc.or_kleene(fora, pc.less(numeros, regra["minimo"]))
+            if regra["maximo"] is not None:
+                fora = pc.or_kleene(fora, pc.greater(numeros, regra["maximo"]))
+            # Nulos na origem são responsabilidade da regra nao_nulo
+            return pc.and_(fora, pc.is_valid(coluna))
+        return violacoes
+    if tipo == "padrao":
+        expressao = regra["padrao"]
+        return lambda coluna: pc.invert(pc.match_substring_regex(pc.cast(coluna, pa.string()), expressao))
+    raise ValueError(f"Tipo de regra desconhecido: {tipo}")
+
+def compilar(regras: List[Dict]) -> List:
+    """Compila a lista declarativa de regras em pares (regra, função de violação)."""
+    return [(regra, _compilar_regra(regra)) for regra in regras]
+
+
+# ========== AVALIAÇÃO ==========
+def avaliar(tabela: pa.Table, regras_compiladas: List, tamanho_amostra: int = TAMANHO_AMOSTRA) -> Dict:
+    """
+    Avalia as regras compiladas sobre uma tabela Arrow.
+
+    Args:
+    tabela (pa.Table): A tabela a validar.
+    regras_compiladas (List): O retorno de `compilar`.
+    tamanho_amostra (int): Quantos exemplos guardar por regra violada.
+
+    Returns:
+    Dict: {"valido": bool, "falhas": [{"coluna", "regra", "quantidade", "amostras"}]}
+    """
+    falhas = []
+    for regra, violacoes in regras_compiladas:
+        nome = regra["coluna"]
+        if nome not in tabela.column_names:
+            if regra["obrigatoria"]:
+                falhas.append({"coluna": nome, "regra": regra["tipo"], "quantidade": tabela.num_rows,
+                               "amostras": [], "motivo": "coluna obrigatória ausente"})
+            continue
+
+        coluna = tabela.column(nome)
+        mascara = pc.fill_null(violacoes(coluna), False)
+        quantidade = pc.sum(mascara).as_py() or 0
+        if quantidade:
+            linhas = pc.indices_nonzero(mascara).slice(0, tamanho_amostra)
+            amostras = [{"linha": linha, "valor": valor}
+                        for linha, valor in zip(linhas.to_pylist(), coluna.take(linhas).to_pylist())]
+            falhas.append({"coluna": nome, "regra": regra["tipo"], "quantidade": quantidade, "amostras": amostras})
+
+    return {"valido": not falhas, "falhas": falhas}
+
+
+# ========== ESTATÍSTICAS DO PARQUET ==========
+def _valor_inteiro(valor) -> bool:
+    if isinstance(valor, bytes):
+        valor = valor.decode("utf-8", errors="replace")
+    if isinstance(valor, bool):
+        return False
+    if isinstance(valor, int):
+        return True
+    if isinstance(valor, float):
+        return valor.is_integer()
+    return isinstance(valor, str) and _PADRAO_INTEIRO_PY.match(valor) is not None
+
+def _como_float(valor) -> Optional[float]:
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, bytes):
+        valor = valor.decode("utf-8", errors="replace")
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+def provada_por_estatisticas(regra: Dict, coluna_schema, stats) -> bool:
+    """
+    Indica se as estatísticas de um column chunk Parquet garantem a regra para
+    todas as linhas do row group, sem ler os dados.
+    """
+    tipo = regra["tipo"]
+    if tipo == "texto":
+        return coluna_schema.logical_type.type == "STRING"
+    if stats is None:
+        return False
+    if tipo == "nao_nulo":
+        return stats.has_null_count and stats.null_count == 0
+    if tipo == "inteiro":
+        if coluna_schema.physical_type in ("INT32", "INT64") and coluna_schema.logical_type.type != "DECIMAL":
+            return True
+        return stats.has_min_max and stats.min == stats.max and _valor_inteiro(stats.min)
+    if tipo == "intervalo":
+        if not stats.has_min_max:
+            return False
+        minimo, maximo = _como_float(stats.min), _como_float(stats.max)
+        # Em colunas texto a ordem lexicográfica não é a numérica: só um valor único prova o intervalo
+        if minimo is None or maximo is None or (not isinstance(stats.min, (int, float)) and stats.min != stats.max):
+            return False
+        return ((regra["minimo"] is None or minimo >= regra["minimo"])
+                and (regra["maximo"] is None or maximo <= regra["maximo"]))
+    if tipo == "valores":
+        return stats.has_min_max and stats.min == stats.max and stats.min in regra["valores"]
+    return False
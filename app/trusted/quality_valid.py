@@ -1,14 +1,21 @@
 import os
 import re
-import boto3
-import pandas as pd
-import pandera as pa
-from pandera import Column
+import io
+import object_store
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import json
+import struct
 import logging
-import tempfile
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import quality_rules
+import parquet_layout
+import metrics
 
-# ========== AWS CLIENT ==========
-s3 = boto3.client('s3')
+# ========== ARMAZENAMENTO ==========
+store = object_store.get_store()
 
 # ========== LOGGING CONFIG ==========
 logging.basicConfig(
@@ -23,86 +30,452 @@ PREFIX_SILVER = "tb_silver"
 BUCKET_GOLD = "delivery-test-edb"
 PREFIX_GOLD = "tb_gold"
 
-# Schema Pandera
-schema = pa.DataFrameSchema({
-    "BusinessYear": Column(pa.Int, nullable=False, coerce=True),
-    "PlanId": Column(pa.String, nullable=True, required=False),
-    "IssuerId": Column(pa.Int, nullable=False, coerce=True),
-    "StateCode": Column(pa.String, nullable=False, required=False),
-    "SourceName": Column(pa.String, nullable=False, required=False),
-})
+# Paralelismo: processos para a validação (CPU) e threads para o S3 (I/O)
+MODO_PARALELO = os.environ.get("VALIDATE_PARALLEL", "true").lower() == "true"
+MAX_WORKERS = int(os.environ.get("VALIDATE_MAX_WORKERS", str(os.cpu_count() or 2)))
+MAX_IO_WORKERS = int(os.environ.get("VALIDATE_MAX_IO_WORKERS", str(MAX_WORKERS * 4)))
+
+# Ledger de validação: resultados por key/ETag/versão do schema entre execuções.
+# Fica no bucket silver, fora do bucket gold varrido pelo crawler.
+BUCKET_LEDGER = os.environ.get("VALIDATE_LEDGER_BUCKET", BUCKET_SILVER)
+KEY_LEDGER = os.environ.get("VALIDATE_LEDGER_KEY", "_validacao/ledger.json")
+
+# Leitura inicial do final do arquivo: cobre o rodapé Parquet na maioria dos casos
+TAMANHO_RODAPE = 64 * 1024
+
+# Tipos da gold: as colunas com regra `inteiro` (BusinessYear, IssuerId) são gravadas
+# em int64, como o `pd.to_numeric` da validação original fazia antes de salvar
+TIPO_INTEIRO_GOLD = pyarrow.int64()
+VERSAO_GOLD = 2
+
+# Muda sempre que uma regra ou os tipos da gold mudam, invalidando os resultados anteriores do ledger.
+# As regras de cada tabela ficam em quality_rules.REGRAS_POR_TABELA.
+VERSAO_SCHEMA = f"{quality_rules.VERSAO_REGRAS}.{VERSAO_GOLD}"
 
 # ========== FUNÇÕES ==========
 def extrair_particoes(caminho):
     padrao = re.compile(r"([a-zA-Z0-9_]+)=([^\/]+)")
     return dict(padrao.findall(caminho))
 
-def validar_com_pandera(df, caminho):
-    df['BusinessYear'] = pd.to_numeric(df['BusinessYear'], errors='coerce')
-    df['IssuerId'] = pd.to_numeric(df['IssuerId'], errors='coerce')
+def validar_com_regras(tabela, caminho):
+    """Valida uma tabela Arrow com as regras compiladas da sua tabela silver."""
+    avaliacao = quality_rules.avaliar(tabela, quality_rules.regras_compiladas_da_tabela(caminho))
+    if avaliacao["valido"]:
+        logging.info(f"Schema validado com sucesso para {caminho}")
+    else:
+        logging.error(f"Erro de schema em {caminho}: {avaliacao['falhas']}")
+    return avaliacao
+
+def listar_arquivos(bucket, prefix):
+    """Lista os arquivos Parquet de um prefixo, devolvendo {key: ETag}."""
+    return {item.key: item.etag for item in store.list(bucket, prefix) if item.key.endswith('.parquet')}
 
-    if df['BusinessYear'].isnull().any():
-        logging.warning(f"Valores inválidos encontrados em 'BusinessYear' no arquivo {caminho}")
-    elif df['IssuerId'].isnull().any():
-        logging.warning(f"Valores inválidos encontrados em 'IssuerId' no arquivo {caminho}")
+def listar_arquivos_silver():
+    return listar_arquivos(BUCKET_SILVER, PREFIX_SILVER)
 
+def carregar_ledger():
+    """Lê o ledger de validação; um ledger inexistente ou ilegível é tratado como vazio."""
     try:
-        schema.validate(df, lazy=True)
-        logging.info(f"Schema validado com sucesso para {caminho}")
-        return True
-    except pa.errors.SchemaErrors as err:
-        logging.error(f"Erro de schema em {caminho}: {err.failure_cases}")
-        return False
+        return json.loads(store.get(BUCKET_LEDGER, KEY_LEDGER))
+    except object_store.ObjectNotFound:
+        return {}
+    except Exception as e:
+        logging.warning(f"Não foi possível ler o ledger s3://{BUCKET_LEDGER}/{KEY_LEDGER}: {str(e)}")
+        return {}
+
+def salvar_ledger(ledger):
+    store.put(BUCKET_LEDGER, KEY_LEDGER, json.dumps(ledger, sort_keys=True).encode('utf-8'))
+    logging.info(f"Ledger salvo com {len(ledger)} entradas em s3://{BUCKET_LEDGER}/{KEY_LEDGER}")
+
+def entrada_vigente(ledger, key, etag):
+    """Entrada do ledger ainda válida para o arquivo (mesmo ETag e mesma versão do schema)."""
+    entrada = ledger.get(key)
+    if entrada and entrada.get("etag") == etag and entrada.get("versao_schema") == VERSAO_SCHEMA:
+        return entrada
+    return None
+
+def registrar_no_ledger(ledger, resultado, etag):
+    """Registra resultados definitivos; erros não entram para serem refeitos na próxima execução."""
+    if resultado["status"] not in ("valido", "invalido"):
+        return
+    ledger[resultado["key"]] = {
+        "etag": etag,
+        "versao_schema": VERSAO_SCHEMA,
+        "status": resultado["status"],
+        "linhas": resultado["linhas"],
+        "promocao": resultado.get("promocao"),
+        "destino": resultado.get("destino"),
+    }
+
+def baixar_parquet(key):
+    """Etapa de I/O: baixa o arquivo silver para memória, direto num buffer Arrow (sem cópias intermediárias)."""
+    return store.get_buffer(BUCKET_SILVER, key)
+
+def ler_rodape(key):
+    """Lê apenas o rodapé Parquet (metadados e estatísticas) com GETs por faixa de bytes."""
+    cauda = store.get_range(BUCKET_SILVER, key, -TAMANHO_RODAPE)
+    if cauda[-4:] != b"PAR1":
+        raise ValueError(f"'{key}' não é um arquivo Parquet")
+
+    tamanho = struct.unpack("<I", cauda[-8:-4])[0] + 8
+    if tamanho > len(cauda):
+        cauda = store.get_range(BUCKET_SILVER, key, -tamanho)
+    return pq.read_metadata(io.BytesIO(cauda))
+
+def row_groups_nao_provados(metadata, regras):
+    """
+    Row groups cujas estatísticas não provam todas as regras da tabela e que,
+    portanto, precisam ser lidos e validados. Retorna None se falta uma coluna
+    obrigatória, caso em que o arquivo inteiro deve ser validado.
+    """
+    indices = {metadata.schema.column(i).path: i for i in range(metadata.num_columns)}
+    if any(regra["obrigatoria"] and regra["coluna"] not in indices for regra in regras):
+        return None
+
+    pendentes = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for regra in regras:
+            indice = indices.get(regra["coluna"])
+            if indice is None:
+                continue
+            if not quality_rules.provada_por_estatisticas(regra, metadata.schema.column(indice), row_group.column(indice).statistics):
+                pendentes.append(i)
+                break
+    return pendentes
+
+def inspecionar_parquet(key):
+    """
+    Etapa de I/O: lê o rodapé e decide quais row groups precisam ser validados.
+    Em caso de falha, devolve pendentes=None para que o arquivo seja lido por inteiro.
+    """
+    try:
+        metadata = ler_rodape(key)
+    except Exception as e:
+        logging.warning(f"Não foi possível ler o rodapé de '{key}': {str(e)}")
+        return {"colunas": [], "conversoes": [], "linhas": 0, "row_groups": 0, "pendentes": None}
+
+    return {
+        "colunas": metadata.schema.names,
+        "conversoes": colunas_a_converter(metadata.schema.to_arrow_schema(), key),
+        "linhas": metadata.num_rows,
+        "row_groups": metadata.num_row_groups,
+        "pendentes": row_groups_nao_provados(metadata, quality_rules.regras_da_tabela(key)),
+    }
+
+def resultado_por_estatisticas(key, inspecao):
+    """
+    Resultado de um arquivo totalmente provado pelo rodapé e que já contém as
+    colunas de partição nos tipos da gold; None se o arquivo precisar ser lido.
+    """
+    if inspecao["pendentes"] != [] or colunas_faltantes(inspecao["colunas"], key) or inspecao["conversoes"]:
+        return None
+    logging.info(f"Schema provado pelas estatísticas para {key} ({inspecao['row_groups']} row groups pulados)")
+    return {
+        "key": key,
+        "status": "valido",
+        "linhas": inspecao["linhas"],
+        "row_groups": inspecao["row_groups"],
+        "row_groups_pulados": inspecao["row_groups"],
+        "promocao": "copia",
+    }
+
+def colunas_faltantes(colunas, key):
+    """Partições presentes na key que ainda não existem como colunas no arquivo."""
+    return {coluna: valor for coluna, valor in extrair_particoes(key).items() if coluna not in colunas}
+
+def colunas_a_converter(schema, key):
+    """Colunas com regra `inteiro` que o arquivo ainda não guarda no tipo da gold."""
+    inteiras = {regra["coluna"] for regra in quality_rules.regras_da_tabela(key) if regra["tipo"] == "inteiro"}
+    return [campo.name for campo in schema if campo.name in inteiras and campo.type != TIPO_INTEIRO_GOLD]
+
+def converter_para_inteiro(coluna):
+    """Converte uma coluna já validada pela regra `inteiro` (ex.: '2014', ' 2014.0 ', 2014.0) para int64."""
+    if pyarrow.types.is_string(coluna.type) or pyarrow.types.is_large_string(coluna.type):
+        coluna = pc.utf8_trim_whitespace(coluna)
+        try:
+            return pc.cast(coluna, TIPO_INTEIRO_GOLD)
+        except pyarrow.ArrowInvalid:
+            coluna = pc.cast(coluna, pyarrow.float64())
+    return pc.cast(coluna, TIPO_INTEIRO_GOLD)
+
+def reescrever_para_gold(dados, faltantes, conversoes, key):
+    """
+    Reescreve o arquivo row group a row group, convertendo as colunas de
+    `conversoes` para int64 e acrescentando as colunas de partição como
+    constantes. As demais colunas não são convertidas.
+    """
+    arquivo = pq.ParquetFile(pyarrow.BufferReader(dados))
+    campos = [pyarrow.field(coluna, pyarrow.string()) for coluna in faltantes]
+    schema_saida = arquivo.schema_arrow
+    for coluna in conversoes:
+        indice = schema_saida.get_field_index(coluna)
+        schema_saida = schema_saida.set(indice, schema_saida.field(indice).with_type(TIPO_INTEIRO_GOLD))
+    for campo in campos:
+        schema_saida = schema_saida.append(campo)
+
+    saida = pyarrow.BufferOutputStream()
+    writer = None
+    try:
+        for i in range(arquivo.num_row_groups):
+            tabela = arquivo.read_row_group(i)
+            for coluna in conversoes:
+                indice = tabela.schema.get_field_index(coluna)
+                tabela = tabela.set_column(indice, schema_saida.field(coluna), converter_para_inteiro(tabela.column(indice)))
+            for campo in campos:
+                tabela = tabela.append_column(campo, pyarrow.repeat(pyarrow.scalar(faltantes[campo.name]), tabela.num_rows))
+            if writer is None:
+                # Os Bloom filters do original não sobrevivem à reescrita: são recriados,
+                # dimensionados pelo primeiro row group, no layout do perfil da tabela
+                writer = pq.ParquetWriter(saida, schema_saida, **parquet_layout.writer_options(key.split("/")[0], tabela))
+            writer.write_table(tabela)
+        if writer is None:
+            writer = pq.ParquetWriter(saida, schema_saida, **parquet_layout.writer_options(key.split("/")[0], schema_saida))
+    finally:
+        if writer is not None:
+            writer.close()
+    return saida.getvalue()
+
+def validar_parquet(key, dados, row_groups=None):
+    """
+    Etapa de CPU: lê, complementa as partições e valida o arquivo.
+    Não acessa o S3, para poder rodar em outro processo.
+
+    Se `row_groups` for informado, apenas esses row groups são lidos e validados;
+    os demais já foram provados pelas estatísticas do rodapé.
+
+    Retorna o resultado do arquivo e os bytes a enviar para a gold. Quando o
+    arquivo já contém as colunas de partição e as colunas inteiras já estão em
+    int64, nada precisa ser reescrito: o resultado é marcado com promocao='copia'
+    e os bytes são None.
+    """
+    resultado = {"key": key, "status": "invalido", "linhas": 0}
+    try:
+        arquivo = pq.ParquetFile(pyarrow.BufferReader(dados))
+        total = arquivo.num_row_groups
+        if row_groups is None:
+            row_groups = list(range(total))
+        tabela = arquivo.read_row_groups(row_groups) if row_groups else None
+    except Exception as e:
+        logging.error(f"Erro ao ler '{key}': {str(e)}")
+        return {**resultado, "status": "erro", "erro": str(e)}, None
+
+    resultado.update(linhas=arquivo.metadata.num_rows, row_groups=total, row_groups_pulados=total - len(row_groups))
+    logging.info(f"Arquivo carregado: {arquivo.metadata.num_rows} linhas, {len(row_groups)}/{total} row groups a validar.")
+
+    faltantes = colunas_faltantes(arquivo.schema_arrow.names, key)
+    if tabela is not None:
+        for coluna, valor in faltantes.items():
+            tabela = tabela.append_column(coluna, pyarrow.repeat(pyarrow.scalar(valor), tabela.num_rows))
+
+        avaliacao = validar_com_regras(tabela, key)
+        if not avaliacao["valido"]:
+            logging.warning(f"Arquivo {key} inválido, não salvo.")
+            return {**resultado, "falhas": avaliacao["falhas"]}, None
+
+    conversoes = colunas_a_converter(arquivo.schema_arrow, key)
+    if not faltantes and not conversoes:
+        return {**resultado, "status": "valido", "promocao": "copia"}, None
+    return {**resultado, "status": "valido", "promocao": "reescrita"}, reescrever_para_gold(dados, faltantes, conversoes, key)
+
+def enviar_para_gold(key, dados):
+    """Etapa de I/O: envia o arquivo reescrito para a camada gold."""
+    key_gold = key.replace(PREFIX_SILVER, PREFIX_GOLD)
+    store.upload(BUCKET_GOLD, key_gold, pyarrow.BufferReader(dados))
+    logging.info(f"Salvo em: s3://{BUCKET_GOLD}/{key_gold}")
+    return key_gold
+
+def copiar_para_gold(key):
+    """Etapa de I/O: promove o arquivo sem alterações com uma cópia no próprio S3."""
+    key_gold = key.replace(PREFIX_SILVER, PREFIX_GOLD)
+    store.copy(BUCKET_SILVER, key, BUCKET_GOLD, key_gold)
+    logging.info(f"Copiado para: s3://{BUCKET_GOLD}/{key_gold}")
+    return key_gold
+
+def promover_para_gold(key, resultado, saida):
+    """Escolhe entre cópia no servidor e upload do arquivo reescrito."""
+    if resultado.get("promocao") == "copia":
+        return copiar_para_gold(key)
+    return enviar_para_gold(key, saida)
 
 def processar_parquet(key):
     logging.info(f"Processando arquivo: {key}")
 
-    with tempfile.NamedTemporaryFile() as tmp:
+    inspecao = inspecionar_parquet(key)
+    resultado = resultado_por_estatisticas(key, inspecao)
+    saida = None
+
+    if resultado is None:
         try:
-            s3.download_fileobj(BUCKET_SILVER, key, tmp)
-            tmp.seek(0)
-            df = pd.read_parquet(tmp.name)
-            logging.info(f"Arquivo carregado: {df.shape[0]} linhas.")
+            dados = baixar_parquet(key)
         except Exception as e:
             logging.error(f"Erro ao ler '{key}': {str(e)}")
-            return
-
-        particoes = extrair_particoes(key)
-        for coluna, valor in particoes.items():
-            if coluna not in df.columns:
-                df[coluna] = valor
-
-        valido = validar_com_pandera(df, key)
-
-        if valido:
-            try:
-                tmp_output = tempfile.NamedTemporaryFile()
-                df.to_parquet(tmp_output.name, index=False)
-                tmp_output.seek(0)
-                key_gold = key.replace(PREFIX_SILVER, PREFIX_GOLD)
-
-                s3.upload_fileobj(tmp_output, BUCKET_GOLD, key_gold)
-                logging.info(f"Salvo em: s3://{BUCKET_GOLD}/{key_gold}")
-            except Exception as e:
-                logging.error(f"Erro ao salvar '{key_gold}': {str(e)}")
-        else:
-            logging.warning(f"Arquivo {key} inválido, não salvo.")
+            return {"key": key, "status": "erro", "linhas": 0, "erro": str(e)}
+
+        resultado, saida = validar_parquet(key, dados, inspecao["pendentes"])
 
+    if resultado["status"] == "valido":
+        try:
+            resultado["destino"] = promover_para_gold(key, resultado, saida)
+        except Exception as e:
+            logging.error(f"Erro ao salvar '{key}': {str(e)}")
+            resultado.update(status="erro", erro=str(e))
+    return resultado
+
+def reparar_gold(key, entrada):
+    """
+    Recria na gold um arquivo já validado (segundo o ledger) cujo destino sumiu,
+    sem validá-lo de novo.
+    """
+    if entrada.get("promocao") == "copia":
+        return copiar_para_gold(key)
+    dados = baixar_parquet(key)
+    schema = pq.ParquetFile(pyarrow.BufferReader(dados)).schema_arrow
+    faltantes, conversoes = colunas_faltantes(schema.names, key), colunas_a_converter(schema, key)
+    if not faltantes and not conversoes:
+        return enviar_para_gold(key, dados)
+    return enviar_para_gold(key, reescrever_para_gold(dados, faltantes, conversoes, key))
+
+def aplicar_ledger(arquivos, ledger, destinos_gold):
+    """
+    Separa os arquivos inalterados desde a última execução, reparando destinos
+    ausentes na gold, dos arquivos que precisam ser validados.
+
+    Returns:
+    tuple: (resultados dos arquivos resolvidos pelo ledger, keys a validar)
+    """
+    resultados, a_validar = [], []
+    for key, etag in arquivos.items():
+        entrada = entrada_vigente(ledger, key, etag)
+        if entrada is None:
+            a_validar.append(key)
+            continue
+
+        resultado = {"key": key, "status": entrada["status"], "linhas": entrada["linhas"], "promocao": entrada.get("promocao"), "cache": "hit"}
+        if entrada["status"] == "valido":
+            resultado["destino"] = entrada["destino"]
+            if entrada["destino"] not in destinos_gold:
+                try:
+                    resultado["destino"] = reparar_gold(key, entrada)
+                    resultado["cache"] = "reparado"
+                    logging.info(f"Destino ausente na gold reparado para {key}")
+                except Exception as e:
+                    logging.error(f"Erro ao reparar '{key}': {str(e)}")
+                    resultado.update(status="erro", erro=str(e))
+        resultados.append(resultado)
+    return resultados, a_validar
+
+def _criar_pool_validacao(max_workers):
+    """
+    Cria o pool de processos da validação. Onde não há suporte a semáforos de
+    multiprocessing (ex.: Lambda, sem /dev/shm), usa um pool de threads.
+    """
+    try:
+        return ProcessPoolExecutor(max_workers=max_workers)
+    except (OSError, NotImplementedError) as e:
+        logging.warning(f"Pool de processos indisponível ({e}); usando threads para a validação.")
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+def processar_em_paralelo(keys, max_workers=MAX_WORKERS, max_io_workers=MAX_IO_WORKERS):
+    """
+    Valida e promove os arquivos em pipeline: leitura do rodapé, downloads e
+    uploads em threads, validação em processos. O tempo total fica limitado pelo maior arquivo,
+    e não pela soma de todos.
+
+    No máximo `max_workers + max_io_workers` arquivos ficam em andamento: o próximo
+    só é inspecionado quando outro termina, então os payloads baixados ocupam memória
+    proporcional aos workers, e não ao número de arquivos.
+    """
+    resultados = []
+    fila = iter(keys)
+    janela = max_workers + max_io_workers
+    with ThreadPoolExecutor(max_workers=max_io_workers) as pool_io, _criar_pool_validacao(max_workers) as pool_cpu:
+        # futuro -> (etapa, key, contexto da etapa anterior); um futuro por arquivo em andamento
+        pendentes = {pool_io.submit(inspecionar_parquet, key): ("inspecao", key, None) for key in islice(fila, janela)}
+
+        while pendentes:
+            concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                etapa, key, contexto = pendentes.pop(futuro)
+                try:
+                    valor = futuro.result()
+                except Exception as e:
+                    logging.error(f"Erro na etapa de {etapa} de '{key}': {str(e)}")
+                    anterior = contexto if etapa == "promocao" else {"key": key, "linhas": 0}
+                    resultados.append({**anterior, "status": "erro", "erro": str(e)})
+                    continue
+
+                if etapa == "inspecao":
+                    resultado = resultado_por_estatisticas(key, valor)
+                    if resultado is not None:
+                        pendentes[pool_io.submit(promover_para_gold, key, resultado, None)] = ("promocao", key, resultado)
+                    else:
+                        pendentes[pool_io.submit(baixar_parquet, key)] = ("download", key, valor["pendentes"])
+                elif etapa == "download":
+                    pendentes[pool_cpu.submit(validar_parquet, key, valor, contexto)] = ("validacao", key, None)
+                elif etapa == "validacao":
+                    resultado, saida = valor
+                    if resultado["status"] != "valido":
+                        resultados.append(resultado)
+                    else:
+                        pendentes[pool_io.submit(promover_para_gold, key, resultado, saida)] = ("promocao", key, resultado)
+                else:
+                    resultados.append({**contexto, "destino": valor})
+
+            for key in islice(fila, janela - len(pendentes)):
+                pendentes[pool_io.submit(inspecionar_parquet, key)] = ("inspecao", key, None)
+
+    return resultados
+
+def resumir_resultados(resultados):
+    resumo = {"total": len(resultados), "valido": 0, "invalido": 0, "erro": 0}
+    for resultado in resultados:
+        resumo[resultado["status"]] += 1
+    resumo["linhas"] = sum(resultado["linhas"] for resultado in resultados)
+    resumo["row_groups_pulados"] = sum(resultado.get("row_groups_pulados", 0) for resultado in resultados)
+    resumo["copiados"] = sum(1 for resultado in resultados if resultado.get("promocao") == "copia" and "destino" in resultado and "cache" not in resultado)
+    resumo["cache_hits"] = sum(1 for resultado in resultados if resultado.get("cache") == "hit")
+    resumo["reparados"] = sum(1 for resultado in resultados if resultado.get("cache") == "reparado")
+    return resumo
+
+@metrics.stage("quality_valid")
 def lambda_handler(event, context):
     logging.info(f"Evento recebido: {event}")
+    event = event or {}
+
+    arquivos = listar_arquivos_silver()
+    logging.info(f"Total de arquivos encontrados: {len(arquivos)}")
 
-    response = s3.list_objects_v2(Bucket=BUCKET_SILVER, Prefix=PREFIX_SILVER)
+    ledger = {} if event.get("ignore_ledger") else carregar_ledger()
+    destinos_gold = set(listar_arquivos(BUCKET_GOLD, PREFIX_GOLD))
+    resultados, keys = aplicar_ledger(arquivos, ledger, destinos_gold)
+    logging.info(f"Arquivos inalterados pelo ledger: {len(resultados)}; a validar: {len(keys)}")
 
-    if 'Contents' in response:
-        keys = [item['Key'] for item in response['Contents'] if item['Key'].endswith('.parquet')]
-        logging.info(f"Total de arquivos encontrados: {len(keys)}")
+    if not keys:
+        novos = []
+    elif event.get("parallel", MODO_PARALELO):
+        max_workers = int(event.get("max_workers", MAX_WORKERS))
+        novos = processar_em_paralelo(keys, max_workers, int(event.get("max_io_workers", max_workers * 4)))
+    else:
+        novos = [processar_parquet(key) for key in keys]
 
-        for key in keys:
-            processar_parquet(key)
+    novo_ledger = {key: ledger[key] for key in arquivos if key in ledger}
+    for resultado in resultados + novos:
+        registrar_no_ledger(novo_ledger, resultado, arquivos[resultado["key"]])
+    if novo_ledger != ledger:
+        salvar_ledger(novo_ledger)
 
-    logging.info("Processamento finalizado.")
+    resultados += novos
+    resumo = resumir_resultados(resultados)
+    logging.info(f"Processamento finalizado: {resumo}")
+    for status in ("valido", "invalido", "erro"):
+        metrics.count("files", resumo[status], status=status)
+    metrics.count("rows_in", resumo["linhas"])
+    metrics.count("cache_hits", resumo["cache_hits"])
 
     return {
         'statusCode': 200,
-        'body': 'Processamento concluído com sucesso.'
+        'body': 'Processamento concluído com sucesso.',
+        'resumo': resumo,
+        'resultados': resultados
     }
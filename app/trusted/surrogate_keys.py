@@ -0,0 +1,202 @@
+"""
+Dicionário persistente de chaves substitutas (surrogate keys) compartilhado
+pelos jobs da camada trusted.
+
+Os identificadores do HIOS (PlanId, StandardComponentId, IssuerId e
+ServiceAreaId) chegam como texto e são usados nos joins da camada gold. Este
+módulo atribui a cada valor um inteiro int32 estável, que nunca muda nem é
+reaproveitado, para que as queries façam joins sobre inteiros.
+
+Cada domínio é um Parquet com as colunas `valor` (texto normalizado) e `chave`
+(int32) em `s3://{BUCKET}/{PREFIX}{dominio}.parquet`. O prefixo começa com `_`,
+fora de `tb_silver`, e não é validado nem copiado para a gold.
+
+Os jobs trusted rodam em paralelo e compartilham domínios (IssuerId, por
+exemplo). Novas chaves são gravadas com escrita condicional do S3 (`IfMatch`
+com o ETag lido, ou `IfNoneMatch='*'` na criação); se outro job gravou antes,
+o dicionário é relido e as chaves que faltam são atribuídas de novo.
+
+Domínios:
+- plan: PlanId com variante (ex.: 21989AK0010001-01)
+- standard_component: StandardComponentId, e também o PlanId da Rate, que usa
+  o mesmo identificador de 14 caracteres
+- issuer: IssuerId
+- service_area: ServiceAreaId
+"""
+
+import os
+import re
+import time
+import random
+import logging
+import object_store
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import parquet_layout
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+BUCKET = os.environ.get("SURROGATE_KEYS_BUCKET", "cleaned-test-edb")
+PREFIX = os.environ.get("SURROGATE_KEYS_PREFIX", "_chaves/")
+MAX_TENTATIVAS = 8
+MAX_CHAVE = 2**31 - 1
+
+# Coluna de origem -> (coluna da chave, domínio)
+CHAVES_PADRAO: Dict[str, Tuple[str, str]] = {
+    "PlanId": ("PlanKey", "plan"),
+    "StandardComponentId": ("StandardComponentKey", "standard_component"),
+    "IssuerId": ("IssuerKey", "issuer"),
+    "ServiceAreaId": ("ServiceAreaKey", "service_area"),
+}
+
+# Na Rate, PlanId é o StandardComponentId dos demais arquivos
+CHAVES_RATE: Dict[str, Tuple[str, str]] = {
+    "PlanId": ("StandardComponentKey", "standard_component"),
+    "IssuerId": ("IssuerKey", "issuer"),
+}
+
+# Colunas de chave: gravadas como int32, fora da conversão para texto dos jobs
+KEY_COLUMNS = frozenset(coluna for coluna, _ in list(CHAVES_PADRAO.values()) + list(CHAVES_RATE.values()))
+
+# Armazenamento de objetos
+store = object_store.get_store()
+
+# Cache em processo: domínio -> (ETag, índice valor -> chave)
+_dicionarios: Dict[str, Tuple[Optional[str], pd.Series]] = {}
+
+_PADRAO_INTEIRO = re.compile(r"^[+-]?\d+\.0*$")
+
+
+def _key(dominio: str) -> str:
+    return f"{PREFIX}{dominio}.parquet"
+
+
+def normalizar(valores: pd.Series) -> pd.Series:
+    """
+    Normaliza os identificadores antes da consulta ao dicionário: remove espaços e
+    o sufixo decimal de IDs numéricos (21989.0 -> 21989). Nulos, 'nan' e 'None'
+    (como gravados pelo `astype(str)`) viram nulos.
+    """
+    texto = valores.astype("string").str.strip()
+    numericos = texto.str.match(_PADRAO_INTEIRO.pattern, na=False)
+    texto = texto.mask(numericos, texto.str.split(".", n=1).str[0])
+    return texto.mask(texto.isin(["", "nan", "None", "NaN", "<NA>"]))
+
+
+def carregar_dicionario(dominio: str) -> Tuple[Optional[str], pd.Series]:
+    """
+    Lê o dicionário de um domínio do S3.
+
+    Returns:
+    Tuple[Optional[str], pd.Series]: (ETag do objeto ou None se não existir, série valor -> chave)
+    """
+    try:
+        dados, etag = store.get_with_etag(BUCKET, _key(dominio))
+    except object_store.ObjectNotFound:
+        return None, pd.Series([], index=pd.Index([], dtype="string"), dtype="int32")
+    tabela = pq.read_table(pa.BufferReader(dados))
+    chaves = pd.Series(tabela.column("chave").to_numpy(), index=pd.Index(tabela.column("valor").to_pylist(), dtype="string"))
+    return etag, chaves
+
+
+def _gravar_dicionario(dominio: str, chaves: pd.Series, etag: Optional[str]) -> Optional[str]:
+    """Grava o dicionário condicionado ao ETag lido. Devolve o novo ETag, ou None em conflito."""
+    tabela = pa.table({
+        "valor": pa.array(chaves.index.to_numpy(dtype=object), type=pa.string()),
+        "chave": pa.array(chaves.to_numpy(), type=pa.int32()),
+    })
+    buffer = pa.BufferOutputStream()
+    pq.write_table(tabela, buffer, **parquet_layout.write_options("_chaves", tabela))
+    try:
+        return store.put(BUCKET, _key(dominio), buffer.getvalue(), if_match=etag, if_none_match=etag is None)
+    except object_store.PreconditionFailed:
+        return None
+
+
+def obter_chaves(dominio: str, valores: pd.Series) -> pd.Series:
+    """
+    Devolve o dicionário do domínio contendo todos os `valores`, atribuindo
+    chaves novas (sequenciais) aos que ainda não existem.
+
+    Args:
+    dominio (str): Nome do domínio.
+    valores (pd.Series): Valores distintos e normalizados, sem nulos.
+
+    Returns:
+    pd.Series: Série valor -> chave int32.
+
+    Raises:
+    RuntimeError: Se não conseguir gravar após MAX_TENTATIVAS conflitos ou se o domínio esgotar o int32.
+    """
+    etag, chaves = _dicionarios.get(dominio) or carregar_dicionario(dominio)
+    for tentativa in range(MAX_TENTATIVAS):
+        novos = valores[~valores.isin(chaves.index)]
+        if novos.empty:
+            _dicionarios[dominio] = (etag, chaves)
+            return chaves
+
+        inicio = int(chaves.max()) + 1 if len(chaves) else 1
+        if inicio + len(novos) - 1 > MAX_CHAVE:
+            raise RuntimeError(f"Domínio {dominio} excedeu o limite de chaves int32")
+        atualizadas = pd.concat([chaves, pd.Series(
+            range(inicio, inicio + len(novos)), index=pd.Index(novos.to_numpy(), dtype="string"), dtype="int32"
+        )])
+
+        novo_etag = _gravar_dicionario(dominio, atualizadas, etag)
+        if novo_etag is not None:
+            logger.info(f"Domínio {dominio}: {len(novos)} chaves novas (total {len(atualizadas)})")
+            _dicionarios[dominio] = (novo_etag, atualizadas)
+            return atualizadas
+
+        logger.warning(f"Conflito ao gravar o domínio {dominio} (tentativa {tentativa + 1}); relendo o dicionário")
+        time.sleep(random.uniform(0.05, 0.2) * (2 ** tentativa))
+        etag, chaves = carregar_dicionario(dominio)
+
+    raise RuntimeError(f"Não foi possível gravar o domínio {dominio} após {MAX_TENTATIVAS} tentativas")
+
+
+def distintos(valores: pd.Series, anteriores: Optional[pd.Series] = None) -> pd.Series:
+    """
+    Os valores distintos, normalizados e sem nulos, de uma coluna de
+    identificadores, somados aos `anteriores`: a entrada de `obter_chaves`
+    acumulada lote a lote.
+    """
+    novos = pd.Series(normalizar(valores).dropna().unique(), dtype="string")
+    if anteriores is None:
+        return novos
+    return pd.concat([anteriores, novos[~novos.isin(anteriores)]], ignore_index=True)
+
+
+def chaves_da_coluna(valores: pd.Series, dominio: str, chaves: Optional[pd.Series] = None) -> pd.Series:
+    """
+    Chaves substitutas (Int32, nula quando o ID é nulo) de uma coluna de
+    identificadores, atribuindo chaves novas aos valores ainda fora do domínio.
+    Com `chaves` (o dicionário já devolvido por `obter_chaves` com todos os
+    valores), só mapeia, sem consultar o domínio.
+    """
+    normalizados = normalizar(valores)
+    if chaves is None:
+        chaves = obter_chaves(dominio, pd.Series(normalizados.dropna().unique(), dtype="string"))
+    return normalizados.map(chaves).astype("Int32")
+
+
+def add_surrogate_keys(df: pd.DataFrame, colunas: Optional[Dict[str, Tuple[str, str]]] = None) -> pd.DataFrame:
+    """
+    Adiciona ao DataFrame as colunas de chave substituta (Int32, nula quando o ID é nulo).
+
+    Args:
+    df (pd.DataFrame): DataFrame com as colunas de identificadores.
+    colunas (Optional[Dict[str, Tuple[str, str]]]): Coluna de origem -> (coluna da chave, domínio).
+        Padrão: CHAVES_PADRAO. Colunas ausentes no DataFrame são ignoradas.
+
+    Returns:
+    pd.DataFrame: O mesmo DataFrame, com as colunas de chave.
+    """
+    for coluna, (coluna_chave, dominio) in (colunas or CHAVES_PADRAO).items():
+        if coluna not in df.columns:
+            continue
+        df[coluna_chave] = chaves_da_coluna(df[coluna], dominio)
+    return df
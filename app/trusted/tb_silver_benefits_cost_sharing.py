@@ -1,13 +1,9 @@
-import re
-import pandas as pd
-from datetime import datetime
 import pyarrow as pa
-import pyarrow.parquet as pq
-import hashlib
 import logging
-import boto3
+import metrics
 import traceback
-import io
+import surrogate_keys
+import transform_plan
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,7 +14,6 @@ APP_NAME = ""
 TABLE_NAME = "tb_silver_benefits_cost_sharing"
 
 # Configuração AWS
-s3_client = boto3.client('s3')
 S3_BUCKET = 'raw-test-edb'  # Substitua pelo nome do seu bucket S3
 S3_OUTPUT_BUCKET = 'cleaned-test-edb'
 INPUT_PREFIX = f'{APP_NAME}'
@@ -32,6 +27,19 @@ COLUMNS = [
     'CopayOutofNet', 'CoinsInnTier1', 'CoinsInnTier2', 'CoinsOutofNet'
 ]
 
+# Plano da tabela (`transform_plan`): lê da raw só as colunas da lista, acrescenta partição, ingestão,
+# versão e chaves substitutas, converte para texto (exceto as chaves) e grava no layout do perfil da tabela
+PLAN = (
+    transform_plan.scan(S3_BUCKET, INPUT_PREFIX, name=TABLE_NAME)
+    .select(COLUMNS)
+    .with_columns(partitionDate=transform_plan.partition_date(),
+                  ingestDate=transform_plan.ingest_date(),
+                  version=transform_plan.row_version())
+    .surrogate_keys()
+    .to_strings(exclude=surrogate_keys.KEY_COLUMNS)
+    .write(S3_OUTPUT_BUCKET, f"{OUTPUT_PREFIX}/data_{{now:%Y%m%d_%H%M%S}}.parquet", TABLE_NAME)
+)
+
 def create_table_structure():
     """
     Cria a estrutura da tabela com tipos de dados específicos para cada coluna.
@@ -71,112 +79,6 @@ def create_table_structure():
     
     return empty_table
 
-def generate_version(row, update_type='insert'):
-    """
-    Gera uma string de versão única para cada linha de dados.
-    """
-    data = ''.join(str(val) for val in row.values) + str(pd.Timestamp.now())
-    version_string = f"{update_type}_{hashlib.md5(data.encode()).hexdigest()}"
-    return version_string
-
-def process_file(s3_key):
-    """
-    Processa um único arquivo Parquet do S3.
-    """
-    logger.info(f"Processando arquivo: {s3_key}")
-    try:
-        # Extrai a data de partição do nome do arquivo
-        partition_date = re.search(r'partitionDate=(\d{8})', s3_key)
-        partition_date = partition_date.group(1) if partition_date else datetime.now().strftime("%Y%m%d")
-
-        # Lê o arquivo Parquet do S3
-        with s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)['Body'] as obj:
-            df = pd.read_parquet(io.BytesIO(obj.read()))
-
-        # Seleciona apenas as colunas especificadas
-        if COLUMNS:
-            df = df[COLUMNS]
-        
-        # Adiciona colunas adicionais
-        df['partitionDate'] = partition_date
-        df['ingestDate'] = pd.Timestamp.now()
-        df['version'] = df.apply(generate_version, axis=1)
-
-        return df
-    except Exception as e:
-        logger.error(f"Erro ao processar arquivo {s3_key}: {str(e)}")
-        return pd.DataFrame()
-
-def read_and_process_data():
-    """
-    Lê e processa todos os arquivos Parquet do S3.
-    """
-    logger.info(f"Lendo e processando dados do S3")
-
-    try:
-        # Lista todos os arquivos Parquet no bucket S3
-        paginator = s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket=S3_BUCKET, Prefix=INPUT_PREFIX)
-
-        all_files = [obj['Key'] for page in pages for obj in page['Contents'] if obj['Key'].endswith('.parquet')]
-
-        logger.info(f"Total de arquivos Parquet encontrados: {len(all_files)}")
-
-        if not all_files:
-            logger.info("Nenhum arquivo Parquet encontrado.")
-            return pd.DataFrame()
-
-        # Processa cada arquivo e concatena os resultados
-        dfs = []
-        for file in all_files:
-            df = process_file(file)
-            if not df.empty:
-                dfs.append(df)
-
-        if dfs:
-            return pd.concat(dfs, ignore_index=True)
-        else:
-            return pd.DataFrame()
-
-    except Exception as e:
-        logger.error(f"Erro ao ler e processar dados: {str(e)}")
-        logger.error(f"Traceback completo:\n{traceback.format_exc()}")
-        raise
-
-def save_as_parquet(df: pd.DataFrame):
-    """
-    Salva o DataFrame processado como um arquivo Parquet no S3.
-    """
-    if df.empty:
-        logger.info("DataFrame está vazio. Nada para salvar.")
-        return
-
-    logger.info(f"Salvando dados como Parquet no S3")
-
-    try:
-        # Converte todas as colunas para string
-        for col in df.columns:
-            df[col] = df[col].astype(str)
-
-        # Converte o DataFrame para uma tabela PyArrow
-        table = pa.Table.from_pandas(df)
-        
-        # Escreve a tabela em um buffer
-        buffer = pa.BufferOutputStream()
-        pq.write_table(table, buffer)
-
-        # Gera um nome de arquivo único
-        s3_key = f"{OUTPUT_PREFIX}/data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
-        
-        # Salva o buffer no S3
-        s3_client.put_object(Bucket=S3_OUTPUT_BUCKET, Key=s3_key, Body=buffer.getvalue().to_pybytes())
-
-        logger.info(f"Dados salvos com sucesso no S3: {s3_key}")
-
-    except Exception as e:
-        logger.error(f"Erro ao salvar dados: {str(e)}")
-        raise
-
 def main():
     """
     Função principal que orquestra todo o processo.
@@ -189,29 +91,26 @@ def main():
         empty_table = create_table_structure()
         logger.info(f"Estrutura da tabela criada: {empty_table.schema}")
 
-        # Ler e processar os dados
-        df_processed = read_and_process_data()
-        if df_processed.empty:
+        # Executar o plano: leitura, transformação e gravação, em lotes
+        logger.info(f"Plano de execução:\n{PLAN.explain()}")
+        escrita = PLAN.execute()
+        if escrita is None:
             logger.info("Nenhum dado encontrado nos arquivos de entrada.")
             return
+        logger.info(f"Dados salvos com sucesso no S3: {escrita.key}")
 
-        # Converter o DataFrame processado para uma tabela PyArrow
-        processed_table = pa.Table.from_pandas(df_processed)
-
-        # Verificar se o esquema do DataFrame processado corresponde ao esquema da tabela vazia
-        if processed_table.schema != empty_table.schema:
+        # Verificar se o esquema dos dados gravados corresponde ao esquema da tabela vazia
+        if escrita.schema != empty_table.schema:
             logger.warning("O esquema dos dados processados não corresponde à estrutura da tabela.")
             # Aqui você pode adicionar lógica adicional para lidar com diferenças de esquema
 
-        # Salvar os dados processados
-        save_as_parquet(df_processed)
-
         logger.info("Processo concluído com sucesso")
 
     except Exception as e:
         logger.error(f"Erro durante a execução: {str(e)}")
         logger.error(f"Traceback completo:\n{traceback.format_exc()}")
 
+@metrics.stage(TABLE_NAME)
 def lambda_handler(event, context):
     """
     Função handler para AWS Lambda.
@@ -229,4 +128,5 @@ def lambda_handler(event, context):
             "statusCode": 500,
             "body": f"Erro durante o processamento: {str(e)}"
         }
-lambda_handler(None, None)
\ No newline at end of file
+if __name__ == "__main__":
+    lambda_handler(None, None)
@@ -5,21 +5,31 @@ armazenando-os no Amazon S3.
 O script lê dados de áreas de serviço de duas fontes diferentes no S3, processa-os para extrair
 códigos postais, e então salva os resultados processados de volta no S3 em formato Parquet.
 
+Os arquivos são lidos e explodidos em lotes Arrow, deduplicados pelo
+`external_sort.drop_duplicates` (em disco se passarem do orçamento de memória),
+sem materializar as fontes em pandas.
+
 Requer:
 - Acesso configurado ao Amazon S3
-- Bibliotecas: boto3, pandas
+- Bibliotecas: boto3, pyarrow
 
 Uso:
 - Como função Lambda: Configurar o handler como 'script_name.lambda_handler'
 - Executar localmente: python script_name.py
 """
 
-import boto3
-import pandas as pd
-from io import BytesIO
+import object_store
 from datetime import datetime
+from itertools import chain
 import logging
 import json
+import pyarrow as pa
+import pyarrow.compute as pc
+import partition_discovery
+import metrics
+import parquet_layout
+import external_sort
+import arrow_io
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,14 +42,22 @@ BUCKET_NAME = "raw-test-edb"
 OUTPUT_BUCKET_NAME = "cleaned-test-edb"
 BRONZE_PREFIX = f""
 SILVER_PREFIX = f"{TABLE_NAME}/"
-
-# Inicializar cliente S3
-s3 = boto3.client('s3')
+SOURCE_COLUMNS = ['ServiceAreaId', 'ZipCodes']
+COLUMNS_TO_GROUP = ['ServiceAreaId', 'ZipCode']
+OUTPUT_SCHEMA = pa.schema([
+    ('ServiceAreaId', pa.large_string()),
+    ('ZipCode', pa.large_string()),
+    ('ingestDate', pa.timestamp('us')),
+    ('partitionDate', pa.large_string()),
+])
+
+# Armazenamento de objetos (S3 ou disco local)
+store = object_store.get_store()
 
 # Incremental e Gerenciamento de Partições
 def get_latest_partition(prefix):
     """
-    Obtém a partição mais recente de um prefixo específico no S3.
+    Obtém a partição mais recente de um prefixo específico no bucket de origem.
 
     Args:
     prefix (str): O prefixo do caminho no S3 para buscar partições.
@@ -50,86 +68,104 @@ def get_latest_partition(prefix):
     Raises:
     Exception: Se houver um erro ao listar objetos no S3.
     """
-    try:
-        response = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix, Delimiter='/')
-        partitions = [obj['Prefix'] for obj in response.get('CommonPrefixes', []) if obj['Prefix'].startswith(f"{prefix}partition_date=")]
-        return max(partitions).split('=')[1].rstrip('/')
-    except Exception as e:
-        logger.error(f"Erro ao obter a última partição: {str(e)}")
-        raise
+    return partition_discovery.get_latest_partition(prefix, BUCKET_NAME)
 
 # Funções de Leitura e Escrita especcíficas para a tabela 'tb_silver_zipcodes'
 def read_parquet_from_s3(path):
     """
-    Lê um arquivo Parquet do S3 e retorna como DataFrame.
+    Lê um arquivo Parquet do S3 em lotes, só com as colunas usadas.
 
     Args:
     path (str): O caminho completo do arquivo Parquet no S3.
 
     Returns:
-    pandas.DataFrame: O DataFrame lido do arquivo Parquet.
+    Iterator[pyarrow.RecordBatch]: Os lotes do arquivo.
 
     Raises:
     Exception: Se houver um erro ao ler o arquivo do S3.
     """
     try:
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=path)
-        return pd.read_parquet(BytesIO(obj['Body'].read()))
+        yield from arrow_io.iter_batches(BUCKET_NAME, path, columns=SOURCE_COLUMNS)
     except Exception as e:
         logger.error(f"Erro ao ler arquivo Parquet do S3: {str(e)}")
         raise
 
-def process_df(df):
+def process_batch(batch, now):
+    """
+    Processa um lote, explodindo a coluna ZipCodes e adicionando timestamps.
+    Como o `str.split(',').explode()` do pandas, uma linha sem ZipCodes fica
+    com ZipCode nulo.
+
+    Args:
+    batch (pyarrow.RecordBatch): O lote com ServiceAreaId e ZipCodes.
+    now (datetime): O instante do processamento.
+
+    Returns:
+    pyarrow.RecordBatch: O lote processado, no OUTPUT_SCHEMA.
+    """
+    zipcodes = batch.column('ZipCodes').cast(pa.large_string())
+    listas = pc.split_pattern(pc.fill_null(zipcodes, ""), ",")
+    linhas = pc.list_parent_indices(listas)
+    zipcode = pc.if_else(pc.take(pc.is_null(zipcodes), linhas), pa.scalar(None, pa.large_string()), pc.list_flatten(listas))
+    return pa.RecordBatch.from_arrays([
+        pc.take(batch.column('ServiceAreaId').cast(pa.large_string()), linhas),
+        zipcode,
+        pa.repeat(pa.scalar(now, pa.timestamp('us')), len(linhas)),
+        pa.repeat(pa.scalar(now.strftime('%Y%m%d'), pa.large_string()), len(linhas)),
+    ], schema=OUTPUT_SCHEMA)
+
+def process_batches(batches, source):
     """
-    Processa o DataFrame, explodindo a coluna ZipCodes e adicionando timestamps.
+    Processa os lotes de uma fonte, contando as linhas lidas.
 
     Args:
-    df (pandas.DataFrame): O DataFrame a ser processado.
+    batches (Iterator[pyarrow.RecordBatch]): Os lotes lidos da fonte.
+    source (str): O nome da fonte, para as métricas.
 
     Returns:
-    pandas.DataFrame: O DataFrame processado.
+    Iterator[pyarrow.RecordBatch]: Os lotes processados.
 
     Raises:
     Exception: Se houver um erro durante o processamento.
     """
+    now = datetime.now()
     try:
-        df_exploded = df.assign(ZipCode=df['ZipCodes'].str.split(',')).explode('ZipCode')
-        df_exploded = df_exploded[['ServiceAreaId', 'ZipCode']]
-        df_exploded['ingestDate'] = datetime.now()
-        df_exploded['partitionDate'] = datetime.now().strftime('%Y%m%d')
-        return df_exploded
+        for batch in batches:
+            metrics.count("rows_in", batch.num_rows, table=source)
+            yield process_batch(batch, now)
     except Exception as e:
-        logger.error(f"Erro ao processar DataFrame: {str(e)}")
+        logger.error(f"Erro ao processar {source}: {str(e)}")
         raise
 
-def save_parquet_to_s3(df, path):
+def save_parquet_to_s3(table, path):
     """
-    Salva um DataFrame como arquivo Parquet no S3.
+    Salva uma tabela Arrow como arquivo Parquet no S3.
 
     Args:
-    df (pandas.DataFrame): O DataFrame a ser salvo.
+    table (pyarrow.Table): A tabela a ser salva.
     path (str): O caminho completo no S3 onde o arquivo será salvo.
 
     Raises:
     Exception: Se houver um erro ao salvar o arquivo no S3.
     """
     try:
-        buffer = BytesIO()
-        df.to_parquet(buffer, index=False)
-        s3.put_object(Bucket=OUTPUT_BUCKET_NAME, Key=path, Body=buffer.getvalue())
+        buffer = pa.BufferOutputStream()
+        parquet_layout.write_table(table, buffer, TABLE_NAME)
+        store.put(OUTPUT_BUCKET_NAME, path, buffer.getvalue())
     except Exception as e:
         logger.error(f"Erro ao salvar arquivo Parquet no S3: {str(e)}")
         raise
 
+@metrics.timed
 def main():
     """
     Função principal que orquestra o processamento dos dados.
 
     Esta função realiza as seguintes etapas:
     1. Obtém as partições mais recentes dos dados de origem.
-    2. Lê os dados do S3.
-    3. Processa os DataFrames.
-    4. Une os DataFrames processados.
+    2. Lê os dados do S3 em lotes.
+    3. Processa os lotes.
+    4. Une os lotes processados das duas fontes.
     5. Agrupa e seleciona os dados mais recentes.
     6. Salva os resultados de volta no S3.
 
@@ -141,34 +177,38 @@ def main():
         latest_partition1 = get_latest_partition(f"{BRONZE_PREFIX}Service_Area/")
         latest_partition2 = get_latest_partition(f"{BRONZE_PREFIX}ServiceArea/")
 
-        # Ler apenas as partições mais recentes
-        df1 = read_parquet_from_s3(f"{BRONZE_PREFIX}Service_Area/partition_date={latest_partition1}/Service_Area_1.parquet")
-        df2 = read_parquet_from_s3(f"{BRONZE_PREFIX}ServiceArea/partition_date={latest_partition2}/ServiceArea_1.parquet")
+        # Ler apenas as partições mais recentes, em lotes, processando cada lote ao ler
+        batches1 = process_batches(read_parquet_from_s3(
+            f"{BRONZE_PREFIX}Service_Area/partition_date={latest_partition1}/Service_Area_1.parquet"), "Service_Area")
+        batches2 = process_batches(read_parquet_from_s3(
+            f"{BRONZE_PREFIX}ServiceArea/partition_date={latest_partition2}/ServiceArea_1.parquet"), "ServiceArea")
 
-        # Processar ambos os DataFrames
-        df1_exploded = process_df(df1)
-        df2_exploded = process_df(df2)
-
-        # Realizar o union dos dois DataFrames processados
-        united_df = pd.concat([df1_exploded, df2_exploded], ignore_index=True)
-
-        # Agrupar por todas as colunas exceto ingestDate e partitionDate, e selecionar o partitionDate mais recente
-        columns_to_group = [c for c in united_df.columns if c not in ['ingestDate', 'partitionDate']]
-        latest_df = united_df.sort_values('partitionDate', ascending=False).drop_duplicates(subset=columns_to_group)
+        # Realizar o union das duas fontes, agrupando por todas as colunas exceto ingestDate e partitionDate
+        # e selecionando o partitionDate mais recente (em disco se passar do orçamento de memória)
+        latest = pa.Table.from_batches(list(external_sort.drop_duplicates(
+            chain(batches1, batches2), subset=COLUMNS_TO_GROUP, order_by=[('partitionDate', 'descending')],
+            name=TABLE_NAME)), schema=OUTPUT_SCHEMA)
+        partition_dates = pc.unique(latest['partitionDate']).to_pylist()
 
         # Iterar sobre cada data de partição única
-        for partition_date in latest_df['partitionDate'].unique():
-            df_partition = latest_df[latest_df['partitionDate'] == partition_date]
+        for partition_date in partition_dates:
+            partition = latest.filter(pc.equal(latest['partitionDate'], partition_date))
             partition_path = f"{SILVER_PREFIX}partitionDate={partition_date}/data_{partition_date}.parquet"
-            save_parquet_to_s3(df_partition, partition_path)
+            save_parquet_to_s3(partition, partition_path)
+            metrics.count("rows_out", partition.num_rows, table=TABLE_NAME)
+
+        # Atualizar o ponteiro para que os leitores não precisem listar o prefixo
+        if partition_dates:
+            partition_discovery.write_latest_pointer(SILVER_PREFIX, OUTPUT_BUCKET_NAME, max(partition_dates))
 
-        logger.info(f"Processamento concluído. Número total de linhas mais recentes: {len(latest_df)}")
-        logger.info(f"PartitionDates únicas: {latest_df['partitionDate'].unique()}")
+        logger.info(f"Processamento concluído. Número total de linhas mais recentes: {latest.num_rows}")
+        logger.info(f"PartitionDates únicas: {partition_dates}")
 
     except Exception as e:
         logger.error(f"Erro durante a execução: {str(e)}")
         raise
 
+@metrics.stage(TABLE_NAME)
 def lambda_handler(event, context):
     """
     Handler da função Lambda.
@@ -0,0 +1,709 @@
+"""
+Plano de transformação preguiçoso, em Arrow, para os jobs trusted.
+
+Os jobs tb_silver_* eram scripts pandas executados passo a passo: liam cada
+arquivo inteiro, selecionavam as colunas, acrescentavam as colunas de
+metadados, convertiam tudo para texto e gravavam. Aqui cada tabela é declarada
+como um `Plan`: uma fonte (`scan`) e uma lista de passos, que só rodam em
+`execute` (ou `batches`/`collect`):
+
+    PLAN = (transform_plan.scan("raw-test-edb", "Rate/", name="tb_silver_rate")
+            .select(COLUMNS)
+            .filter([("BusinessYear", ">=", 2014)])
+            .with_columns(partitionDate=transform_plan.partition_date(),
+                          ingestDate=transform_plan.ingest_date(),
+                          version=transform_plan.row_version())
+            .surrogate_keys(surrogate_keys.CHAVES_RATE)
+            .to_strings(exclude=surrogate_keys.KEY_COLUMNS)
+            .write("cleaned-test-edb", "tb_silver_rate/data_{now:%Y%m%d_%H%M%S}.parquet", "tb_silver_rate"))
+    escrita = PLAN.execute()
+
+Antes de rodar, o plano é otimizado (`optimized`, visível em `explain`):
+- predicados: os filtros sobre colunas que nenhum passo anterior altera
+  descem para o scan, que descarta row groups pelas estatísticas do Parquet e
+  filtra as linhas na decodificação
+- projeção: um `select` logo depois do scan vira a lista de colunas do scan,
+  e as colunas que os passos seguintes removem ou sobrescrevem sem ler não são
+  decodificadas
+
+Os dados passam pelos passos em lotes (RecordBatch) de até BATCH_ROWS linhas,
+um arquivo de origem por vez, lidos do buffer do objeto (`get_buffer`). Só
+acumulam dados o `distinct` (com memória limitada, pelo `external_sort`) e o
+lado direito do `join` (uma tabela pequena, materializada uma vez). As chaves
+substitutas guardam os lotes em disco (Arrow IPC) enquanto coletam os IDs
+distintos de cada domínio, e consultam o dicionário uma vez por domínio.
+
+A escrita também é em lotes: ordenados pelas chaves `cluster_by` do perfil de
+`parquet_layout` no `external_sort` (runs em disco acima do orçamento), vão
+para um `ParquetWriter` sobre um arquivo temporário, enviado com `upload`
+(multipart no S3). Os Bloom filters são dimensionados pelos valores distintos
+contados no caminho.
+
+Arquivos sem alguma das colunas do `select` são ignorados com aviso, como os
+jobs faziam ao falhar na leitura (a benefits lê todos os arquivos da raw).
+Os tipos dos demais são unificados antes de qualquer passo, como no `concat`
+do pandas: a raw grava um arquivo por chunk, com os tipos inferidos em cada um,
+e uma coluna toda nula em um chunk chega como `null` ali e texto nos outros.
+As colunas ausentes em um arquivo vêm nulas.
+
+Configurações, por variáveis de ambiente:
+- TRANSFORM_BATCH_ROWS: linhas por lote lido do Parquet (padrão 65536)
+"""
+
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import contextlib
+from datetime import datetime
+from itertools import chain
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import object_store
+import partition_discovery
+import surrogate_keys
+import external_sort
+import parquet_layout
+import parquet_index
+import clustering
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configurações
+BATCH_ROWS = int(os.environ.get("TRANSFORM_BATCH_ROWS", str(64 * 1024)))
+FOOTER_READ_BYTES = 64 * 1024   # leitura inicial do final do arquivo: cobre o rodapé Parquet na maioria dos casos
+PARTITION_DATE_PATTERN = re.compile(r'partitionDate=(\d{8})')
+JOIN_TYPES = {"inner": "inner", "left": "left outer"}
+
+Predicate = List[Tuple[str, str, object]]   # conjunção de (coluna, operador, valor), como nos filtros do pyarrow
+
+
+class Contexto(NamedTuple):
+    """O que uma derivação sabe além do lote: arquivo de origem, instante da execução e posição da primeira linha."""
+    key: Optional[str]
+    now: datetime
+    row: int
+
+
+class Derivacao(NamedTuple):
+    """
+    Coluna derivada: `funcao(lote, contexto)` devolve um array ou um valor
+    único (repetido em todas as linhas). `columns` são as colunas que ela lê;
+    None quando lê todas as presentes.
+    """
+    funcao: Callable[[pa.RecordBatch, Contexto], object]
+    columns: Optional[Tuple[str, ...]] = ()
+    descricao: str = "derivada"
+
+
+class Escrita(NamedTuple):
+    """Resultado de `Plan.execute`."""
+    bucket: str
+    key: str
+    rows: int
+    schema: pa.Schema
+
+
+class _Lote(NamedTuple):
+    """Um lote e seu arquivo de origem; `preenchidas` são as colunas que o arquivo não tinha (nulas)."""
+    batch: pa.RecordBatch
+    key: Optional[str]
+    preenchidas: frozenset = frozenset()
+
+
+class _Uso(NamedTuple):
+    """Colunas que o resto do plano lê: `colunas` (None: todas) menos `excluidas`."""
+    colunas: Optional[frozenset] = None
+    excluidas: frozenset = frozenset()
+
+    def mais(self, colunas) -> "_Uso":
+        if self.colunas is None:
+            return _Uso(None, self.excluidas - frozenset(colunas))
+        return _Uso(self.colunas | frozenset(colunas))
+
+    def menos(self, colunas) -> "_Uso":
+        if self.colunas is None:
+            return _Uso(None, self.excluidas | frozenset(colunas))
+        return _Uso(self.colunas - frozenset(colunas))
+
+    def inclui(self, coluna: str) -> bool:
+        return coluna not in self.excluidas if self.colunas is None else coluna in self.colunas
+
+
+class _Execucao(NamedTuple):
+    store: object
+    now: datetime
+    name: str
+
+
+# ========== DERIVAÇÕES ==========
+def literal(valor) -> Derivacao:
+    """O mesmo valor em todas as linhas."""
+    return Derivacao(lambda batch, contexto: valor, (), repr(valor))
+
+
+def partition_date() -> Derivacao:
+    """A data da partição no nome do arquivo de origem (partitionDate=AAAAMMDD), ou a data da execução."""
+    def valor(batch: pa.RecordBatch, contexto: Contexto) -> str:
+        achado = PARTITION_DATE_PATTERN.search(contexto.key or "")
+        return achado.group(1) if achado else contexto.now.strftime("%Y%m%d")
+    return Derivacao(valor, (), "data da partição")
+
+
+def execution_date() -> Derivacao:
+    """A data da execução (AAAAMMDD)."""
+    return Derivacao(lambda batch, contexto: contexto.now.strftime("%Y%m%d"), (), "data da execução")
+
+
+def ingest_date() -> Derivacao:
+    """O instante da execução, igual em todas as linhas e arquivos."""
+    return Derivacao(lambda batch, contexto: contexto.now, (), "instante da execução")
+
+
+def row_version(update_type: str = 'insert') -> Derivacao:
+    """
+    Versão única de cada linha: `{update_type}_` + MD5 dos valores da linha,
+    do instante da execução e da posição da linha.
+    """
+    def versoes(batch: pa.RecordBatch, contexto: Contexto) -> pa.Array:
+        textos = [pc.fill_null(pc.cast(coluna, pa.large_string()), "None") for coluna in batch.columns]
+        linhas = pc.binary_join_element_wise(*textos, _VAZIO).to_pylist() if textos else [""] * batch.num_rows
+        return pa.array([
+            f"{update_type}_{hashlib.md5(f'{linha}{contexto.now}{contexto.row + i}'.encode()).hexdigest()}"
+            for i, linha in enumerate(linhas)
+        ], type=pa.large_string())
+    return Derivacao(versoes, None, f"versão ({update_type})")
+
+
+_VAZIO = pa.scalar("", pa.large_string())
+
+
+def _repetir(valor, linhas: int) -> pa.Array:
+    if isinstance(valor, (pa.Array, pa.ChunkedArray)):
+        return valor
+    if isinstance(valor, str):
+        return pa.repeat(pa.scalar(valor, pa.large_string()), linhas)
+    if isinstance(valor, datetime):
+        return pa.repeat(pa.scalar(valor, pa.timestamp('us')), linhas)
+    return pa.repeat(pa.scalar(valor), linhas)
+
+
+def _texto(coluna: pa.Array) -> pa.Array:
+    """A coluna como texto, com a formatação do `astype(str)` do pandas usada até aqui (1.0 -> '1.0', True -> 'True')."""
+    if pa.types.is_boolean(coluna.type):
+        return pc.if_else(coluna, pa.scalar("True", pa.large_string()), pa.scalar("False", pa.large_string()))
+    texto = pc.cast(coluna, pa.large_string())
+    if pa.types.is_floating(coluna.type):
+        inteiros = pc.match_substring_regex(texto, r"^-?\d+$")
+        texto = pc.if_else(inteiros, pc.binary_join_element_wise(texto, pa.scalar(".0", pa.large_string()), _VAZIO), texto)
+    elif pa.types.is_timestamp(coluna.type):
+        texto = pc.replace_substring_regex(texto, r"\.0+$", "")
+    return texto
+
+
+def _set_column(batch: pa.RecordBatch, nome: str, valores: pa.Array) -> pa.RecordBatch:
+    if nome in batch.schema.names:
+        return batch.set_column(batch.schema.get_field_index(nome), nome, valores)
+    return batch.append_column(nome, valores)
+
+
+def _conformar(batch: pa.RecordBatch, esquema: pa.Schema) -> pa.RecordBatch:
+    """O lote no schema dado: os lotes que vão para um mesmo arquivo precisam de um schema só."""
+    return batch if batch.schema.equals(esquema) else batch.cast(esquema)
+
+
+def _contando_distintos(batches: Iterator[pa.RecordBatch], colunas: Sequence[str],
+                        unicos: Dict[str, pa.Array]) -> Iterator[pa.RecordBatch]:
+    """Os mesmos lotes, acumulando em `unicos` os valores distintos de cada coluna (para os Bloom filters)."""
+    for batch in batches:
+        for coluna in colunas:
+            valores = batch.column(coluna)
+            unicos[coluna] = pc.unique(pa.concat_arrays([unicos[coluna], valores]) if coluna in unicos else valores)
+        yield batch
+
+
+def _esquema(store, bucket: str, key: str) -> pa.Schema:
+    """Schema Arrow do arquivo, lido só do rodapé Parquet (GETs por faixa de bytes)."""
+    cauda = store.get_range(bucket, key, -FOOTER_READ_BYTES)
+    tamanho = int.from_bytes(cauda[-8:-4], "little") + 8
+    if tamanho > len(cauda):
+        cauda = store.get_range(bucket, key, -tamanho)
+    return pq.read_schema(pa.BufferReader(cauda[-tamanho:]))
+
+
+# ========== PASSOS ==========
+class Scan(NamedTuple):
+    """Arquivos Parquet sob os prefixos (ou só na partição mais recente de cada um)."""
+    bucket: str
+    prefixes: Tuple[str, ...]
+    latest_partition: bool = False
+    name: str = ""
+    columns: Optional[Tuple[str, ...]] = None
+    filter: Optional[Predicate] = None
+    read: Optional[_Uso] = None
+
+    def descricao(self) -> str:
+        partes = [f"scan {self.bucket}:{','.join(self.prefixes) or '/'}"
+                  + (" (partição mais recente)" if self.latest_partition else "")]
+        if self.columns is not None:
+            partes.append(f"colunas={list(self.columns)}")
+        if self.read is not None and self.read.colunas is None and self.read.excluidas:
+            partes.append(f"sem ler={sorted(self.read.excluidas)}")
+        elif self.read is not None and self.columns is not None:
+            ignoradas = [coluna for coluna in self.columns if not self.read.inclui(coluna)]
+            if ignoradas:
+                partes.append(f"sem ler={ignoradas}")
+        if self.filter:
+            partes.append(f"filtro={pq.filters_to_expression(self.filter)}")
+        return " ".join(partes)
+
+    def keys(self, store) -> List[str]:
+        keys = []
+        for prefix in self.prefixes:
+            bases = [prefix]
+            if self.latest_partition:
+                ultima = partition_discovery.get_latest_partition(prefix, self.bucket)
+                bases = [f"{prefix}{chave}={ultima}/" for chave in partition_discovery.PARTITION_KEYS]
+            keys += sorted(obj.key for base in bases for obj in store.list(self.bucket, base)
+                           if obj.key.endswith('.parquet'))
+        return keys
+
+    def esquemas(self, store) -> Dict[str, pa.Schema]:
+        """Schema de cada arquivo a ler, só com as colunas lidas; ignora os arquivos sem as colunas do scan."""
+        uso = self.read or _Uso()
+        esquemas = {}
+        for key in self.keys(store):
+            esquema = _esquema(store, self.bucket, key)
+            faltando = [coluna for coluna in self.columns or () if coluna not in esquema.names]
+            if faltando:
+                logger.warning(f"Arquivo {key} sem as colunas {faltando}; ignorado")
+                continue
+            esquemas[key] = pa.schema([campo for campo in esquema if uso.inclui(campo.name)
+                                       and (self.columns is None or campo.name in self.columns)])
+        return esquemas
+
+    def lotes(self, execucao: _Execucao) -> Iterator[_Lote]:
+        esquemas = self.esquemas(execucao.store)
+        if not esquemas:
+            return
+        # Todos os lotes saem no mesmo schema: null -> texto, int -> double, colunas ausentes nulas
+        unificado = pa.unify_schemas(list(esquemas.values()), promote_options="permissive")
+        uso = self.read or _Uso()
+        colunas = [coluna for coluna in (self.columns or unificado.names) if uso.inclui(coluna)]
+        expressao = pq.filters_to_expression(self.filter) if self.filter else None
+        formato = ds.ParquetFileFormat()
+        for key, esquema in esquemas.items():
+            fragmento = formato.make_fragment(pa.BufferReader(execucao.store.get_buffer(self.bucket, key)))
+            metrics.count("rows_in", fragmento.metadata.num_rows, table=self.name or key.split('/')[0])
+
+            if expressao is not None:
+                total = fragmento.num_row_groups
+                fragmento = fragmento.subset(filter=expressao, schema=unificado)
+                metrics.count("row_groups_pruned", total - fragmento.num_row_groups, table=self.name or key)
+            preenchidas = frozenset(colunas) - frozenset(esquema.names)
+            for batch in fragmento.to_batches(schema=unificado, columns=colunas, filter=expressao,
+                                              batch_size=BATCH_ROWS, use_threads=False):
+                if batch.num_rows:
+                    yield _Lote(batch, key, preenchidas)
+
+
+class Select(NamedTuple):
+    columns: Tuple[str, ...]
+
+    def descricao(self) -> str:
+        return f"select {list(self.columns)}"
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return _Uso(frozenset(self.columns))
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        ignorados = set()
+        for lote in lotes:
+            faltando = [coluna for coluna in self.columns
+                        if coluna not in lote.batch.schema.names or coluna in lote.preenchidas]
+            if not faltando:
+                yield lote._replace(batch=lote.batch.select(list(self.columns)))
+            elif lote.key not in ignorados:
+                ignorados.add(lote.key)
+                logger.warning(f"Arquivo {lote.key} sem as colunas {faltando}; ignorado")
+
+
+class Drop(NamedTuple):
+    columns: Tuple[str, ...]
+
+    def descricao(self) -> str:
+        return f"drop {list(self.columns)}"
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois.menos(self.columns)
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        for lote in lotes:
+            presentes = [coluna for coluna in self.columns if coluna in lote.batch.schema.names]
+            yield lote._replace(batch=lote.batch.drop_columns(presentes)) if presentes else lote
+
+
+class Filter(NamedTuple):
+    predicate: Predicate
+
+    def descricao(self) -> str:
+        return f"filter {pq.filters_to_expression(self.predicate)}"
+
+    def colunas(self) -> frozenset:
+        return frozenset(coluna for coluna, _, _ in self.predicate)
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois.mais(self.colunas())
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        expressao = pq.filters_to_expression(self.predicate)
+        for lote in lotes:
+            batch = lote.batch.filter(expressao)
+            if batch.num_rows:
+                yield lote._replace(batch=batch)
+
+
+class WithColumns(NamedTuple):
+    """Colunas derivadas, calculadas em ordem: cada uma vê as anteriores."""
+    derivacoes: Tuple[Tuple[str, Derivacao], ...]
+
+    def descricao(self) -> str:
+        return "with_columns " + ", ".join(f"{nome}={derivacao.descricao}" for nome, derivacao in self.derivacoes)
+
+    def alteradas(self) -> frozenset:
+        return frozenset(nome for nome, _ in self.derivacoes)
+
+    def uso(self, depois: _Uso) -> _Uso:
+        for nome, derivacao in reversed(self.derivacoes):
+            depois = _Uso() if derivacao.columns is None else depois.menos([nome]).mais(derivacao.columns)
+        return depois
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        linha = 0
+        for lote in lotes:
+            batch, contexto = lote.batch, Contexto(lote.key, execucao.now, linha)
+            for nome, derivacao in self.derivacoes:
+                batch = _set_column(batch, nome, _repetir(derivacao.funcao(batch, contexto), batch.num_rows))
+            linha += batch.num_rows
+            yield lote._replace(batch=batch, preenchidas=lote.preenchidas - self.alteradas())
+
+
+class Cast(NamedTuple):
+    types: Tuple[Tuple[str, pa.DataType], ...]
+
+    def descricao(self) -> str:
+        return "cast " + ", ".join(f"{nome}:{tipo}" for nome, tipo in self.types)
+
+    def alteradas(self) -> frozenset:
+        return frozenset(nome for nome, _ in self.types)
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        for lote in lotes:
+            batch = lote.batch
+            for nome, tipo in self.types:
+                if nome in batch.schema.names:
+                    batch = _set_column(batch, nome, pc.cast(batch.column(nome), tipo))
+            yield lote._replace(batch=batch)
+
+
+class ToStrings(NamedTuple):
+    """Todas as colunas como texto, exceto `exclude` (as chaves substitutas, int32)."""
+    exclude: frozenset
+
+    def descricao(self) -> str:
+        return f"to_strings exceto {sorted(self.exclude)}"
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        for lote in lotes:
+            batch = lote.batch
+            for nome in batch.schema.names:
+                if nome not in self.exclude and not pa.types.is_large_string(batch.schema.field(nome).type):
+                    batch = _set_column(batch, nome, _texto(batch.column(nome)))
+            yield lote._replace(batch=batch)
+
+
+class SurrogateKeys(NamedTuple):
+    """As chaves substitutas de `surrogate_keys` (coluna de origem -> (coluna da chave, domínio))."""
+    colunas: Tuple[Tuple[str, Tuple[str, str]], ...]
+
+    def descricao(self) -> str:
+        return "surrogate_keys " + ", ".join(f"{coluna}->{chave}" for coluna, (chave, _) in self.colunas)
+
+    def alteradas(self) -> frozenset:
+        return frozenset(chave for _, (chave, _) in self.colunas)
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois.menos(self.alteradas()).mais(coluna for coluna, _ in self.colunas)
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        # Os lotes esperam em disco enquanto os IDs distintos são coletados: depois, uma consulta
+        # ao dicionário por domínio, que grava as chaves novas uma vez, e não a cada lote
+        esquema, presentes, distintos, origens = None, [], {}, []
+        with tempfile.TemporaryDirectory(prefix="surrogate_keys_", dir=external_sort.SPILL_DIR) as diretorio:
+            caminho = os.path.join(diretorio, "lotes.arrow")
+            with contextlib.ExitStack() as pilha:
+                for lote in lotes:
+                    if esquema is None:
+                        esquema = lote.batch.schema
+                        presentes = [(coluna, chave) for coluna, chave in self.colunas if coluna in esquema.names]
+                        escritor = pilha.enter_context(pa.ipc.new_file(caminho, esquema))
+                    batch = _conformar(lote.batch, esquema)
+                    for coluna, (_, dominio) in presentes:
+                        distintos[dominio] = surrogate_keys.distintos(batch.column(coluna).to_pandas(),
+                                                                      distintos.get(dominio))
+                    escritor.write_batch(batch)
+                    origens.append((lote.key, lote.preenchidas))
+            if esquema is None:
+                return
+
+            chaves = {dominio: surrogate_keys.obter_chaves(dominio, valores) for dominio, valores in distintos.items()}
+            with pa.memory_map(caminho, "r") as origem:
+                leitor = pa.ipc.open_file(origem)
+                for indice, (key, preenchidas) in enumerate(origens):
+                    batch = leitor.get_batch(indice)
+                    for coluna, (coluna_chave, dominio) in presentes:
+                        valores = surrogate_keys.chaves_da_coluna(batch.column(coluna).to_pandas(), dominio,
+                                                                  chaves[dominio])
+                        batch = _set_column(batch, coluna_chave, pa.array(valores, type=pa.int32()))
+                    yield _Lote(batch, key, preenchidas)
+
+
+class Distinct(NamedTuple):
+    """Uma linha por valor de `subset` (padrão: todas as colunas), pelo `external_sort.drop_duplicates`."""
+    subset: Optional[Tuple[str, ...]]
+    keep: str
+
+    def descricao(self) -> str:
+        return f"distinct {list(self.subset) if self.subset else 'todas as colunas'} keep={self.keep}"
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois.mais(self.subset) if self.subset else _Uso()
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        batches = (lote.batch for lote in lotes)
+        for batch in external_sort.drop_duplicates(batches, self.subset, self.keep, name=execucao.name,
+                                                   output_rows=BATCH_ROWS):
+            yield _Lote(batch, None)
+
+
+class Join(NamedTuple):
+    """Join com outro plano, materializado uma vez como tabela (o lado menor)."""
+    right: "Plan"
+    on: Tuple[str, ...]
+    how: str
+
+    def descricao(self) -> str:
+        direita = "; ".join(passo.descricao() for passo in self.right.optimized().passos())
+        return f"join {self.how} em {list(self.on)} com [{direita}]"
+
+    def uso(self, depois: _Uso) -> _Uso:
+        return depois.mais(self.on)
+
+    def aplicar(self, lotes: Iterator[_Lote], execucao: _Execucao) -> Iterator[_Lote]:
+        direita = None
+        for lote in lotes:
+            if direita is None:
+                direita = self.right._tabela(execucao)
+            tabela = pa.Table.from_batches([lote.batch]).join(direita, keys=list(self.on),
+                                                              join_type=JOIN_TYPES[self.how], use_threads=False)
+            for batch in tabela.combine_chunks().to_batches():
+                yield lote._replace(batch=batch)
+
+
+class Write(NamedTuple):
+    """Grava o resultado como um objeto Parquet, no layout do perfil da tabela."""
+    bucket: str
+    key: str
+    table: str
+
+    def descricao(self) -> str:
+        return f"write {self.bucket}:{self.key} (perfil {self.table})"
+
+
+Passo = Union[Select, Drop, Filter, WithColumns, Cast, ToStrings, SurrogateKeys, Distinct, Join]
+
+
+# ========== PLANO ==========
+class Plan:
+    """Um scan seguido de passos e, opcionalmente, da escrita. Cada método devolve um plano novo."""
+
+    def __init__(self, source: Scan, steps: Tuple[Passo, ...] = (), sink: Optional[Write] = None):
+        self.source = source
+        self.steps = steps
+        self.sink = sink
+
+    def _com(self, passo: Passo) -> "Plan":
+        if self.sink is not None:
+            raise ValueError("O plano já termina na escrita")
+        return Plan(self.source, self.steps + (passo,))
+
+    def select(self, columns: Sequence[str]) -> "Plan":
+        return self._com(Select(tuple(columns)))
+
+    def drop(self, columns: Sequence[str]) -> "Plan":
+        return self._com(Drop(tuple(columns)))
+
+    def filter(self, predicate: Predicate) -> "Plan":
+        return self._com(Filter(list(predicate)))
+
+    def with_columns(self, **derivacoes: Union[Derivacao, object]) -> "Plan":
+        return self._com(WithColumns(tuple(
+            (nome, derivacao if isinstance(derivacao, Derivacao) else literal(derivacao))
+            for nome, derivacao in derivacoes.items()
+        )))
+
+    def cast(self, types: Dict[str, pa.DataType]) -> "Plan":
+        return self._com(Cast(tuple(types.items())))
+
+    def to_strings(self, exclude: Sequence[str] = ()) -> "Plan":
+        return self._com(ToStrings(frozenset(exclude)))
+
+    def surrogate_keys(self, colunas: Optional[Dict[str, Tuple[str, str]]] = None) -> "Plan":
+        return self._com(SurrogateKeys(tuple((colunas or surrogate_keys.CHAVES_PADRAO).items())))
+
+    def distinct(self, subset: Optional[Sequence[str]] = None, keep: str = "first") -> "Plan":
+        return self._com(Distinct(tuple(subset) if subset else None, keep))
+
+    def join(self, right: "Plan", on: Union[str, Sequence[str]], how: str = "inner") -> "Plan":
+        if how not in JOIN_TYPES:
+            raise ValueError(f"Tipo de join desconhecido: {how} (use {list(JOIN_TYPES)})")
+        return self._com(Join(right, (on,) if isinstance(on, str) else tuple(on), how))
+
+    def write(self, bucket: str, key: str, table: str) -> "Plan":
+        """
+        Termina o plano gravando em `bucket`/`key`; `key` aceita {now} (instante
+        da execução, com formato) e {partition} (data da execução, AAAAMMDD).
+        """
+        if self.sink is not None:
+            raise ValueError("O plano já termina na escrita")
+        return Plan(self.source, self.steps, Write(bucket, key, table))
+
+    # ---------- otimização ----------
+    def optimized(self) -> "Plan":
+        """O plano com filtros e projeção empurrados para o scan e as colunas não lidas marcadas."""
+        source, passos, alteradas, barreira = self.source, [], set(), False
+        for passo in self.steps:
+            if isinstance(passo, Filter) and not barreira and not passo.colunas() & alteradas:
+                source = source._replace(filter=(source.filter or []) + passo.predicate)
+                continue
+            passos.append(passo)
+            if isinstance(passo, (Distinct, Join, ToStrings)):
+                barreira = True
+            elif hasattr(passo, "alteradas"):
+                alteradas |= passo.alteradas()
+
+        if passos and isinstance(passos[0], Select) and source.columns is None:
+            source = source._replace(columns=passos.pop(0).columns)
+
+        uso = _Uso()
+        for passo in reversed(passos):
+            uso = passo.uso(uso)
+        return Plan(source._replace(read=uso), tuple(passos), self.sink)
+
+    def passos(self) -> List:
+        return [self.source, *self.steps] + ([self.sink] if self.sink else [])
+
+    def explain(self) -> str:
+        """O plano otimizado, um passo por linha."""
+        return "\n".join(passo.descricao() for passo in self.optimized().passos())
+
+    # ---------- execução ----------
+    def _lotes(self, execucao: _Execucao) -> Iterator[_Lote]:
+        lotes = self.source.lotes(execucao)
+        for passo in self.steps:
+            lotes = passo.aplicar(lotes, execucao)
+        return lotes
+
+    def _tabela(self, execucao: _Execucao, optimize: bool = True) -> Optional[pa.Table]:
+        plano = self.optimized() if optimize else self
+        tabelas = [pa.Table.from_batches([lote.batch]) for lote in plano._lotes(execucao)]
+        if not tabelas:
+            return None
+        return pa.concat_tables(tabelas, promote_options="permissive")
+
+    def _execucao(self, store=None) -> _Execucao:
+        nome = self.sink.table if self.sink else self.source.name
+        return _Execucao(store or object_store.get_store(), datetime.now(), nome or "transform_plan")
+
+    def batches(self, store=None, optimize: bool = True) -> Iterator[pa.RecordBatch]:
+        """Os lotes do resultado, sem a escrita."""
+        plano = self.optimized() if optimize else self
+        for lote in plano._lotes(self._execucao(store)):
+            yield lote.batch
+
+    def collect(self, store=None, optimize: bool = True) -> Optional[pa.Table]:
+        """O resultado inteiro como tabela (None se vazio), sem a escrita."""
+        return self._tabela(self._execucao(store), optimize)
+
+    def execute(self, store=None, optimize: bool = True) -> Optional[Escrita]:
+        """
+        Roda o plano e grava o resultado. Sem linhas, não grava nada.
+
+        Returns:
+        Optional[Escrita]: O objeto gravado, com linhas e schema, ou None se não houve dados.
+        """
+        if self.sink is None:
+            raise ValueError("O plano não termina em write(); use collect() ou batches()")
+        execucao = self._execucao(store)
+        plano = self.optimized() if optimize else self
+        tabela_saida = self.sink.table
+        layout = parquet_layout.profile(tabela_saida)
+        with metrics.timer("transform_plan", table=tabela_saida) as medida, \
+                tempfile.TemporaryDirectory(prefix="transform_plan_", dir=external_sort.SPILL_DIR) as diretorio:
+            lotes = (lote.batch for lote in plano._lotes(execucao))
+            primeiro = next(lotes, None)
+            if primeiro is None:
+                logger.info(f"Plano de {tabela_saida} sem dados; nada gravado")
+                return None
+
+            esquema = primeiro.schema
+            lotes = (_conformar(batch, esquema) for batch in chain([primeiro], lotes))
+            chaves = clustering.present_keys(primeiro, layout.cluster_by, tabela_saida)
+            # Sem ordenação, o writer abre antes de contar os distintos: os Bloom filters ficam só com o fpp
+            contagens = {}
+            if chaves:
+                unicos: Dict[str, pa.Array] = {}
+                indexadas = [coluna for coluna in parquet_index.INDEX_COLUMNS if coluna in esquema.names]
+                lotes = _contando_distintos(lotes, indexadas, unicos)
+                if layout.cluster_method == "sort":
+                    lotes = external_sort.sort_batches(lotes, chaves, name=tabela_saida, output_rows=BATCH_ROWS)
+                else:
+                    # A curva Z usa os ranks da tabela inteira: só aqui o resultado é materializado
+                    lotes = clustering.cluster_batches(pa.Table.from_batches(list(lotes), schema=esquema), chaves,
+                                                       layout.cluster_method, name=tabela_saida)
+                # A ordenação lê a entrada inteira antes do primeiro lote: depois dele, as contagens estão completas
+                lotes = iter(lotes)
+                primeiro = next(lotes)
+                lotes = chain([primeiro], lotes)
+                contagens = {coluna: pc.count_distinct(valores).as_py() for coluna, valores in unicos.items()}
+
+            caminho = os.path.join(diretorio, "data.parquet")
+            opcoes = parquet_layout.writer_options(tabela_saida, esquema, layout, distinct_counts=contagens)
+            linhas = parquet_layout.write_batches(lotes, caminho, esquema, tabela_saida, layout, opcoes)
+            key = self.sink.key.format(now=execucao.now, partition=execucao.now.strftime("%Y%m%d"))
+            execucao.store.upload(self.sink.bucket, key, caminho)
+        metrics.count("rows_out", linhas, table=tabela_saida)
+        logger.info(f"Plano de {tabela_saida} executado em {medida.seconds:.2f} segundos: "
+                    f"{linhas} linhas em {self.sink.bucket}/{key}")
+        return Escrita(self.sink.bucket, key, linhas, esquema)
+
+
+def scan(bucket: str, prefixes: Union[str, Sequence[str]], latest_partition: bool = False, name: str = "") -> Plan:
+    """
+    Um plano que lê os arquivos Parquet sob `prefixes` (um ou mais), em ordem de
+    key; com `latest_partition`, só os da partição mais recente de cada prefixo
+    (`partition_discovery`). `name` é a dimensão da métrica rows_in.
+    """
+    return Plan(Scan(bucket, (prefixes,) if isinstance(prefixes, str) else tuple(prefixes), latest_partition, name))